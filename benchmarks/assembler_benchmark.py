@@ -0,0 +1,55 @@
+"""Measures the cost of each external command run by the assembler.
+
+Assembles the same program repeatedly, once assembling the stdlib for every
+compilation and once reusing the prebuilt stdlib object, and prints the mean
+time spent in `as` (stdlib), `as` (program) and `ld`.
+
+Usage:
+
+    poetry run python benchmarks/assembler_benchmark.py
+"""
+import time
+
+from compiler.assembler import assemble_and_get_executable, get_stdlib_object
+from compiler.assembly_generator import generate_assembly
+from compiler.ir_generator import generate_ir
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+
+SOURCE_CODE = """
+var i = 0;
+var s = 0;
+while i < 1000 do {
+    s = s + i * i;
+    i = i + 1;
+}
+s
+"""
+REPEATS = 20
+PHASES = ['as_stdlib', 'as_program', 'ld']
+
+
+def measure(assembly_code: str, reuse_stdlib: bool) -> dict[str, float]:
+    totals = {phase: 0.0 for phase in PHASES + ['total']}
+    for _ in range(REPEATS):
+        timings: dict[str, float] = {}
+        start = time.perf_counter()
+        assemble_and_get_executable(assembly_code, reuse_stdlib=reuse_stdlib, timings=timings)
+        totals['total'] += time.perf_counter() - start
+        for phase in PHASES:
+            totals[phase] += timings[phase]
+    return {phase: total / REPEATS for phase, total in totals.items()}
+
+
+def main() -> None:
+    assembly_code = generate_assembly(generate_ir(parse(tokenize(SOURCE_CODE))))
+    get_stdlib_object()  # Build the shared object up front, like a warm process would have
+
+    print(f'{"":<22}' + ''.join(f'{phase + " (ms)":>16}' for phase in PHASES + ['total']))
+    for name, reuse_stdlib in [('assemble stdlib', False), ('reuse stdlib object', True)]:
+        means = measure(assembly_code, reuse_stdlib)
+        print(f'{name:<22}' + ''.join(f'{means[phase] * 1000:>16.2f}' for phase in PHASES + ['total']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Measures how the dataflow analyses scale with program size.
+
+Generates programs of a sequence of `while` loops, each holding an `if`
+and reading variables declared before it, and times liveness, reaching
+definitions and the register allocator's live intervals on their IR.
+The time per IR instruction should stay roughly flat as the programs grow
+to tens of thousands of instructions.
+
+Usage:
+
+    poetry run python benchmarks/dataflow_benchmark.py
+"""
+import time
+
+from compiler import ir
+from compiler.cfg import build_cfg
+from compiler.dataflow import liveness, reaching_definitions
+from compiler.ir_generator import generate_ir
+from compiler.parser import parse
+from compiler.register_allocator import compute_live_intervals
+from compiler.tokenizer import tokenize
+
+REPEATS = 3
+
+
+def program(loops: int) -> str:
+    lines = ['var s = 0;']
+    for n in range(loops):
+        previous = f'x{n - 1}' if n > 0 else 's'
+        lines.append(f"""
+            var x{n} = {n};
+            var i{n} = 0;
+            while i{n} < 10 do {{
+                if i{n} % 2 == 0 then x{n} = x{n} + {previous} else s = s - x{n};
+                i{n} = i{n} + 1;
+            }};
+        """)
+    lines.append('s')
+    return '\n'.join(lines)
+
+
+def best_time(f: object, instructions: list[ir.Instruction]) -> float:
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        f(instructions)  # type: ignore[operator]
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    analyses = [
+        ('liveness', lambda instructions: liveness(build_cfg(instructions))),
+        ('reaching definitions', lambda instructions: reaching_definitions(build_cfg(instructions))),
+        ('live intervals', compute_live_intervals),
+    ]
+    print(f'{"instructions":>12} {"blocks":>7}  ' + '  '.join(f'{name:>22}' for name, _ in analyses))
+    for loops in [10, 100, 1000, 3000]:
+        instructions = generate_ir(parse(tokenize(program(loops))))
+        blocks = len(build_cfg(instructions).blocks)
+        cells = []
+        for _, analysis in analyses:
+            seconds = best_time(analysis, instructions)
+            cells.append(f'{seconds * 1000:8.1f} ms {seconds / len(instructions) * 1e6:6.2f} µs/insn')
+        print(f'{len(instructions):>12} {blocks:>7}  ' + '  '.join(cells))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Compares the tree-walking interpreter with the closure-compiled evaluator.
+
+Runs loop-heavy programs, and evaluates expressions many times, once with
+`interpret` and once by calling the closure from `compile_closure`.
+Both use the same variable frames from `resolve`. The closure is compiled
+once; its compile time is reported separately.
+
+Usage:
+
+    poetry run python benchmarks/interpreter_benchmark.py
+"""
+import sys
+import time
+from typing import Callable
+
+from compiler import ast
+from compiler.SymTab import SymTab
+from compiler.interpreter import compile_closure, interpret
+from compiler.parser import parse
+from compiler.resolver import new_frames, resolve
+from compiler.tokenizer import tokenize
+
+EVALUATIONS = 2000
+LOOP_ITERATIONS = 20000
+REPEATS = 3
+
+
+def arithmetic(n: int) -> str:
+    """`1 * 2 + 3 - 4 * 5 + ...` with n operands."""
+    ops = ['+', '*', '-', '*']
+    return " ".join(f"{i} {ops[i % 4]}" for i in range(1, n)) + f" {n}"
+
+
+def conditionals(n: int) -> str:
+    """A sum of n `if ... then ... else ...` expressions with `and`/`not` in the conditions."""
+    code = "0"
+    for i in range(n):
+        condition = f"{i} % 3 < 1 and not {i} == 7"
+        code = f"{code} + (if {condition} then {i} * 2 else 0 - {i})"
+    return code
+
+
+def sum_loop(n: int) -> str:
+    """A `while` loop with n iterations doing arithmetic on a few variables."""
+    return f"""
+        var i = 0;
+        var total = 0;
+        while i < {n} do {{
+            var square = i * i;
+            if square % 3 == 0 then total = total + square else total = total - i;
+            i = i + 1;
+        }};
+        total
+    """
+
+
+def nested_loops(n: int) -> str:
+    """Two nested `while` loops with n iterations in total."""
+    return f"""
+        var count = 0;
+        var i = 0;
+        while i < {n} / 100 do {{
+            var j = 0;
+            while j < 100 do {{
+                count = count + (i + j) % 2;
+                j = j + 1;
+            }};
+            i = i + 1;
+        }};
+        count
+    """
+
+
+def best_of(f: Callable[[], object]) -> float:
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        f()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmark(name: str, node: ast.Expression, evaluations: int = EVALUATIONS) -> None:
+    symtab = SymTab(parent=None)
+    frames = new_frames(resolve(node))
+
+    def tree_walking() -> None:
+        for _ in range(evaluations):
+            interpret(node, symtab, frames)
+
+    closure = compile_closure(node, symtab)
+
+    def closures() -> None:
+        for _ in range(evaluations):
+            closure()
+
+    assert interpret(node, symtab, frames) == closure()
+    compile_time = best_of(lambda: compile_closure(node, symtab))
+    interpret_time = best_of(tree_walking)
+    closure_time = best_of(closures)
+    print(f'{name:<20} {interpret_time * 1000:>14.1f} {closure_time * 1000:>12.1f} '
+          f'{compile_time * 1000:>12.2f} {interpret_time / closure_time:>8.1f}x')
+
+
+def main() -> None:
+    sys.setrecursionlimit(100_000)
+    print(f'{"program":<20} {"interpret (ms)":>14} {"closure (ms)":>12} {"compile (ms)":>12} {"speedup":>9}')
+    run_benchmark(f'sum loop {LOOP_ITERATIONS}', parse(tokenize(sum_loop(LOOP_ITERATIONS))), 1)
+    run_benchmark(f'nested loops {LOOP_ITERATIONS}', parse(tokenize(nested_loops(LOOP_ITERATIONS))), 1)
+    print(f'expressions, {EVALUATIONS} evaluations each:')
+    run_benchmark('arithmetic 100', parse(tokenize(arithmetic(100))))
+    run_benchmark('arithmetic 1000', parse(tokenize(arithmetic(1000))))
+    run_benchmark('conditionals 50', parse(tokenize(conditionals(50))))
+    run_benchmark('conditionals 500', parse(tokenize(conditionals(500))))
+
+
+if __name__ == '__main__':
+    main()
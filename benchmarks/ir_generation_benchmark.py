@@ -0,0 +1,73 @@
+"""Measures front-end compile time against program size.
+
+Generates deeply nested `BinaryOp` chains and `Block` trees and times
+type checking plus IR generation for each size. Since `generate_ir` reuses
+the types stored by `typecheck`, the time per node should stay roughly
+constant as the programs grow.
+
+Usage:
+
+    poetry run python benchmarks/ir_generation_benchmark.py
+"""
+import sys
+import threading
+import time
+from typing import Callable
+
+from compiler.SymTab import SymTab
+from compiler.ir_generator import generate_ir
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+from compiler.type_checker import typecheck
+
+SIZES = [250, 500, 1000, 2000, 4000]
+REPEATS = 3
+
+
+def binary_op_chain(n: int) -> str:
+    """`1 + 2 + ... + n`, a left-deep tree of depth n."""
+    return " + ".join(str(i) for i in range(1, n + 1))
+
+
+def nested_blocks(n: int) -> str:
+    """`{ 1 + { 1 + { ... } } }`, a block tree of depth n."""
+    return "{ 1 + " * n + "1" + " }" * n
+
+
+def measure(source_code: str) -> float:
+    best = float('inf')
+    for _ in range(REPEATS):
+        ast_root = parse(tokenize(source_code))
+        start = time.perf_counter()
+        typecheck(ast_root, SymTab(parent=None))
+        generate_ir(ast_root, typechecked=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run() -> None:
+    shapes: list[tuple[str, Callable[[int], str]]] = [
+        ('BinaryOp chain', binary_op_chain),
+        ('nested Block', nested_blocks),
+    ]
+    for name, make_program in shapes:
+        print(f'{name}:')
+        print(f'{"nodes":>8} {"time (ms)":>12} {"us/node":>10}')
+        for n in SIZES:
+            source_code = make_program(n)
+            elapsed = measure(source_code)
+            print(f'{n:>8} {elapsed * 1000:>12.2f} {elapsed / n * 1e6:>10.2f}')
+        print()
+
+
+def main() -> None:
+    # The parser and the passes are recursive, so deep trees need a big stack.
+    sys.setrecursionlimit(1_000_000)
+    threading.stack_size(512 * 1024 * 1024)
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+
+
+if __name__ == '__main__':
+    main()
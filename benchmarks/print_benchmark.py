@@ -0,0 +1,59 @@
+"""Compares unbuffered and buffered output in the stdlib's `print_int`.
+
+Compiles a program printing 10^6 integers with each output mode, runs it
+with stdout redirected to a file and to a pipe, and prints the best wall
+time of a few runs.
+
+Usage:
+
+    poetry run python benchmarks/print_benchmark.py
+"""
+import os
+import subprocess
+import tempfile
+import time
+
+from compiler.assembler import assemble
+from compiler.assembly_generator import generate_assembly
+from compiler.ir_generator import generate_ir
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+
+SOURCE_CODE = """
+var i = 0;
+while i < 1000000 do {
+    print_int(i * 7919 - 500000);
+    i = i + 1;
+}
+"""
+REPEATS = 3
+
+
+def best_time(executable: str, to_pipe: bool) -> float:
+    best = float('inf')
+    for _ in range(REPEATS):
+        with tempfile.TemporaryFile() as out:
+            start = time.perf_counter()
+            if to_pipe:
+                subprocess.run([executable], stdout=subprocess.PIPE, check=True)
+            else:
+                subprocess.run([executable], stdout=out, check=True)
+            best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    assembly_code = generate_assembly(generate_ir(parse(tokenize(SOURCE_CODE))))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        print(f'{"":<14}{"file (s)":>12}{"pipe (s)":>12}')
+        for name, buffered_output in [('unbuffered', False), ('buffered', True)]:
+            executable = os.path.join(tmpdir, name)
+            assemble(assembly_code, executable, buffered_output=buffered_output)
+            file_time = best_time(executable, to_pipe=False)
+            pipe_time = best_time(executable, to_pipe=True)
+            print(f'{name:<14}{file_time:>12.3f}{pipe_time:>12.3f}')
+
+
+if __name__ == '__main__':
+    main()
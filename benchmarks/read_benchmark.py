@@ -0,0 +1,67 @@
+"""Measures how fast the stdlib's `read_int` reads input.
+
+Compiles a program summing 10^6 integers read with `read_int`, feeds it the
+numbers from a file and through a pipe, and prints the best wall time of a
+few runs.
+
+Usage:
+
+    poetry run python benchmarks/read_benchmark.py
+"""
+import os
+import subprocess
+import tempfile
+import time
+
+from compiler.assembler import assemble
+from compiler.assembly_generator import generate_assembly
+from compiler.ir_generator import generate_ir
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+
+COUNT = 1000000
+SOURCE_CODE = f"""
+var s = 0;
+var i = 0;
+while i < {COUNT} do {{
+    s = s + read_int();
+    i = i + 1;
+}}
+s
+"""
+REPEATS = 3
+
+
+def best_time(executable: str, input_file: str, to_pipe: bool) -> float:
+    best = float('inf')
+    for _ in range(REPEATS):
+        with open(input_file, 'rb') as f:
+            if to_pipe:
+                data = f.read()
+                start = time.perf_counter()
+                subprocess.run([executable], input=data, stdout=subprocess.DEVNULL, check=True)
+            else:
+                start = time.perf_counter()
+                subprocess.run([executable], stdin=f, stdout=subprocess.DEVNULL, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    assembly_code = generate_assembly(generate_ir(parse(tokenize(SOURCE_CODE))))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_file = os.path.join(tmpdir, 'input')
+        with open(input_file, 'w') as f:
+            f.write(''.join(f'{i * 7919 % 1000003 - 500000}\n' for i in range(COUNT)))
+        executable = os.path.join(tmpdir, 'program')
+        assemble(assembly_code, executable)
+
+        size_mb = os.path.getsize(input_file) / 1e6
+        for name, to_pipe in [('file', False), ('pipe', True)]:
+            seconds = best_time(executable, input_file, to_pipe)
+            print(f'{name:<6}{seconds:>8.3f} s {size_mb / seconds:>8.1f} MB/s')
+
+
+if __name__ == '__main__':
+    main()
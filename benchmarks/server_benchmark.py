@@ -0,0 +1,123 @@
+"""Measures compile server throughput under concurrent load.
+
+Starts `compiler serve` as a subprocess in each mode (a fork per
+connection, a pool of pre-started workers, and the NDJSON server with
+persistent connections), sends it compile requests from several client
+threads at once, and prints the requests per second. NDJSON clients send
+all their requests on one connection without waiting for responses.
+
+Usage:
+
+    poetry run python benchmarks/server_benchmark.py
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Any
+
+SOURCE_CODE = """
+var i = 0;
+var s = 0;
+while i < 100 do {
+    if i % 3 == 0 then s = s + i else s = s - 1;
+    i = i + 1;
+}
+s
+"""
+CLIENTS = 8
+REQUESTS_PER_CLIENT = 10
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port: int = sock.getsockname()[1]
+        return port
+
+
+def send_request(port: int, request: dict[str, Any]) -> dict[str, Any]:
+    with socket.create_connection(('127.0.0.1', port)) as sock:
+        sock.sendall(json.dumps(request).encode())
+        sock.shutdown(socket.SHUT_WR)
+        response = b''
+        while chunk := sock.recv(65536):
+            response += chunk
+    result: dict[str, Any] = json.loads(response)
+    return result
+
+
+def wait_until_up(port: int, ndjson: bool) -> None:
+    for _ in range(300):
+        try:
+            if ndjson:
+                socket.create_connection(('127.0.0.1', port)).close()
+            else:
+                send_request(port, {"command": "ping"})
+            return
+        except ConnectionRefusedError:
+            time.sleep(0.1)
+    raise Exception("Server did not start")
+
+
+def ndjson_client(port: int) -> list[str]:
+    errors = []
+    with socket.create_connection(('127.0.0.1', port)) as sock:
+        request = json.dumps({"command": "compile", "code": SOURCE_CODE}).encode() + b'\n'
+        sock.sendall(request * REQUESTS_PER_CLIENT)
+        responses = sock.makefile('rb')
+        for _ in range(REQUESTS_PER_CLIENT):
+            result = json.loads(responses.readline())
+            if "program" not in result:
+                errors.append(result.get("error", ""))
+    return errors
+
+
+def measure(server_args: list[str]) -> float:
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'compiler', 'serve', f'--port={port}', *server_args],
+        stdout=subprocess.DEVNULL)
+    try:
+        wait_until_up(port, ndjson='--ndjson' in server_args)
+        errors: list[str] = []
+
+        def client() -> None:
+            if '--ndjson' in server_args:
+                errors.extend(ndjson_client(port))
+                return
+            for _ in range(REQUESTS_PER_CLIENT):
+                result = send_request(port, {"command": "compile", "code": SOURCE_CODE})
+                if "program" not in result:
+                    errors.append(result.get("error", ""))
+
+        threads = [threading.Thread(target=client) for _ in range(CLIENTS)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        if errors:
+            raise Exception(f"{len(errors)} requests failed, e.g.: {errors[0]}")
+        return CLIENTS * REQUESTS_PER_CLIENT / elapsed
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main() -> None:
+    cores = os.cpu_count() or 1
+    modes: list[tuple[str, list[str]]] = [('fork per connection', [])] + [
+        (f'{n} workers', [f'--workers={n}', f'--queue-size={CLIENTS}']) for n in sorted({1, cores // 2 or 1, cores})
+    ] + [(f'ndjson, {cores} workers', ['--ndjson', f'--workers={cores}'])]
+    print(f'{"":<22}{"requests/s":>12}')
+    for name, args in modes:
+        print(f'{name:<22}{measure(args):>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
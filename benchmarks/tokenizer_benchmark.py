@@ -0,0 +1,57 @@
+"""Measures tokenizer throughput in MB/s.
+
+Tokenizes generated programs of a few megabytes, both into a list with
+`tokenize` and by draining the `iter_tokens` generator, and prints the
+best throughput of a few runs. Token locations are not read, so their
+lazy computation is not included.
+
+Usage:
+
+    poetry run python benchmarks/tokenizer_benchmark.py
+"""
+import time
+from collections import deque
+from typing import Callable
+
+from compiler.tokenizer import iter_tokens, tokenize
+
+SIZES_MB = [1, 4, 16]
+REPEATS = 3
+
+STATEMENT = """var x{i} = {i} * (y + 17) - z % 3; // update x{i}
+if x{i} >= 1000 and not done then {{ print_int(x{i}); done = true; }}
+"""
+
+
+def generate_source(size_mb: int) -> str:
+    parts = []
+    size = 0
+    i = 0
+    while size < size_mb * 1_000_000:
+        part = STATEMENT.format(i=i)
+        parts.append(part)
+        size += len(part)
+        i += 1
+    return ''.join(parts)
+
+
+def best_mb_per_second(source_code: str, run: Callable[[str], object]) -> float:
+    best = float('inf')
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        run(source_code)
+        best = min(best, time.perf_counter() - start)
+    return len(source_code) / 1_000_000 / best
+
+
+def main() -> None:
+    print(f'{"size (MB)":>10}{"tokenize (MB/s)":>18}{"iter_tokens (MB/s)":>21}')
+    for size_mb in SIZES_MB:
+        source_code = generate_source(size_mb)
+        list_speed = best_mb_per_second(source_code, tokenize)
+        stream_speed = best_mb_per_second(source_code, lambda s: deque(iter_tokens(s), maxlen=0))
+        print(f'{size_mb:>10}{list_speed:>18.2f}{stream_speed:>21.2f}')
+
+
+if __name__ == '__main__':
+    main()
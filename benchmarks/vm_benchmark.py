@@ -0,0 +1,68 @@
+"""Compares the end-to-end latency of the bytecode VM with native compilation.
+
+For programs running from a few to a few million IR instructions, measures
+the time from source code to finished output: compiling to bytecode and
+running it in the VM, versus compiling to an executable (with GNU `as`/`ld`
+and with the builtin assembler) and running that. The VM wins on short
+programs; native code wins once the program runs long enough to repay the
+assembler.
+
+Usage:
+
+    poetry run python benchmarks/vm_benchmark.py
+"""
+import time
+from typing import Callable
+
+from compiler.__main__ import call_bytecode_compiler, call_compiler
+from compiler.sandbox import run_executable
+from compiler.vm import run_bytecode
+
+REPEATS = 5
+
+
+def loop(n: int) -> str:
+    return f"""
+        var i = 0;
+        var s = 0;
+        while i < {n} do {{
+            if i % 3 == 0 then s = s + i else s = s - 1;
+            i = i + 1;
+        }};
+        s
+    """
+
+
+PROGRAMS = [
+    ('print_int(1 + 2)', 'print_int(1 + 2)'),
+    ('loop 100', loop(100)),
+    ('loop 10000', loop(10_000)),
+    ('loop 1000000', loop(1_000_000)),
+]
+
+
+def best_of(f: Callable[[], bytes]) -> tuple[float, bytes]:
+    best = float('inf')
+    output = b''
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        output = f()
+        best = min(best, time.perf_counter() - start)
+    return best, output
+
+
+def main() -> None:
+    print(f'{"program":<18} {"vm (ms)":>10} {"native gnu (ms)":>16} {"native builtin (ms)":>20}')
+    for name, source_code in PROGRAMS:
+        vm_time, vm_output = best_of(lambda: run_bytecode(call_bytecode_compiler(source_code)).stdout)
+        native_times = []
+        for assembler in ['gnu', 'builtin']:
+            native_time, native_output = best_of(
+                lambda: run_executable(call_compiler(source_code, name, assembler=assembler)).stdout)
+            assert native_output == vm_output
+            native_times.append(native_time)
+        print(f'{name:<18} {vm_time * 1000:>10.2f} {native_times[0] * 1000:>16.2f} {native_times[1] * 1000:>20.2f}')
+
+
+if __name__ == '__main__':
+    main()
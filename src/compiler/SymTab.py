@@ -1,5 +1,5 @@
 from typing import Generic, TypeVar, Dict, Any, List, Optional
-from compiler import types, ast
+from compiler import trace, types, ast
 from compiler.types import Int, Bool, FunctionType, Unit, Type
 from compiler.ir import Call, LoadIntConst, IRvar, Label, Jump, Copy, CondJump, LoadBoolConst
 
@@ -11,6 +11,9 @@ class SymTab():
         self.locals: List[Dict[str, tuple[Any, Type]]] = [{}]
         self.parent = parent
         self.symbols: Dict[str, tuple[Any, Type]] = {}
+        # For each name, the indices of the scopes in `locals` that define it
+        # (innermost last), so lookups don't have to walk every scope.
+        self._defining_scopes: Dict[str, List[int]] = {}
 
         if parent is None:  # 只在顶级作用域添加内置符号
             add_builtin_symbols(self)
@@ -19,44 +22,55 @@ class SymTab():
         self.locals.append({})
 
     def leave_locals(self) -> None:
-        self.locals.pop()
+        for name in self.locals.pop():
+            scopes = self._defining_scopes[name]
+            scopes.pop()
+            if not scopes:
+                del self._defining_scopes[name]
+
+    def _innermost_local(self, name: str) -> Optional[Dict[str, tuple[Any, Type]]]:
+        scopes = self._defining_scopes.get(name)
+        if scopes:
+            return self.locals[scopes[-1]]
+        return None
     
     def lookup_variable(self, name: str, flag: bool = False) -> T | Any:
         #print(self.locals)
-        for local in reversed(self.locals):
-            if name in local:
-                entry = local[name]
-                if isinstance(entry, tuple):
-                    value, var_type = entry
-                    print(entry)
-                else:
-                    value = entry
-                    var_type = None
-                    #(local[name], None)
-                
-                if flag:
-                    return (value, var_type)
-                else:
-                    return value
-
-
-                # value, var_type = local[name] if isinstance(local[name], tuple) else (local[name], None)
-                # return (value, var_type) if flag else value
+        local = self._innermost_local(name)
+        if local is not None:
+            entry = local[name]
+            if isinstance(entry, tuple):
+                value, var_type = entry
+                if trace.symtab.debug_enabled:
+                    trace.symtab.debug('%s -> %s', name, entry)
+            else:
+                value = entry
+                var_type = None
+                #(local[name], None)
             
-                #return (value, None) if flag else value
+            if flag:
+                return (value, var_type)
+            else:
+                return value
+
+
+            # value, var_type = local[name] if isinstance(local[name], tuple) else (local[name], None)
+            # return (value, var_type) if flag else value
+            
+            #return (value, None) if flag else value
 
             #if isinstance(var_type, list):
             #    return var_type  # 返回所有可用类型
             #return var_type
         
-                # = local[name]
-                #if str(type(value)) == "<class 'tuple'>":
-                #    if flag:
-                #        return local[name]
-                #    else:
-                #        return local[name][0]
-                #else:
-                #    return local[name]
+            # = local[name]
+            #if str(type(value)) == "<class 'tuple'>":
+            #    if flag:
+            #        return local[name]
+            #    else:
+            #        return local[name][0]
+            #else:
+            #    return local[name]
         
         if self.parent:
             return self.parent.lookup_variable(name, flag)
@@ -64,24 +78,25 @@ class SymTab():
         raise KeyError(f"Variable '{name}' not found.")
     
     def define_variable(self, name: str, value: Any, var_type: Any) -> None:
-
+        if name not in self.locals[-1]:
+            self._defining_scopes.setdefault(name, []).append(len(self.locals) - 1)
         self.locals[-1][name] = (value, var_type)
 
     def update_variable(self, name: str, value: Any) -> None:
         # Update the value of a variable in an existing scope if the variable exists
-        for local in reversed(self.locals):
-            if name in local:
-                #local[name] = value
-                _, var_type = local[name]  # 保留原始类型
-                local[name] = (value, var_type)
-                return
+        local = self._innermost_local(name)
+        if local is not None:
+            #local[name] = value
+            _, var_type = local[name]  # 保留原始类型
+            local[name] = (value, var_type)
+            return
         raise KeyError(f"Variable '{name}' not defined.")
     
     def lookup_variable_type(self, name: str) -> Type:
-        for local in reversed(self.locals):
-            if name in local:
-                _, var_type = local[name]
-                return var_type
+        local = self._innermost_local(name)
+        if local is not None:
+            _, var_type = local[name]
+            return var_type
         raise KeyError(f"Type for variable '{name}' not found.")
     
 
@@ -2,51 +2,172 @@ from base64 import b64encode
 import json
 import re
 import sys
-from socketserver import ForkingTCPServer, StreamRequestHandler
+import asyncio
+import collections
+import dataclasses
+import time
+import multiprocessing
+import signal
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from socketserver import ForkingTCPServer, StreamRequestHandler, ThreadingTCPServer
 from traceback import format_exception
-from typing import Any
+from typing import Any, Callable
 import tempfile
 import subprocess
 import os
 from pathlib import Path
 from compiler.assembler import assemble, assemble_and_get_executable
-from compiler.tokenizer import tokenize
+from compiler.tokenizer import iter_tokens, tokenize
 from compiler.parser import parse
 from compiler.ir_generator import generate_ir
 from compiler.assembly_generator import generate_assembly
 from compiler.type_checker import typecheck
 from compiler.SymTab import SymTab, add_builtin_symbols
+from compiler.compile_cache import CompileCache
+from compiler import trace
+from compiler.profiler import Profile, count_ast_nodes
+from compiler.sandbox import RunLimits, run_executable
+from compiler import vm
+from compiler.optimizer import optimize as optimize_ir
+from compiler.peephole import optimize_assembly
 
-def call_compiler(source_code: str, input_file_name: str) -> bytes:
+def call_compiler(
+    source_code: str,
+    input_file_name: str,
+    cache: CompileCache | None = None,
+    assembler: str = 'gnu',
+    buffered_output: bool = False,
+    profile: Profile | None = None,
+    optimize: bool = False,
+) -> bytes:
     # *** TODO ***
     # Call your compiler here and return the compiled executable.
     # Raise an exception on compilation error.
     # *** TODO ***
-    
-    tokens = tokenize(source_code)
-    ast_nodes = parse(tokens)
+
+    measure = profile is not None
+    if profile is None:
+        # Timing the phases is cheap enough to always do; the result is just dropped
+        profile = Profile(track_memory=False)
+
+    if cache is not None:
+        with profile.phase('cache_lookup') as record:
+            key = cache.key(
+                source_code, flags=f'assembler={assembler} buffered_output={buffered_output} optimize={optimize}')
+            cached = cache.get(key)
+            record['hit'] = cached is not None
+        if cached is not None:
+            return cached
+
+    if measure:
+        # Tokenize up front so the tokenizer is measured separately from the parser
+        with profile.phase('tokenize') as record:
+            tokens = tokenize(source_code)
+            record['tokens'] = len(tokens)
+    with profile.phase('parse') as record:
+        ast_nodes = parse(tokens if measure else iter_tokens(source_code))
+        if ast_nodes is None:
+            raise Exception("Parsing failed")
+        if measure:
+            record['ast_nodes'] = count_ast_nodes(ast_nodes)
+    with profile.phase('typecheck'):
+        symtab = SymTab(parent=None)
+        add_builtin_symbols(symtab) 
+        typecheck(ast_nodes, symtab=symtab)
+    with profile.phase('generate_ir') as record:
+        ir_code = generate_ir(ast_nodes, typechecked=True)
+        record['ir_instructions'] = len(ir_code)
+    if optimize:
+        with profile.phase('optimize') as record:
+            ir_code = optimize_ir(ir_code)
+            record['ir_instructions'] = len(ir_code)
+
+    with profile.phase('generate_assembly') as record:
+        assembly_code = generate_assembly(ir_code)
+        record['asm_lines'] = assembly_code.count('\n')
+    if optimize:
+        with profile.phase('peephole') as record:
+            hits: collections.Counter[str] = collections.Counter()
+            assembly_code = optimize_assembly(assembly_code, hits)
+            record['asm_lines'] = assembly_code.count('\n')
+            record['hits'] = dict(hits)
+
+    with profile.phase('assemble') as record:
+        timings: dict[str, float] = {}
+        executable = assemble_and_get_executable(
+            assembly_code, backend=assembler, buffered_output=buffered_output, timings=timings)
+        record['steps'] = timings
+        record['executable_bytes'] = len(executable)
+    if cache is not None:
+        with profile.phase('cache_store'):
+            cache.put(key, executable, assembly_code)
+    return executable
+
+
+def call_bytecode_compiler(source_code: str, optimize: bool = False) -> vm.Bytecode:
+    """Compiles the source code into bytecode for `vm.execute`."""
+    ast_nodes = parse(iter_tokens(source_code))
     if ast_nodes is None:
         raise Exception("Parsing failed")
-    symtab = SymTab(parent=None)
-    add_builtin_symbols(symtab) 
     typecheck(ast_nodes, symtab=SymTab(parent=None))
-    ir_code = generate_ir(ast_nodes)
-
-    assembly_code = generate_assembly(ir_code)
-
-    return assemble_and_get_executable(assembly_code)
+    ir_code = generate_ir(ast_nodes, typechecked=True)
+    if optimize:
+        ir_code = optimize_ir(ir_code)
+    return vm.generate_bytecode(ir_code)
     
 
 def main() -> int:
     # === Option parsing ===
     command: str | None = None
-    input_file: str | None = None
+    input_files: list[str] = []
     output_file: str | None = None
+    output_dir: str | None = None
     host = "127.0.0.1"
     port = 3000
+    cache_dir: str | None = None
+    cache_size_mb = 256
+    assembler = 'gnu'
+    buffered_output = False
+    optimize = False
+    profile: Profile | None = None
+    workers: int | None = None
+    queue_size: int | None = None
+    ndjson = False
+    run_limits = RunLimits()
     for arg in sys.argv[1:]:
         if (m := re.fullmatch(r'--output=(.+)', arg)) is not None:
             output_file = m[1]
+        elif (m := re.fullmatch(r'--output-dir=(.+)', arg)) is not None:
+            output_dir = m[1]
+        elif (m := re.fullmatch(r'--cache-dir=(.+)', arg)) is not None:
+            cache_dir = m[1]
+        elif (m := re.fullmatch(r'--cache-size=(\d+)', arg)) is not None:
+            cache_size_mb = int(m[1])
+        elif (m := re.fullmatch(r'--assembler=(gnu|builtin)', arg)) is not None:
+            assembler = m[1]
+        elif arg == '--buffered-output':
+            buffered_output = True
+        elif arg == '-O':
+            optimize = True
+        elif arg == '--profile':
+            profile = Profile()
+        elif (m := re.fullmatch(r'--trace=(.+)', arg)) is not None:
+            trace.enable_from_spec(m[1])
+        elif (m := re.fullmatch(r'--workers=(\d+)', arg)) is not None:
+            workers = int(m[1])
+        elif (m := re.fullmatch(r'--queue-size=(\d+)', arg)) is not None:
+            queue_size = int(m[1])
+        elif (m := re.fullmatch(r'--cpu-limit=(\d+(?:\.\d+)?)', arg)) is not None:
+            run_limits.cpu_seconds = float(m[1])
+            run_limits.wall_seconds = 2 * run_limits.cpu_seconds
+        elif (m := re.fullmatch(r'--memory-limit=(\d+)', arg)) is not None:
+            run_limits.memory_bytes = int(m[1]) * 1024 * 1024
+        elif (m := re.fullmatch(r'--output-limit=(\d+)', arg)) is not None:
+            run_limits.output_bytes = int(m[1]) * 1024 * 1024
+        elif arg == '--ndjson':
+            ndjson = True
         elif (m := re.fullmatch(r'--host=(.+)', arg)) is not None:
             host = m[1]
         elif (m := re.fullmatch(r'--port=(.+)', arg)) is not None:
@@ -55,14 +176,15 @@ def main() -> int:
             raise Exception(f"Unknown argument: {arg}")
         elif command is None:
             command = arg
-        elif input_file is None:
-            input_file = arg
         else:
-            raise Exception("Multiple input files not supported")
+            input_files.append(arg)
 
     if command is None:
         print(f"Error: command argument missing", file=sys.stderr)
         return 1
+    if len(input_files) > 1 and command != 'compile-batch':
+        raise Exception("Multiple input files not supported")
+    input_file = input_files[0] if input_files else None
 
     def read_source_code() -> str:
         if input_file is not None:
@@ -71,47 +193,271 @@ def main() -> int:
         else:
             return sys.stdin.read()
 
+    cache: CompileCache | None = None
+    if cache_dir is not None:
+        cache = CompileCache(cache_dir, max_bytes=cache_size_mb * 1024 * 1024)
+
     # === Command implementations ===
 
     if command == 'compile':
         source_code = read_source_code()
         if output_file is None:
             raise Exception("Output file flag --output=... required")
-        executable = call_compiler(source_code, input_file or '(source code)')
+        executable = call_compiler(
+            source_code, input_file or '(source code)', cache, assembler, buffered_output, profile, optimize)
         with open(output_file, 'wb') as f:
             f.write(executable)
+        if profile is not None:
+            print(json.dumps(profile.to_json()))
+    elif command == 'run':
+        if input_file is None:
+            raise Exception("The program to run must be given as a file; stdin is its input")
+        executable = call_compiler(
+            read_source_code(), input_file, cache, assembler, buffered_output, profile, optimize)
+        run_result = run_executable(executable, sys.stdin.buffer.read(), run_limits)
+        sys.stdout.buffer.write(run_result.stdout)
+        sys.stdout.flush()
+        if run_result.limit_exceeded is not None:
+            print(f"Error: program exceeded the {run_result.limit_exceeded} limit", file=sys.stderr)
+        if profile is not None:
+            print(json.dumps({'compile': profile.to_json(), 'run': run_result.to_json()['timing']}), file=sys.stderr)
+        # Like a shell, report death by a signal as 128 + the signal number
+        return run_result.exit_code if run_result.exit_code >= 0 else 128 - run_result.exit_code
+    elif command == 'run-vm':
+        if input_file is None:
+            raise Exception("The program to run must be given as a file; stdin is its input")
+        bytecode = call_bytecode_compiler(read_source_code(), optimize)
+        try:
+            vm.execute(bytecode, sys.stdin, sys.stdout)
+        except vm.ProgramExit as e:
+            print(e, file=sys.stderr)
+            return e.exit_code
+        except vm.Trap as e:
+            sys.stdout.flush()
+            print(e, file=sys.stderr)
+            return 128 + e.signum
+    elif command == 'compile-batch':
+        if output_dir is None:
+            raise Exception("Output directory flag --output-dir=... required")
+        failures = compile_batch(input_files, output_dir, workers, cache, assembler, buffered_output, optimize)
+        return 1 if failures > 0 else 0
     elif command == 'serve':
         try:
-            run_server(host, port)
+            run_server(host, port, cache, assembler, buffered_output, workers, queue_size, ndjson, optimize)
         except KeyboardInterrupt:
             pass
+    elif command == 'cache-stats':
+        if cache is None:
+            raise Exception("Cache directory flag --cache-dir=... required")
+        print(json.dumps(cache.stats()))
     else:
         print(f"Error: unknown command: {command}", file=sys.stderr)
         return 1
     return 0
 
 
-def run_server(host: str, port: int) -> None:
+@dataclasses.dataclass
+class BatchItem:
+    """One program to compile in `compile_batch`."""
+    name: str
+    output_file: str
+    source_file: str | None = None
+    source_code: str | None = None
+
+
+def batch_items(inputs: list[str], output_dir: str) -> list[BatchItem]:
+    """Lists the programs to compile given input files, directories and manifests.
+
+    Every file under a directory is compiled, except hidden ones (starting
+    with a `.`, or in a hidden directory) and editor backups ending in `~`.
+    The executable gets the same relative path under `output_dir`, without
+    the file extension.
+    A `.jsonl` manifest has one JSON object per line, with either a
+    `"file"` path (relative to the manifest) or a `"name"` and `"code"`,
+    and optionally an `"output"` path relative to `output_dir`.
+    """
+    items: list[BatchItem] = []
+
+    def add_file(path: Path, name: str, output: str | None = None) -> None:
+        output_path = Path(output_dir) / (output or Path(name).with_suffix('').as_posix())
+        items.append(BatchItem(name, str(output_path), source_file=str(path)))
+
+    for input in inputs:
+        path = Path(input)
+        if path.is_dir():
+            for file in sorted(p for p in path.rglob('*') if p.is_file()):
+                relative = file.relative_to(path)
+                if any(part.startswith('.') for part in relative.parts) or file.name.endswith('~'):
+                    continue
+                add_file(file, relative.as_posix())
+        elif path.suffix == '.jsonl':
+            with open(path) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    if "file" in entry:
+                        add_file(path.parent / entry["file"], entry.get("name", entry["file"]), entry.get("output"))
+                    else:
+                        output = entry.get("output", entry["name"])
+                        items.append(BatchItem(entry["name"], str(Path(output_dir) / output), source_code=entry["code"]))
+        else:
+            add_file(path, path.name)
+    return items
+
+
+def _compile_batch_item(item: BatchItem) -> tuple[str | None, float]:
+    """Compiles a batch item in a worker process and returns the error, if any, and the time taken."""
+    start = time.perf_counter()
+    try:
+        if item.source_code is not None:
+            source_code = item.source_code
+        else:
+            assert item.source_file is not None
+            with open(item.source_file) as f:
+                source_code = f.read()
+        executable = call_compiler(source_code, item.name, **_worker_options)
+        os.makedirs(os.path.dirname(item.output_file) or '.', exist_ok=True)
+        with open(item.output_file, 'wb') as f:
+            f.write(executable)
+        os.chmod(item.output_file, 0o755)
+        error = None
+    except Exception as e:
+        error = "".join(format_exception(e))
+    return error, time.perf_counter() - start
+
+
+def compile_batch(
+    inputs: list[str],
+    output_dir: str,
+    workers: int | None = None,
+    cache: CompileCache | None = None,
+    assembler: str = 'gnu',
+    buffered_output: bool = False,
+    optimize: bool = False,
+) -> int:
+    """Compiles many programs with a pool of worker processes and returns the number of failures.
+
+    See `batch_items` for the accepted inputs. A line is printed for every
+    program as it finishes, followed by a summary with the throughput.
+    The workers share the cache and the prebuilt stdlib.
+    """
+    items = batch_items(inputs, output_dir)
+    options = {'cache': cache, 'assembler': assembler, 'buffered_output': buffered_output, 'optimize': optimize}
+    start = time.perf_counter()
+    failures = 0
+    # Programs with the same output path would overwrite each other, so none of them is compiled
+    by_output: dict[str, list[BatchItem]] = collections.defaultdict(list)
+    for item in items:
+        by_output[os.path.normpath(item.output_file)].append(item)
+    to_compile = []
+    for item in items:
+        same_output = by_output[os.path.normpath(item.output_file)]
+        if len(same_output) == 1:
+            to_compile.append(item)
+            continue
+        failures += 1
+        others = ', '.join(other.name for other in same_output if other is not item)
+        print(f"ERROR {item.name}: output {item.output_file} is also the output of {others}")
+    pool = start_worker_pool(workers or os.cpu_count() or 1, options)
+    with pool:
+        futures = {pool.submit(_compile_batch_item, item): item for item in to_compile}
+        for future in as_completed(futures):
+            item = futures[future]
+            error, seconds = future.result()
+            if error is None:
+                print(f"OK    {item.name} -> {item.output_file} ({seconds * 1000:.1f} ms)")
+            else:
+                failures += 1
+                message = error.strip().splitlines()[-1]
+                print(f"ERROR {item.name}: {message}")
+    elapsed = time.perf_counter() - start
+    print(f"Compiled {len(items) - failures} of {len(items)} programs in {elapsed:.2f} s "
+          f"({len(items) / elapsed:.1f} files/s)")
+    return failures
+
+
+def handle_request(
+    input: dict[str, Any],
+    cache: CompileCache | None = None,
+    assembler: str = 'gnu',
+    buffered_output: bool = False,
+    optimize: bool = False,
+) -> dict[str, Any]:
+    """Executes one server command and returns the JSON response."""
+    result: dict[str, Any] = {}
+    try:
+        if input["command"] == "compile":
+            source_code = input["code"]
+            profile = Profile() if input.get("profile") else None
+            executable = call_compiler(
+                source_code, "(source code)", cache, assembler, buffered_output, profile, optimize)
+            result["program"] = b64encode(executable).decode()
+            if profile is not None:
+                result["profile"] = profile.to_json()
+        elif input["command"] == "run":
+            compile_start = time.perf_counter()
+            executable = call_compiler(
+                input["code"], "(source code)", cache, assembler, buffered_output, optimize=optimize)
+            compile_seconds = time.perf_counter() - compile_start
+            limits = RunLimits().restricted(input.get("limits", {}))
+            result.update(run_executable(executable, input.get("input", "").encode(), limits).to_json())
+            result["timing"]["compile_seconds"] = compile_seconds
+        elif input["command"] == "run_vm":
+            compile_start = time.perf_counter()
+            bytecode = call_bytecode_compiler(input["code"], optimize)
+            compile_seconds = time.perf_counter() - compile_start
+            limits = RunLimits().restricted(input.get("limits", {}))
+            result.update(vm.run_bytecode(bytecode, input.get("input", "").encode(), limits).to_json())
+            result["timing"]["compile_seconds"] = compile_seconds
+        elif input["command"] == "ping":
+            pass
+        elif input["command"] == "cache_stats":
+            result["cache"] = cache.stats() if cache is not None else None
+        else:
+            result["error"] = "Unknown command: " + input['command']
+    except Exception as e:
+        result["error"] = "".join(format_exception(e))
+    return result
+
+
+def run_server(
+    host: str,
+    port: int,
+    cache: CompileCache | None = None,
+    assembler: str = 'gnu',
+    buffered_output: bool = False,
+    workers: int | None = None,
+    queue_size: int | None = None,
+    ndjson: bool = False,
+    optimize: bool = False,
+) -> None:
+    """Serves compile requests, one JSON request per connection.
+
+    By default a child process is forked for every connection.
+    With `workers`, requests are instead run by a fixed pool of worker
+    processes started up front; see `PoolServer`.
+    With `ndjson`, connections instead carry any number of newline-delimited
+    requests; see `NdjsonServer`.
+    """
+    if ndjson:
+        run_ndjson_server(host, port, workers, cache, assembler, buffered_output, optimize)
+        return
+    if workers is not None:
+        run_pool_server(host, port, workers, queue_size, cache, assembler, buffered_output, optimize)
+        return
+
     class Server(ForkingTCPServer):
         allow_reuse_address = True
         request_queue_size = 32
 
     class Handler(StreamRequestHandler):
         def handle(self) -> None:
-            result: dict[str, Any] = {}
             try:
                 input_str = self.rfile.read().decode()
-                input = json.loads(input_str)
-                if input["command"] == "compile":
-                    source_code = input["code"]
-                    executable = call_compiler(source_code, "(source code)")
-                    result["program"] = b64encode(executable).decode()
-                elif input["command"] == "ping":
-                    pass
-                else:
-                    result["error"] = "Unknown command: " + input['command']
+                result = handle_request(json.loads(input_str), cache, assembler, buffered_output, optimize)
             except Exception as e:
-                result["error"] = "".join(format_exception(e))
+                result = {"error": "".join(format_exception(e))}
             result_str = json.dumps(result)
             self.request.sendall(str.encode(result_str))
 
@@ -120,5 +466,297 @@ def run_server(host: str, port: int) -> None:
         server.serve_forever()
 
 
+# Arguments for `handle_request` in a pool worker process, set by `_init_worker`
+_worker_options: dict[str, Any] = {}
+
+
+def _init_worker(options: dict[str, Any]) -> None:
+    _worker_options.update(options)
+    cache = options.get('cache')
+    if cache is not None:
+        # Pool workers exit without running `atexit` handlers, but they do run these
+        multiprocessing.util.Finalize(None, cache.flush_stats, exitpriority=0)
+    # Let the parent process handle Ctrl+C and shut the pool down in order
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Warm up: build the stdlib and touch every compiler phase once
+    handle_request({"command": "compile", "code": "1"}, **{**options, 'cache': None})
+
+
+def _handle_in_worker(input: dict[str, Any]) -> dict[str, Any]:
+    return handle_request(input, **_worker_options)
+
+
+def start_worker_pool(workers: int, worker_options: dict[str, Any], context: str = 'fork') -> ProcessPoolExecutor:
+    """Starts `workers` warmed-up processes that run `handle_request` with the given options.
+
+    The default, forking, shares the already imported compiler with the
+    workers, but is only safe while this process has no other threads: a
+    lock held by another thread at the fork stays locked forever in the
+    worker. Pools started later, e.g. from a request thread to replace a
+    broken pool, must pass `context='forkserver'`, which forks the workers
+    from a separate single-threaded process instead.
+    """
+    pool = ProcessPoolExecutor(
+        workers,
+        mp_context=multiprocessing.get_context(context),
+        initializer=_init_worker,
+        initargs=(worker_options,),
+    )
+    # All workers are forked on the first submission; wait until they're warm
+    for future in [pool.submit(int) for _ in range(workers)]:
+        future.result()
+    return pool
+
+
+class PoolServer(ThreadingTCPServer):
+    """A server passing requests to a fixed pool of pre-started worker processes.
+
+    A thread per connection reads the request and waits for a worker.
+    At most `workers + queue_size` requests are accepted at a time; more get
+    an immediate response with `"busy": true` so clients can back off.
+    `ping` is answered without involving a worker.
+    """
+    allow_reuse_address = True
+    request_queue_size = 128
+    daemon_threads = False  # So `server_close` waits for requests in progress
+
+    def __init__(
+        self,
+        server_address: tuple[str, int],
+        workers: int,
+        queue_size: int,
+        worker_options: dict[str, Any],
+    ) -> None:
+        super().__init__(server_address, PoolRequestHandler)
+        self.workers = workers
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self._worker_options = worker_options
+        self._pool_lock = threading.Lock()
+        self.pool = start_worker_pool(workers, worker_options)
+
+    def run(self, input: dict[str, Any]) -> dict[str, Any]:
+        """Runs a request in a worker, or returns a busy response if the queue is full."""
+        if input.get("command") == "ping":
+            return {}
+        if not self.slots.acquire(blocking=False):
+            return {"error": "Server busy, try again later", "busy": True}
+        try:
+            pool = self.pool
+            try:
+                return pool.submit(_handle_in_worker, input).result()
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for running out of memory). Replace the pool.
+                with self._pool_lock:
+                    if self.pool is pool:
+                        pool.shutdown(wait=False)
+                        self.pool = start_worker_pool(self.workers, self._worker_options, 'forkserver')
+                return {"error": "Worker process died"}
+        finally:
+            self.slots.release()
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+class PoolRequestHandler(StreamRequestHandler):
+    server: PoolServer
+
+    def handle(self) -> None:
+        try:
+            input_str = self.rfile.read().decode()
+            result = self.server.run(json.loads(input_str))
+        except Exception as e:
+            result = {"error": "".join(format_exception(e))}
+        self.request.sendall(str.encode(json.dumps(result)))
+
+
+def run_pool_server(
+    host: str,
+    port: int,
+    workers: int,
+    queue_size: int | None = None,
+    cache: CompileCache | None = None,
+    assembler: str = 'gnu',
+    buffered_output: bool = False,
+    optimize: bool = False,
+) -> None:
+    """Runs a `PoolServer` until SIGINT or SIGTERM.
+
+    On either signal the server stops accepting connections, finishes the
+    requests it has accepted and then stops the workers.
+    """
+    if queue_size is None:
+        queue_size = 4 * workers
+    options = {'cache': cache, 'assembler': assembler, 'buffered_output': buffered_output, 'optimize': optimize}
+    server = PoolServer((host, port), workers, queue_size, options)
+
+    def stop(signum: int, frame: Any) -> None:
+        # `shutdown` waits for `serve_forever` to return, so it can't run on this thread
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    print(f"Starting TCP server at {host}:{port} with {workers} workers")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+class NdjsonServer:
+    """An asyncio server speaking newline-delimited JSON over persistent connections.
+
+    Each line a client sends is one request and gets one response line.
+    Clients may send many requests without waiting: they are run in the
+    executor concurrently, and the responses are written back in request
+    order. A request's optional `"id"` is copied to its response.
+    A connection stops being read while `max_pipelined` of its requests are
+    unanswered, which pushes back on clients through TCP flow control.
+
+    If a worker process dies, the request gets an error response and, if
+    `replace_executor` is given, the executor is replaced with the one it
+    returns, so that later requests don't all fail.
+    """
+    executor: Executor
+    max_pipelined: int
+    replace_executor: Callable[[], Executor] | None
+
+    def __init__(
+        self,
+        executor: Executor,
+        max_pipelined: int = 64,
+        replace_executor: Callable[[], Executor] | None = None,
+    ) -> None:
+        self.executor = executor
+        self.max_pipelined = max_pipelined
+        self.replace_executor = replace_executor
+        self._readers: set[asyncio.StreamReader] = set()
+        self._replace_lock = asyncio.Lock()
+
+    async def serve(
+        self,
+        host: str,
+        port: int,
+        stop: asyncio.Event,
+        started: Callable[[int], None] | None = None,
+    ) -> None:
+        """Serves until `stop` is set, then answers the requests already received and returns.
+
+        `started` is called with the listening port once connections are accepted.
+        """
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=64 * 1024 * 1024)
+        if started is not None:
+            started(server.sockets[0].getsockname()[1])
+        await stop.wait()
+        server.close()
+        for reader in self._readers:
+            reader.feed_eof()  # Handlers finish the requests read so far and close
+        await server.wait_closed()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._readers.add(reader)
+        responses: asyncio.Queue[asyncio.Future[dict[str, Any]] | None] = asyncio.Queue(self.max_pipelined)
+        write_task = asyncio.create_task(self._write_responses(responses, writer))
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    await responses.put(self._dispatch(line))
+        except (ConnectionError, ValueError):
+            pass  # Client went away or sent a line over the size limit
+        finally:
+            self._readers.discard(reader)
+            await responses.put(None)
+            await write_task
+            writer.close()
+
+    def _dispatch(self, line: bytes) -> asyncio.Future[dict[str, Any]]:
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[dict[str, Any]]
+        try:
+            input = json.loads(line)
+        except ValueError as e:
+            input = {}
+            future = loop.create_future()
+            future.set_result({"error": f"Invalid JSON: {e}"})
+        else:
+            if not isinstance(input, dict):
+                input = {}
+                future = loop.create_future()
+                future.set_result({"error": "Request must be a JSON object"})
+            elif input.get("command") == "ping":
+                future = loop.create_future()
+                future.set_result({})
+            else:
+                future = asyncio.ensure_future(self._run_in_worker(input))
+        if "id" not in input:
+            return future
+
+        async def with_id() -> dict[str, Any]:
+            result = await future
+            return {**result, "id": input["id"]}
+        return asyncio.ensure_future(with_id())
+
+    async def _run_in_worker(self, input: dict[str, Any]) -> dict[str, Any]:
+        executor = self.executor
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, _handle_in_worker, input)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for running out of memory). Replace the pool.
+            async with self._replace_lock:
+                if self.executor is executor and self.replace_executor is not None:
+                    self.executor = await asyncio.to_thread(self.replace_executor)
+                    executor.shutdown(wait=False)
+            return {"error": "Worker process died"}
+
+    async def _write_responses(
+        self,
+        responses: asyncio.Queue[asyncio.Future[dict[str, Any]] | None],
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        while (future := await responses.get()) is not None:
+            try:
+                result = await future
+            except Exception as e:
+                result = {"error": "".join(format_exception(e))}
+            try:
+                writer.write(json.dumps(result).encode() + b'\n')
+                await writer.drain()
+            except ConnectionError:
+                pass  # Keep consuming so the reader side isn't blocked
+
+
+def run_ndjson_server(
+    host: str,
+    port: int,
+    workers: int | None = None,
+    cache: CompileCache | None = None,
+    assembler: str = 'gnu',
+    buffered_output: bool = False,
+    optimize: bool = False,
+) -> None:
+    """Runs an `NdjsonServer` backed by a pool of worker processes until SIGINT or SIGTERM."""
+    options = {'cache': cache, 'assembler': assembler, 'buffered_output': buffered_output, 'optimize': optimize}
+    workers = workers or os.cpu_count() or 1
+    server = NdjsonServer(
+        start_worker_pool(workers, options),
+        # Replacements are started from a thread of the event loop's executor
+        replace_executor=lambda: start_worker_pool(workers, options, 'forkserver'),
+    )
+
+    async def serve() -> None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGINT, stop.set)
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+        print(f"Starting NDJSON server at {host}:{port} with {workers} workers", flush=True)
+        await server.serve(host, port, stop)
+
+    try:
+        asyncio.run(serve())
+    finally:
+        server.executor.shutdown(wait=True)
+
+
 if __name__ == '__main__':
     sys.exit(main())
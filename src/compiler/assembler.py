@@ -1,5 +1,9 @@
+import hashlib
+import os
+import stat
 import subprocess
 import tempfile
+import time
 from contextlib import nullcontext
 from os import path
 from typing import Any, Callable, ContextManager, TypeVar
@@ -8,6 +12,9 @@ from pathlib import Path
 
 T = TypeVar('T')
 
+# Assembled stdlib object files, keyed by `(link_with_c, buffered_output)`
+_stdlib_objects: dict[tuple[bool, bool], str] = {}
+
 
 def assemble(
     assembly_code: str,
@@ -16,17 +23,30 @@ def assemble(
     tempfile_basename: str = 'program',
     link_with_c: bool = False,
     extra_libraries: list[str] = [],
+    reuse_stdlib: bool = True,
+    timings: dict[str, float] | None = None,
+    backend: str = 'gnu',
+    buffered_output: bool = False,
 ) -> None:
     """Invokes 'as' and 'ld' to generate an executable file from Assembly code.
 
     The file is written to the given path.
+    See `assemble_and_get_executable` for the other parameters.
     """
+    if backend == 'builtin':
+        executable = _assemble_builtin(assembly_code, link_with_c, extra_libraries, buffered_output, timings)
+        Path(output_file).write_bytes(executable)
+        os.chmod(output_file, 0o755)
+        return
     _assemble(
         assembly_code=assembly_code,
         workdir=workdir,
         tempfile_basename=tempfile_basename,
         link_with_c=link_with_c,
         extra_libraries=extra_libraries,
+        reuse_stdlib=reuse_stdlib,
+        buffered_output=buffered_output,
+        timings=timings,
         take_output=lambda f: shutil.move(f, output_file)
     )
 
@@ -37,35 +57,81 @@ def assemble_and_get_executable(
     tempfile_basename: str = 'program',
     link_with_c: bool = False,
     extra_libraries: list[str] = [],
+    reuse_stdlib: bool = True,
+    timings: dict[str, float] | None = None,
+    backend: str = 'gnu',
+    buffered_output: bool = False,
 ) -> bytes:
     """Invokes 'as' and 'ld' to generate an executable file from Assembly code.
 
     The file is returned.
+
+    With `reuse_stdlib`, the stdlib is assembled only once and the object
+    file is shared by later calls, even across processes.
+    If `timings` is given, the seconds spent in each external command are
+    stored in it under the keys 'as_stdlib', 'as_program' and 'ld'.
+
+    With `buffered_output`, the stdlib's print functions collect output in a
+    64 KiB buffer that is written out when it fills up, when `read_int` is
+    called and when the program exits normally. Output still in the buffer
+    is lost if the program crashes.
+
+    With `backend='builtin'`, the executable is produced in-process by
+    `builtin_assembler` instead, and its time is stored under 'builtin'.
+    That backend can't link with C or other libraries.
     """
+    if backend == 'builtin':
+        return _assemble_builtin(assembly_code, link_with_c, extra_libraries, buffered_output, timings)
     return _assemble(
         assembly_code=assembly_code,
         workdir=workdir,
         tempfile_basename=tempfile_basename,
         link_with_c=link_with_c,
         extra_libraries=extra_libraries,
+        reuse_stdlib=reuse_stdlib,
+        buffered_output=buffered_output,
+        timings=timings,
         take_output=lambda f: Path(f).read_bytes()
     )
 
 
+def _assemble_builtin(
+    assembly_code: str,
+    link_with_c: bool,
+    extra_libraries: list[str],
+    buffered_output: bool,
+    timings: dict[str, float] | None,
+) -> bytes:
+    from compiler import builtin_assembler  # It imports this module for the stdlib code
+
+    if link_with_c or extra_libraries:
+        raise Exception("The builtin assembler can't link with C or other libraries")
+    start = time.perf_counter()
+    executable = builtin_assembler.assemble_executable(assembly_code, buffered_output)
+    if timings is not None:
+        timings['builtin'] = time.perf_counter() - start
+    return executable
+
+
 def _assemble(
     assembly_code: str,
     workdir: str | None,
     tempfile_basename: str,
     link_with_c: bool,
     extra_libraries: list[str],
+    reuse_stdlib: bool,
+    buffered_output: bool,
+    timings: dict[str, float] | None,
     take_output: Callable[[str], T],
 ) -> T:
+    if timings is None:
+        timings = {}
     if workdir is not None:
         wd = Path(workdir).absolute().as_posix()
-        return _assemble_impl(assembly_code, wd, tempfile_basename, link_with_c, extra_libraries, take_output)
+        return _assemble_impl(assembly_code, wd, tempfile_basename, link_with_c, extra_libraries, reuse_stdlib, buffered_output, timings, take_output)
     else:
         with tempfile.TemporaryDirectory(prefix='compiler_') as wd:
-            return _assemble_impl(assembly_code, wd, tempfile_basename, link_with_c, extra_libraries, take_output)
+            return _assemble_impl(assembly_code, wd, tempfile_basename, link_with_c, extra_libraries, reuse_stdlib, buffered_output, timings, take_output)
 
 
 def _assemble_impl(
@@ -74,27 +140,31 @@ def _assemble_impl(
     tempfile_basename: str,
     link_with_c: bool,
     extra_libraries: list[str],
+    reuse_stdlib: bool,
+    buffered_output: bool,
+    timings: dict[str, float],
     take_output: Callable[[str], T],
 ) -> T:
-    stdlib_asm = path.join(workdir, 'stdlib.s')
-    stdlib_obj = path.join(workdir, 'stdlib.o')
     program_asm = path.join(workdir, f'{tempfile_basename}.s')
     program_obj = path.join(workdir, f'{tempfile_basename}.o')
     output_file = path.join(workdir, 'a.out')
 
-    if link_with_c:
-        final_stdlib_asm_code = drop_start_symbol(stdlib_asm_code)
+    start = time.perf_counter()
+    if reuse_stdlib:
+        stdlib_obj = get_stdlib_object(link_with_c, buffered_output)
     else:
-        final_stdlib_asm_code = stdlib_asm_code
+        stdlib_obj = path.join(workdir, 'stdlib.o')
+        _assemble_stdlib(link_with_c, buffered_output, workdir, stdlib_obj)
+    timings['as_stdlib'] = time.perf_counter() - start
 
-    with open(stdlib_asm, 'w') as f:
-        f.write(final_stdlib_asm_code)
     with open(program_asm, 'w') as f:
         f.write(assembly_code)
-    subprocess.run(['as', '-g', '-o' +
-                    stdlib_obj, stdlib_asm], check=True)
+    start = time.perf_counter()
     subprocess.run(['as', '-g', '-o' +
                     program_obj, program_asm], check=True)
+    timings['as_program'] = time.perf_counter() - start
+
+    start = time.perf_counter()
     linker_flags = ['-static', *[f'-l{lib}' for lib in extra_libraries]]
     if link_with_c:
         # Linking with the C standard library correctly is complicated,
@@ -106,9 +176,79 @@ def _assemble_impl(
     else:
         subprocess.run(
             ['ld', '-o' + output_file, *linker_flags, stdlib_obj, program_obj], check=True)
+    timings['ld'] = time.perf_counter() - start
     return take_output(output_file)
 
 
+def get_stdlib_object(link_with_c: bool = False, buffered_output: bool = False) -> str:
+    """Returns the path to the assembled stdlib object file, assembling it if needed.
+
+    The object file is cached in the system's temp directory under a hash of
+    the stdlib code, so it's built once per installation rather than once per
+    compilation, and remembered for the rest of the process.
+    """
+    stdlib_obj = _stdlib_objects.get((link_with_c, buffered_output))
+    if stdlib_obj is not None and path.exists(stdlib_obj):
+        return stdlib_obj
+
+    code_hash = hashlib.sha256(stdlib_code(link_with_c, buffered_output).encode()).hexdigest()[:16]
+    cache_dir = path.join(tempfile.gettempdir(), f'compiler-stdlib-{os.getuid()}')
+    make_private_directory(cache_dir)
+    stdlib_obj = path.join(cache_dir, f'stdlib-{code_hash}.o')
+    if not path.exists(stdlib_obj):
+        with tempfile.TemporaryDirectory(prefix='compiler_', dir=cache_dir) as wd:
+            temp_obj = path.join(wd, 'stdlib.o')
+            _assemble_stdlib(link_with_c, buffered_output, wd, temp_obj)
+            # Other processes may be doing the same, so replace atomically
+            os.replace(temp_obj, stdlib_obj)
+    _stdlib_objects[(link_with_c, buffered_output)] = stdlib_obj
+    return stdlib_obj
+
+
+def make_private_directory(dir_path: str) -> None:
+    """Creates a directory only the current user can access, or checks an existing one.
+
+    The stdlib cache is in the shared temp directory, where another user
+    could create the directory first and plant an object file that would be
+    linked into our executables. So an existing directory must be a real
+    directory owned by us that nobody else can write to. Read and search
+    permissions for others, which older versions left on, are removed.
+    """
+    try:
+        os.mkdir(dir_path, 0o700)
+    except FileExistsError:
+        pass
+    st = os.lstat(dir_path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o022:
+        raise Exception(
+            f"Refusing to use {dir_path}: it must be a directory owned by the current user "
+            "and not writable by others")
+    if st.st_mode & 0o077:
+        os.chmod(dir_path, 0o700)
+
+
+def _assemble_stdlib(link_with_c: bool, buffered_output: bool, workdir: str, output_file: str) -> None:
+    stdlib_asm = path.join(workdir, 'stdlib.s')
+    with open(stdlib_asm, 'w') as f:
+        f.write(stdlib_code(link_with_c, buffered_output))
+    subprocess.run(['as', '-g', '-o' +
+                    output_file, stdlib_asm], check=True)
+
+
+def stdlib_code(link_with_c: bool = False, buffered_output: bool = False) -> str:
+    """Returns the stdlib's assembly code for the given linking and output mode."""
+    code = stdlib_asm_code
+    if buffered_output:
+        code += buffered_output_asm_code
+    else:
+        code += unbuffered_output_asm_code
+    if link_with_c:
+        code = drop_start_symbol(code)
+        if buffered_output:
+            code += flush_at_exit_with_c_asm_code
+    return code
+
+
 def drop_start_symbol(code: str) -> str:
     return code.split('# BEGIN START')[0] + code.split('# END START')[1]
 
@@ -120,15 +260,17 @@ stdlib_asm_code: str = """
     .global print_int
     .global print_bool
     .global read_int
+    .global flush_output
     .extern main
     .section .text
 
 # BEGIN START (we skip this part when linking with C)
 # ***** Function '_start' *****
-# Calls function 'main' and halts the program
+# Calls function 'main', flushes any buffered output and halts the program
 
 _start:
     call main
+    call flush_output
     movq $60, %rax
     xorq %rdi, %rdi
     syscall
@@ -151,7 +293,7 @@ _start:
 #         x = x / 10
 #     if negative:
 #         push(minus sign)
-#     syscall 'write' with pushed data
+#     write_output(pushed data)
 #     return the original argument
 #
 # Registers:
@@ -214,9 +356,7 @@ print_int:
     decq %rsp
 .Lminus_done:
 
-    # Call syscall 'write'
-    movq $1, %rax            # rax = syscall number for write
-    movq $1, %rdi            # rdi = file handle for stdout
+    # Call 'write_output'
     # rsi = pointer to message
     movq %rsp, %rsi
     incq %rsi
@@ -224,7 +364,7 @@ print_int:
     movq %rbp, %rdx
     subq %rsp, %rdx
     decq %rdx
-    syscall
+    call write_output
 
     # Restore stack registers and return the original input
     movq %rbp, %rsp
@@ -250,13 +390,11 @@ print_bool:
     movq $true_str_len, %rdx
 
 .Lwrite:
-    # Call syscall 'write'
-    movq $1, %rax            # rax = syscall number for write
-    movq $1, %rdi            # rdi = file handle for stdout
+    # Call 'write_output'
     # rsi = pointer to message (already set above)
     # rdx = number of bytes (already set above)
-    syscall
-    
+    call write_output
+
     # Restore stack registers and return the original input
     movq %rbp, %rsp
     popq %rbp
@@ -273,17 +411,14 @@ false_str_len = . - false_str
 # ***** Function 'read_int' *****
 # Reads an integer from stdin, skipping non-digit characters, until a newline.
 #
-# To avoid the complexity of buffering, it very inefficiently
-# makes a syscall to read each byte.
+# Input is read into 'input_buffer' in blocks of up to 64 KiB,
+# and bytes are taken from there until it runs out.
 #
 # It crashes the program if input could not be read.
 read_int:
     pushq %rbp           # Save previous stack frame pointer
     movq %rsp, %rbp      # Set stack frame pointer
     pushq %r12           # Back up r12 since it's callee-saved
-    pushq $0             # Reserve space for input
-                         # (we only write the lowest byte,
-                         # but loading 64-bits at once is easier)
 
     xorq %r9, %r9        # Clear r9 - it'll store the minus sign
     xorq %r10, %r10      # Clear r10 - it'll accumulate our output
@@ -292,17 +427,23 @@ read_int:
 
     # Loop until a newline or end of input is encountered
 .Lloop:
-    # Call syscall 'read'
+    # If there are unread bytes in the buffer, take the next one
+    movq input_buffer_pos(%rip), %rax
+    cmpq input_buffer_end(%rip), %rax
+    jl .Lnext_byte
+
+    # Otherwise refill the buffer
+    call flush_output    # Show any buffered output (e.g. a prompt) before waiting for input
     xorq %rax, %rax      # syscall number for read = 0
     xorq %rdi, %rdi      # file handle for stdin = 0
-    movq %rsp, %rsi      # rsi = pointer to buffer
-    movq $1, %rdx        # rdx = buffer size
+    leaq input_buffer(%rip), %rsi   # rsi = pointer to buffer
+    movq $input_buffer_size, %rdx   # rdx = buffer size
     syscall              # result in rax = number of bytes read,
-                         # or 0 on end of input, -1 on error
+                         # or 0 on end of input, negative on error
 
-    # Check return value: either -1, 0 or 1.
+    # Check return value
     cmpq $0, %rax
-    jg .Lno_error
+    jg .Lrefilled
     je .Lend_of_input
     jmp .Lerror
 
@@ -311,9 +452,16 @@ read_int:
     je .Lerror           # If we've read no input, it's an error.
     jmp .Lend            # Otherwise complete reading this input.
 
-.Lno_error:
+.Lrefilled:
+    movq %rax, input_buffer_end(%rip)
+    xorq %rax, %rax      # Start from the beginning of the buffer
+
+.Lnext_byte:
+    leaq input_buffer(%rip), %rsi
+    movzbq (%rsi,%rax), %r8         # Load input byte to r8
+    incq %rax
+    movq %rax, input_buffer_pos(%rip)
     incq %r12            # Increment input byte counter
-    movq (%rsp), %r8     # Load input byte to r8
 
     # If the input byte is 10 (newline), exit the loop
     cmpq $10, %r8
@@ -348,13 +496,15 @@ read_int:
     neg %r10
 .Lfinal_negation_done:
     # Restore stack registers and return the result
-    popq %r12
+    movq -8(%rbp), %r12  # Restore r12
     movq %rbp, %rsp
     popq %rbp
     movq %r10, %rax
     ret
 
 .Lerror:
+    call flush_output
+
     # Write error message to stderr with syscall 'write'
     movq $1, %rax
     movq $2, %rdi
@@ -370,4 +520,107 @@ read_int:
 read_int_error_str:
     .ascii "Error: read_int() failed to read input\\n"
 read_int_error_str_len = . - read_int_error_str
+
+input_buffer_size = 65536
+
+    .section .bss
+input_buffer_pos:        # Index of the next unread byte in 'input_buffer'
+    .skip 8
+input_buffer_end:        # Number of bytes in 'input_buffer'
+    .skip 8
+input_buffer:
+    .skip 65536
+"""
+
+# One of the two following is appended to `stdlib_asm_code`.
+# Both define 'write_output', which writes %rdx bytes starting at %rsi to stdout,
+# and 'flush_output'. They may clobber %rax, %rcx, %rdx, %rsi, %rdi and %r11
+# (which syscalls clobber anyway) and must preserve every other register.
+# Callers rely on this: print_int and print_bool keep %r10 live across
+# 'write_output', and read_int keeps %r9 and %r10 live across 'flush_output'.
+
+unbuffered_output_asm_code: str = """
+    .section .text
+
+# ***** Function 'write_output' *****
+# Writes the bytes straight to stdout with syscall 'write'.
+write_output:
+    movq $1, %rax            # rax = syscall number for write
+    movq $1, %rdi            # rdi = file handle for stdout
+    syscall
+    ret
+
+# ***** Function 'flush_output' *****
+# Does nothing since nothing is buffered.
+flush_output:
+    ret
+"""
+
+buffered_output_asm_code: str = """
+    .section .text
+
+# ***** Function 'write_output' *****
+# Appends the bytes to 'output_buffer', first flushing it if they don't fit.
+write_output:
+    movq output_buffer_len(%rip), %rax
+    leaq (%rax,%rdx), %rcx
+    cmpq $output_buffer_size, %rcx
+    jle .Lappend
+    pushq %rsi
+    pushq %rdx
+    call flush_output
+    popq %rdx
+    popq %rsi
+    xorq %rax, %rax
+.Lappend:
+    leaq output_buffer(%rip), %rdi
+    addq %rax, %rdi          # rdi = where to copy to
+    addq %rdx, %rax
+    movq %rax, output_buffer_len(%rip)
+.Lcopy_loop:
+    cmpq $0, %rdx
+    je .Lcopy_done
+    movb (%rsi), %cl
+    movb %cl, (%rdi)
+    incq %rsi
+    incq %rdi
+    decq %rdx
+    jmp .Lcopy_loop
+.Lcopy_done:
+    ret
+
+# ***** Function 'flush_output' *****
+# Writes the contents of 'output_buffer' to stdout and empties it.
+# Output is silently dropped if stdout can't be written to.
+flush_output:
+    leaq output_buffer(%rip), %rsi
+    movq output_buffer_len(%rip), %rdx
+.Lflush_loop:
+    cmpq $0, %rdx
+    jle .Lflush_done
+    movq $1, %rax            # rax = syscall number for write
+    movq $1, %rdi            # rdi = file handle for stdout
+    syscall                  # May write only part of the buffer
+    cmpq $0, %rax
+    jle .Lflush_done
+    addq %rax, %rsi
+    subq %rax, %rdx
+    jmp .Lflush_loop
+.Lflush_done:
+    movq $0, output_buffer_len(%rip)
+    ret
+
+output_buffer_size = 65536
+
+    .section .bss
+output_buffer_len:
+    .skip 8
+output_buffer:
+    .skip 65536
+"""
+
+# With C, the program exits through libc, which calls the functions in '.fini_array'.
+flush_at_exit_with_c_asm_code: str = """
+    .section .fini_array, "aw"
+    .quad flush_output
 """
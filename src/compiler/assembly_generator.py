@@ -1,38 +1,109 @@
+import collections
 import dataclasses
-from compiler import ir
-from compiler.intrinsics import all_intrinsics, IntrinsicArgs
+from compiler import ir, trace
+from compiler.dataflow import uses_and_defs
+from compiler.intrinsics import all_intrinsics, comparison_conditions, IntrinsicArgs
+from compiler import register_allocator
+from compiler.register_allocator import callee_saved_registers
 
 class Locals:
     """Knows the memory location of every local variable."""
     _var_to_location: dict[ir.IRvar, str]
     _stack_used: int
+    _saved_registers: dict[str, str]
 
-    def __init__(self, variables: list[ir.IRvar]) -> None:
-        self._var_to_location = {}
+    def __init__(self, variables: list[ir.IRvar], registers: dict[ir.IRvar, str] | None = None) -> None:
+        if registers is None:
+            registers = {}
+        self._var_to_location = dict(registers)
         self._stack_used = 8
         for v in variables:
             if v not in self._var_to_location:
                 self._var_to_location[v] = f'-{self._stack_used}(%rbp)'
                 self._stack_used += 8
+        # Callee-saved registers we use must be restored before returning
+        self._saved_registers = {}
+        for r in callee_saved_registers:
+            if r in registers.values():
+                self._saved_registers[r] = f'-{self._stack_used}(%rbp)'
+                self._stack_used += 8
 
 
     def get_ref(self, v: ir.IRvar) -> str:
         """Returns an Assembly reference like `-24(%rbp)`
-        for the memory location that stores the given variable"""
+        for the memory location that stores the given variable,
+        or a register like `%rbx` if the variable was allocated one."""
         return self._var_to_location[v]
 
     def stack_used(self) -> int:
         """Returns the number of bytes of stack space needed for the local variables."""
         return self._stack_used
 
+    def saved_registers(self) -> dict[str, str]:
+        """Returns the callee-saved registers in use and the stack slots they are saved to."""
+        return self._saved_registers
+
+def is_register(ref: str) -> bool:
+    return ref.startswith('%')
+
 def needs_movabsq(value: int) -> bool:
     return (value & 0xFFFFFFFF80000000) != 0xFFFFFFFF80000000
 
-def generate_assembly(instructions: list[ir.Instruction]) -> str:
+def find_constant_values(instructions: list[ir.Instruction]) -> dict[ir.IRvar, int]:
+    """Returns the variables whose only assignment loads an integer constant, with their values.
+
+    Intrinsics use these to pick cheaper instructions, like shifts for multiplying by 2**k.
+    """
+    assignments: collections.Counter[ir.IRvar] = collections.Counter()
+    values: dict[ir.IRvar, int] = {}
+    for insn in instructions:
+        assignments.update(uses_and_defs(insn)[1])
+        if isinstance(insn, ir.LoadIntConst):
+            values[insn.dest] = insn.value
+    return {var: value for var, value in values.items() if assignments[var] == 1}
+
+
+def find_fused_comparisons(instructions: list[ir.Instruction]) -> set[int]:
+    """Returns the indices of comparisons whose result is only read by the `CondJump` right after them.
+
+    Such a comparison can set the flags for a conditional jump instead of
+    storing a 0 or 1 for `CondJump` to compare again.
+    """
+    reads: collections.Counter[ir.IRvar] = collections.Counter()
+    for insn in instructions:
+        reads.update(uses_and_defs(insn)[0])
+    fused = set()
+    for i, insn in enumerate(instructions[:-1]):
+        next_insn = instructions[i + 1]
+        if (isinstance(insn, ir.Call) and insn.fun.name in comparison_conditions
+                and isinstance(next_insn, ir.CondJump) and next_insn.cond == insn.dest
+                and reads[insn.dest] == 1):
+            fused.add(i)
+    return fused
+
+
+def generate_assembly(instructions: list[ir.Instruction], allocate_registers: bool = True) -> str:
+    """Generates Assembly code for the `main` function.
+
+    With `allocate_registers` (the default), variables are kept in registers
+    chosen by `register_allocator.allocate_registers` and only spilled
+    variables get stack slots. Otherwise every variable lives on the stack.
+
+    A comparison whose result is only used by the `CondJump` right after it
+    is compiled into a `cmpq` and a conditional jump.
+    """
     assembly_code_lines = []
     def emit(line: str) -> None: assembly_code_lines.append(line)
 
-    locals = Locals(get_all_ir_variables(instructions))
+    registers = register_allocator.allocate_registers(instructions) if allocate_registers else {}
+    variables = get_all_ir_variables(instructions)
+    locals = Locals(variables, registers)
+    if trace.assembly_generator.info_enabled:
+        trace.assembly_generator.info(
+            '%d variables in registers, %d in stack slots', len(registers), len(variables) - len(registers))
+    if trace.assembly_generator.debug_enabled:
+        for var, register in registers.items():
+            trace.assembly_generator.debug('%s -> %s', var, register)
 
     emit('.global main')
     emit('.type main, @function')
@@ -45,20 +116,43 @@ def generate_assembly(instructions: list[ir.Instruction]) -> str:
     emit('pushq %rbp')
     emit('movq %rsp, %rbp')
     emit(f' subq ${locals.stack_used()}, %rsp')
+    for register, ref in locals.saved_registers().items():
+        emit(f'movq {register}, {ref}')
 
-    for insn in instructions:
+    constant_values = find_constant_values(instructions)
+    fused_comparisons = find_fused_comparisons(instructions)
+    # The condition code set by a fused comparison, for the `CondJump` after it
+    fused_condition: str | None = None
+
+    for i, insn in enumerate(instructions):
         emit('#' + str(insn))
+        if i in fused_comparisons:
+            assert isinstance(insn, ir.Call)
+            left, right = (locals.get_ref(arg) for arg in insn.args)
+            if not is_register(left) and not is_register(right):
+                emit(f'movq {left}, %rax')
+                left = '%rax'
+            emit(f'cmpq {right}, {left}')
+            fused_condition = comparison_conditions[insn.fun.name]
+            continue
         match insn:
 
             case ir.Label():
                 emit(f'.L{insn.name}:')
 
             case ir.LoadIntConst():
-                if needs_movabsq(insn.value):
-                    emit(f'movabsq ${insn.value}, %rax')
+                dest_ref = locals.get_ref(insn.dest)
+                if is_register(dest_ref):
+                    if needs_movabsq(insn.value):
+                        emit(f'movabsq ${insn.value}, {dest_ref}')
+                    else:
+                        emit(f'movq ${insn.value}, {dest_ref}')
                 else:
-                    emit(f'movq ${insn.value}, %rax')
-                emit(f'movq %rax, {locals.get_ref(insn.dest)}')
+                    if needs_movabsq(insn.value):
+                        emit(f'movabsq ${insn.value}, %rax')
+                    else:
+                        emit(f'movq ${insn.value}, %rax')
+                    emit(f'movq %rax, {dest_ref}')
 
             
             case ir.LoadBoolConst():
@@ -67,18 +161,35 @@ def generate_assembly(instructions: list[ir.Instruction]) -> str:
                 emit(f'movq ${value}, {locals.get_ref(insn.dest)}')
 
             case ir.Copy():
-                emit(f'movq {locals.get_ref(insn.source)}, %rax')
-                emit(f'movq %rax, {locals.get_ref(insn.dest)}')
+                source_ref = locals.get_ref(insn.source)
+                dest_ref = locals.get_ref(insn.dest)
+                if source_ref == dest_ref:
+                    pass
+                elif is_register(source_ref) or is_register(dest_ref):
+                    emit(f'movq {source_ref}, {dest_ref}')
+                else:
+                    emit(f'movq {source_ref}, %rax')
+                    emit(f'movq %rax, {dest_ref}')
 
             case ir.Call():
                 if (intrinsic := all_intrinsics.get(insn.fun.name)):
+                    arg_refs = [locals.get_ref(a) for a in insn.args]
+                    dest_ref = locals.get_ref(insn.dest)
+                    # Compute straight into the destination register unless
+                    # that would overwrite an operand before it is read.
+                    if is_register(dest_ref) and dest_ref not in arg_refs[1:]:
+                        result_register = dest_ref
+                    else:
+                        result_register = '%rax'
                     args = IntrinsicArgs(
-                        arg_refs = [locals.get_ref(a) for a in insn.args],
-                        result_register='%rax',
-                        emit=emit
+                        arg_refs = arg_refs,
+                        result_register=result_register,
+                        emit=emit,
+                        arg_values=[constant_values.get(arg) for arg in insn.args],
                     )
                     intrinsic(args)
-                    emit(f'movq %rax, {locals.get_ref(insn.dest)}')
+                    if result_register != dest_ref:
+                        emit(f'movq {result_register}, {dest_ref}')
                 else:
                     if insn.fun.name == 'read_int':
                         assert len(insn.args) == 0, "read_int不需要参数"
@@ -100,14 +211,20 @@ def generate_assembly(instructions: list[ir.Instruction]) -> str:
                 emit(f'jmp .L{insn.label.name}')
 
             case ir.CondJump():
-                emit(f'cmpq $0, {locals.get_ref(insn.cond)}')
-                emit(f'jne .L{insn.then_label.name}')
+                if fused_condition is not None:
+                    emit(f'j{fused_condition} .L{insn.then_label.name}')
+                    fused_condition = None
+                else:
+                    emit(f'cmpq $0, {locals.get_ref(insn.cond)}')
+                    emit(f'jne .L{insn.then_label.name}')
                 emit(f'jmp .L{insn.else_label.name}')
 
             case _:
                 raise Exception(f'Unknown instruction: {type(insn)}')
 
     emit('movq $0, %rax')
+    for register, ref in locals.saved_registers().items():
+        emit(f'movq {ref}, {register}')
     emit('movq %rbp, %rsp')
     emit('popq %rbp')
     emit('ret')
@@ -1,6 +1,6 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import List, Optional, Tuple
-from compiler.types import Type
+from compiler.types import Type, Unit
 
 @dataclass
 class SourceLocation:
@@ -19,6 +19,8 @@ class Location(SourceLocation):
 class Expression:
     """Base class for AST nodes representing expressions."""
     #location: Location
+    # Filled in by the type checker, so later passes don't have to re-typecheck.
+    type: Type = field(kw_only=True, default=Unit(), compare=False, repr=False)
 
 
 
@@ -29,6 +31,9 @@ class Literal(Expression): #数字
 @dataclass
 class Identifier(Expression): #加减乘除等操作符
     name: str
+    # Filled in by the resolver: the (depth, index) of the variable's frame slot,
+    # or None if the name isn't declared in the program itself.
+    slot: tuple[int, int] | None = field(kw_only=True, default=None, compare=False, repr=False)
 
 @dataclass
 class BinaryOp(Expression): #二叉树
@@ -0,0 +1,755 @@
+"""An in-process replacement for `as` and `ld`.
+
+Encodes the subset of x86-64 AT&T syntax that `assembly_generator`,
+`intrinsics` and the stdlib use straight to machine code, and links the
+result into a static ELF64 executable without spawning any processes.
+
+Every instruction referring to a symbol uses a fixed-size encoding
+(rel32 jumps, imm32/disp32 operands), so each source file is encoded in a
+single pass into an `ObjectUnit`, and symbols are only resolved by `link`.
+"""
+import re
+import struct
+from dataclasses import dataclass, field
+from typing import Callable
+
+from compiler.assembler import stdlib_code
+
+_registers_64 = ['rax', 'rcx', 'rdx', 'rbx', 'rsp', 'rbp', 'rsi', 'rdi',
+                 'r8', 'r9', 'r10', 'r11', 'r12', 'r13', 'r14', 'r15']
+_registers_32 = ['eax', 'ecx', 'edx', 'ebx', 'esp', 'ebp', 'esi', 'edi',
+                 'r8d', 'r9d', 'r10d', 'r11d', 'r12d', 'r13d', 'r14d', 'r15d']
+_registers_8 = ['al', 'cl', 'dl', 'bl', 'spl', 'bpl', 'sil', 'dil',
+                'r8b', 'r9b', 'r10b', 'r11b', 'r12b', 'r13b', 'r14b', 'r15b']
+
+_condition_codes = {
+    'o': 0, 'no': 1, 'b': 2, 'c': 2, 'nae': 2, 'ae': 3, 'nb': 3, 'nc': 3,
+    'e': 4, 'z': 4, 'ne': 5, 'nz': 5, 'be': 6, 'na': 6, 'a': 7, 'nbe': 7,
+    's': 8, 'ns': 9, 'p': 10, 'pe': 10, 'np': 11, 'po': 11,
+    'l': 12, 'nge': 12, 'ge': 13, 'nl': 13, 'le': 14, 'ng': 14, 'g': 15, 'nle': 15,
+}
+
+# Opcode extensions (the /n in Intel's manuals) of each instruction group
+_alu_ops = {'add': 0, 'or': 1, 'adc': 2, 'sbb': 3, 'and': 4, 'sub': 5, 'xor': 6, 'cmp': 7}
+_unary_ops = {'not': 2, 'neg': 3, 'mul': 4, 'div': 6, 'idiv': 7}
+_shift_ops = {'rol': 0, 'ror': 1, 'shl': 4, 'sal': 4, 'shr': 5, 'sar': 7}
+_sized_mnemonics = (
+    list(_alu_ops) + list(_unary_ops) + list(_shift_ops)
+    + ['mov', 'test', 'inc', 'dec', 'imul', 'lea', 'push', 'pop']
+)
+_no_operand_instructions = {
+    'cqto': b'\x48\x99', 'cqo': b'\x48\x99', 'cltq': b'\x48\x98', 'cdqe': b'\x48\x98',
+    'ret': b'\xc3', 'retq': b'\xc3', 'syscall': b'\x0f\x05', 'nop': b'\x90',
+    'leave': b'\xc9', 'leaveq': b'\xc9', 'hlt': b'\xf4', 'ud2': b'\x0f\x0b',
+}
+
+_base_address = 0x400000
+_page_size = 0x1000
+
+# An expression like `label`, `label+8` or `. - label`, as (sign, term) pairs
+Expression = list[tuple[int, str]]
+
+
+class AssemblerError(Exception):
+    pass
+
+
+@dataclass
+class Register:
+    number: int
+    size: int
+
+
+@dataclass
+class Immediate:
+    value: int
+    expression: Expression | None = None
+
+
+@dataclass
+class Memory:
+    displacement: int = 0
+    expression: Expression | None = None
+    base: Register | None = None
+    index: Register | None = None
+    scale: int = 1
+    rip_relative: bool = False
+
+
+Operand = Register | Immediate | Memory
+
+
+@dataclass
+class Fixup:
+    """A field of `size` bytes at `offset` in `section` whose value depends on symbols."""
+    section: str
+    offset: int
+    size: int
+    expression: Expression
+    pc_relative: bool
+    # Section offset of the end of the instruction, which pc-relative values are relative to
+    pc: int
+    # Section offset of the instruction, for `.` in operands
+    dot: int
+
+
+@dataclass
+class ObjectUnit:
+    """The encoded contents of one assembly source file, before linking."""
+    text: bytearray = field(default_factory=bytearray)
+    data: bytearray = field(default_factory=bytearray)
+    bss_size: int = 0
+    labels: dict[str, tuple[str, int]] = field(default_factory=dict)
+    equates: dict[str, tuple[Expression, str, int]] = field(default_factory=dict)
+    global_symbols: set[str] = field(default_factory=set)
+    fixups: list[Fixup] = field(default_factory=list)
+
+
+@dataclass
+class _Encoding:
+    code: bytes
+    # (offset within the instruction, size, expression, pc_relative)
+    fixups: list[tuple[int, int, Expression, bool]] = field(default_factory=list)
+
+
+def encode_unit(assembly_code: str) -> ObjectUnit:
+    """Encodes an assembly source file into an unlinked object unit."""
+    unit = ObjectUnit()
+    section = '.text'
+
+    def offset() -> int:
+        if section == '.text':
+            return len(unit.text)
+        elif section == '.data':
+            return len(unit.data)
+        else:
+            return unit.bss_size
+
+    def append(content: bytes) -> None:
+        if section == '.text':
+            unit.text += content
+        elif section == '.data':
+            unit.data += content
+        elif any(content):
+            raise AssemblerError('Only zeros can be placed in .bss')
+        else:
+            unit.bss_size += len(content)
+
+    for line_number, raw_line in enumerate(assembly_code.splitlines(), start=1):
+        line = _strip_comment(raw_line).strip()
+        try:
+            while (m := re.match(r'([A-Za-z_.$][\w.$]*):\s*', line)) is not None:
+                if m[1] in unit.labels or m[1] in unit.equates:
+                    raise AssemblerError(f'Symbol {m[1]} is already defined')
+                unit.labels[m[1]] = (section, offset())
+                line = line[m.end():]
+            if line == '':
+                continue
+
+            if (m := re.fullmatch(r'([A-Za-z_.$][\w.$]*)\s*=\s*(.+)', line)) is not None:
+                unit.equates[m[1]] = (_parse_expression(m[2]), section, offset())
+                continue
+
+            mnemonic, _, rest = line.replace('\t', ' ').partition(' ')
+            args = _split_operands(rest)
+            if mnemonic.startswith('.'):
+                section = _directive(unit, section, mnemonic, args, rest, offset, append)
+                continue
+
+            if section != '.text':
+                raise AssemblerError('Instructions must be in the .text section')
+            encoding = _encode_instruction(mnemonic, [_parse_operand(a) for a in args])
+            start = len(unit.text)
+            unit.text += encoding.code
+            for fixup_offset, size, expression, pc_relative in encoding.fixups:
+                unit.fixups.append(Fixup(
+                    '.text', start + fixup_offset, size, expression,
+                    pc_relative, pc=len(unit.text), dot=start))
+        except AssemblerError as e:
+            raise AssemblerError(f'line {line_number}: {raw_line.strip()}: {e}') from None
+        except (ValueError, KeyError, IndexError) as e:
+            raise AssemblerError(f'line {line_number}: {raw_line.strip()}: invalid syntax ({e})') from None
+
+    return unit
+
+
+def link(units: list[ObjectUnit], entry: str = '_start') -> bytes:
+    """Links object units into a static ELF64 executable and returns its bytes."""
+    headers_size = 64 + 56 * 3
+
+    # Lay out .text after the headers in the first segment,
+    # and .data followed by .bss in a second, writable segment.
+    text_offsets = []
+    text_end = headers_size
+    for unit in units:
+        text_end = _align(text_end, 16)
+        text_offsets.append(text_end)
+        text_end += len(unit.text)
+    data_start = _align(text_end, _page_size)
+    data_offsets = []
+    data_end = data_start
+    for unit in units:
+        data_end = _align(data_end, 16)
+        data_offsets.append(data_end)
+        data_end += len(unit.data)
+    bss_offsets = []
+    bss_end = data_end
+    for unit in units:
+        bss_end = _align(bss_end, 16)
+        bss_offsets.append(bss_end)
+        bss_end += unit.bss_size
+
+    def section_address(i: int, section: str) -> int:
+        if section == '.text':
+            return _base_address + text_offsets[i]
+        elif section == '.data':
+            return _base_address + data_offsets[i]
+        else:
+            return _base_address + bss_offsets[i]
+
+    global_units: dict[str, int] = {}
+    for i, unit in enumerate(units):
+        for name in unit.global_symbols:
+            if name in unit.labels or name in unit.equates:
+                if name in global_units:
+                    raise AssemblerError(f'Global symbol {name} is defined more than once')
+                global_units[name] = i
+
+    def resolve(i: int, name: str, dot: int) -> int:
+        unit = units[i]
+        if name == '.':
+            return dot
+        if name in unit.labels:
+            section, offset = unit.labels[name]
+            return section_address(i, section) + offset
+        if name in unit.equates:
+            expression, section, offset = unit.equates[name]
+            return evaluate(i, expression, section_address(i, section) + offset)
+        if name in global_units:
+            return resolve(global_units[name], name, dot)
+        raise AssemblerError(f'Undefined symbol: {name}')
+
+    def evaluate(i: int, expression: Expression, dot: int) -> int:
+        total = 0
+        for sign, term in expression:
+            if re.fullmatch(r'-?(0x[0-9a-fA-F]+|\d+)', term):
+                total += sign * int(term, 0)
+            else:
+                total += sign * resolve(i, term, dot)
+        return total
+
+    image = bytearray(data_start)
+    for i, unit in enumerate(units):
+        image[text_offsets[i]:text_offsets[i] + len(unit.text)] = unit.text
+    image += bytes(data_end - data_start)
+    for i, unit in enumerate(units):
+        image[data_offsets[i]:data_offsets[i] + len(unit.data)] = unit.data
+
+    for i, unit in enumerate(units):
+        for fixup in unit.fixups:
+            field_address = section_address(i, fixup.section) + fixup.offset
+            value = evaluate(i, fixup.expression, section_address(i, fixup.section) + fixup.dot)
+            if fixup.pc_relative:
+                value -= section_address(i, fixup.section) + fixup.pc
+            if fixup.size == 4:
+                if not -2**31 <= value < 2**31:
+                    raise AssemblerError(f'Value of {_format_expression(fixup.expression)} does not fit in 32 bits')
+                encoded = struct.pack('<i', value)
+            else:
+                encoded = struct.pack('<q', value) if value < 2**63 else struct.pack('<Q', value)
+            file_offset = field_address - _base_address
+            image[file_offset:file_offset + fixup.size] = encoded
+
+    entry_address = resolve(0, entry, 0) if entry in global_units else None
+    if entry_address is None:
+        raise AssemblerError(f'Entry point {entry} is not defined')
+
+    PT_LOAD, PT_GNU_STACK = 1, 0x6474e551
+    PF_X, PF_W, PF_R = 1, 2, 4
+    program_headers = [
+        struct.pack('<IIQQQQQQ', PT_LOAD, PF_R | PF_X, 0, _base_address, _base_address,
+                    text_end, text_end, _page_size),
+        struct.pack('<IIQQQQQQ', PT_GNU_STACK, PF_R | PF_W, 0, 0, 0, 0, 0, 16),
+    ]
+    if bss_end > data_start:
+        program_headers.append(struct.pack(
+            '<IIQQQQQQ', PT_LOAD, PF_R | PF_W, data_start, _base_address + data_start,
+            _base_address + data_start, data_end - data_start, bss_end - data_start, _page_size))
+    else:
+        del image[text_end:]  # Nothing is loaded from the padding
+    header = struct.pack(
+        '<16sHHIQQQIHHHHHH',
+        b'\x7fELF\x02\x01\x01' + bytes(9),
+        2,  # ET_EXEC
+        0x3e,  # EM_X86_64
+        1,
+        entry_address,
+        64,  # Program headers right after the ELF header
+        0,  # No section headers
+        0,
+        64,
+        56,
+        len(program_headers),
+        64,
+        0,
+        0,
+    )
+    headers = header + b''.join(program_headers)
+    image[:len(headers)] = headers
+    return bytes(image)
+
+
+# Encoded stdlibs, keyed by `buffered_output`
+_stdlib_units: dict[bool, ObjectUnit] = {}
+
+
+def get_stdlib_unit(buffered_output: bool = False) -> ObjectUnit:
+    """Returns the encoded stdlib, encoding it on first use."""
+    unit = _stdlib_units.get(buffered_output)
+    if unit is None:
+        unit = encode_unit(stdlib_code(buffered_output=buffered_output))
+        _stdlib_units[buffered_output] = unit
+    return unit
+
+
+def assemble_executable(assembly_code: str, buffered_output: bool = False) -> bytes:
+    """Encodes the program, links it with the stdlib and returns the executable."""
+    return link([get_stdlib_unit(buffered_output), encode_unit(assembly_code)])
+
+
+def _align(n: int, alignment: int) -> int:
+    return (n + alignment - 1) // alignment * alignment
+
+
+def _strip_comment(line: str) -> str:
+    in_string = False
+    for i, c in enumerate(line):
+        if c == '"' and (i == 0 or line[i - 1] != '\\'):
+            in_string = not in_string
+        elif c == '#' and not in_string:
+            return line[:i]
+    return line
+
+
+def _split_operands(text: str) -> list[str]:
+    operands = []
+    depth = 0
+    in_string = False
+    current = ''
+    for c in text:
+        if c == '"':
+            in_string = not in_string
+        elif c == '(' and not in_string:
+            depth += 1
+        elif c == ')' and not in_string:
+            depth -= 1
+        if c == ',' and depth == 0 and not in_string:
+            operands.append(current.strip())
+            current = ''
+        else:
+            current += c
+    if current.strip() != '':
+        operands.append(current.strip())
+    return operands
+
+
+def _parse_expression(text: str) -> Expression:
+    terms = re.findall(r'([+-]?)\s*([\w.$]+)', text.replace(' ', ''))
+    if ''.join(sign + term for sign, term in terms) != text.replace(' ', ''):
+        raise AssemblerError(f'Unsupported expression: {text}')
+    return [(-1 if sign == '-' else 1, term) for sign, term in terms]
+
+
+def _constant_value(expression: Expression) -> int | None:
+    """Returns the value of an expression without symbols, or None."""
+    total = 0
+    for sign, term in expression:
+        if not re.fullmatch(r'0x[0-9a-fA-F]+|\d+', term):
+            return None
+        total += sign * int(term, 0)
+    return total
+
+
+def _format_expression(expression: Expression) -> str:
+    return ''.join(('-' if sign < 0 else '+') + term for sign, term in expression).lstrip('+')
+
+
+def _parse_register(text: str) -> Register:
+    name = text.removeprefix('%')
+    for size, names in [(64, _registers_64), (32, _registers_32), (8, _registers_8)]:
+        if name in names:
+            return Register(names.index(name), size)
+    raise AssemblerError(f'Unknown register: {text}')
+
+
+def _parse_operand(text: str) -> Operand:
+    if text.startswith('%'):
+        return _parse_register(text)
+    if text.startswith('$'):
+        expression = _parse_expression(text[1:])
+        value = _constant_value(expression)
+        if value is None:
+            return Immediate(0, expression)
+        return Immediate(value)
+
+    m = re.fullmatch(r'([^(]*)(?:\(([^)]*)\))?', text)
+    if m is None:
+        raise AssemblerError(f'Invalid operand: {text}')
+    memory = Memory()
+    if m[1].strip() != '':
+        expression = _parse_expression(m[1])
+        value = _constant_value(expression)
+        if value is None:
+            memory.expression = expression
+        else:
+            memory.displacement = value
+    if m[2] is not None:
+        parts = [p.strip() for p in m[2].split(',')]
+        if parts[0] == '%rip':
+            if len(parts) != 1:
+                raise AssemblerError('%rip cannot be used with an index')
+            memory.rip_relative = True
+        elif parts[0] != '':
+            memory.base = _parse_register(parts[0])
+        if len(parts) >= 2:
+            memory.index = _parse_register(parts[1])
+        if len(parts) >= 3:
+            memory.scale = int(parts[2])
+    return memory
+
+
+def _directive(
+    unit: ObjectUnit,
+    section: str,
+    name: str,
+    args: list[str],
+    rest: str,
+    offset: Callable[[], int],
+    append: Callable[[bytes], None],
+) -> str:
+    """Handles an assembler directive and returns the new current section."""
+    if name in ('.global', '.globl'):
+        unit.global_symbols.update(args)
+    elif name in ('.text', '.data', '.bss'):
+        return name
+    elif name == '.section':
+        if args[0] not in ('.text', '.data', '.bss', '.rodata'):
+            raise AssemblerError(f'Unsupported section: {args[0]}')
+        return '.data' if args[0] == '.rodata' else args[0]
+    elif name in ('.ascii', '.asciz', '.string'):
+        for literal in re.findall(r'"((?:[^"\\]|\\.)*)"', rest):
+            content = literal.encode('latin-1').decode('unicode_escape').encode('latin-1')
+            append(content + (b'\0' if name != '.ascii' else b''))
+    elif name in ('.byte', '.short', '.word', '.long', '.int', '.quad'):
+        size = {'.byte': 1, '.short': 2, '.word': 2, '.long': 4, '.int': 4, '.quad': 8}[name]
+        for arg in args:
+            value = _constant_value(_parse_expression(arg))
+            if value is None:
+                raise AssemblerError(f'{name} only supports constants')
+            append(value.to_bytes(size, 'little', signed=value < 0))
+    elif name in ('.zero', '.skip', '.space'):
+        append(bytes(int(args[0], 0)))
+    elif name in ('.align', '.balign', '.p2align'):
+        alignment = 1 << int(args[0], 0) if name == '.p2align' else int(args[0], 0)
+        padding = _align(offset(), alignment) - offset()
+        append((b'\x90' if section == '.text' else b'\0') * padding)
+    elif name in ('.set', '.equ'):
+        unit.equates[args[0]] = (_parse_expression(args[1]), section, offset())
+    elif name in ('.extern', '.type', '.size', '.file', '.ident', '.loc') or name.startswith('.cfi_'):
+        pass  # Nothing to do for a static executable without debug info
+    else:
+        raise AssemblerError(f'Unsupported directive: {name}')
+    return section
+
+
+def _split_mnemonic(mnemonic: str, operands: list[Operand]) -> tuple[str, int]:
+    """Splits an AT&T mnemonic like `addq` into its base name and operand size in bits."""
+    if mnemonic in _sized_mnemonics:
+        registers = [o for o in operands if isinstance(o, Register)]
+        if not registers:
+            raise AssemblerError(f'Cannot infer the operand size of {mnemonic}')
+        return mnemonic, registers[-1].size
+    suffix = mnemonic[-1:]
+    if mnemonic[:-1] in _sized_mnemonics and suffix in ('q', 'l', 'b'):
+        return mnemonic[:-1], {'q': 64, 'l': 32, 'b': 8}[suffix]
+    raise AssemblerError(f'Unsupported instruction: {mnemonic}')
+
+
+def _encode_instruction(mnemonic: str, operands: list[Operand]) -> _Encoding:
+    if mnemonic in _no_operand_instructions:
+        return _Encoding(_no_operand_instructions[mnemonic])
+
+    if mnemonic in ('jmp', 'call', 'callq') or (mnemonic[0] == 'j' and mnemonic[1:] in _condition_codes):
+        [target] = operands
+        if not isinstance(target, Memory) or target.base is not None or target.expression is None:
+            raise AssemblerError('Only direct jumps and calls are supported')
+        expression = target.expression + ([(1, str(target.displacement))] if target.displacement else [])
+        if mnemonic == 'jmp':
+            opcode = b'\xe9'
+        elif mnemonic in ('call', 'callq'):
+            opcode = b'\xe8'
+        else:
+            opcode = bytes([0x0f, 0x80 + _condition_codes[mnemonic[1:]]])
+        return _Encoding(opcode + bytes(4), [(len(opcode), 4, expression, True)])
+
+    if mnemonic.startswith('set') and mnemonic[3:] in _condition_codes:
+        [dest] = operands
+        if isinstance(dest, Register) and dest.size != 8:
+            raise AssemblerError(f'{mnemonic} needs an 8-bit register')
+        return _modrm(bytes([0x0f, 0x90 + _condition_codes[mnemonic[3:]]]), 0, dest, w=False)
+
+    if mnemonic.startswith('cmov'):
+        condition = mnemonic[4:]
+        if condition not in _condition_codes:
+            condition = condition[:-1]
+        source, dest = operands
+        if condition not in _condition_codes or not isinstance(dest, Register):
+            raise AssemblerError(f'Unsupported instruction: {mnemonic}')
+        return _modrm(bytes([0x0f, 0x40 + _condition_codes[condition]]), dest.number, source, w=dest.size == 64)
+
+    if mnemonic in ('movabsq', 'movabs'):
+        source, dest = operands
+        if not isinstance(source, Immediate) or not isinstance(dest, Register):
+            raise AssemblerError('movabsq needs an immediate and a register')
+        return _move_imm64(source, dest)
+
+    if mnemonic in ('movzbq', 'movzbl', 'movsbq', 'movsbl'):
+        source, dest = operands
+        if not isinstance(dest, Register):
+            raise AssemblerError(f'{mnemonic} needs a register destination')
+        opcode = b'\x0f\xb6' if mnemonic.startswith('movz') else b'\x0f\xbe'
+        return _modrm(opcode, dest.number, source, w=mnemonic.endswith('q'))
+
+    base, size = _split_mnemonic(mnemonic, operands)
+    w = size == 64
+
+    if base in _alu_ops or base == 'test':
+        source, dest = operands
+        if isinstance(source, Immediate):
+            if base == 'test':
+                if size == 8:
+                    return _modrm(b'\xf6', 0, dest, w, _immediate(source, 1, sign_extended=False))
+                return _modrm(b'\xf7', 0, dest, w, _immediate(source, 4, sign_extended=w))
+            n = _alu_ops[base]
+            if size == 8:
+                return _modrm(b'\x80', n, dest, w, _immediate(source, 1, sign_extended=False))
+            if source.expression is None and -128 <= source.value <= 127:
+                return _modrm(b'\x83', n, dest, w, _immediate(source, 1))
+            if isinstance(dest, Register) and dest.number == 0:
+                # Shorter encoding for %rax with a 32-bit immediate
+                return _prefixed(bytes([0x05 + 8 * n]), w, _immediate(source, 4, sign_extended=w))
+            return _modrm(b'\x81', n, dest, w, _immediate(source, 4, sign_extended=w))
+        opcode_base = 0x84 if base == 'test' else 8 * _alu_ops[base]
+        if isinstance(source, Register):
+            return _modrm(bytes([opcode_base + (0 if size == 8 else 1)]), source.number, dest, w,
+                          force_rex=_needs_rex(source))
+        if isinstance(dest, Register) and base != 'test':
+            return _modrm(bytes([opcode_base + (2 if size == 8 else 3)]), dest.number, source, w,
+                          force_rex=_needs_rex(dest))
+        raise AssemblerError(f'Invalid operands for {mnemonic}')
+
+    if base == 'mov':
+        source, dest = operands
+        if isinstance(source, Immediate):
+            if size == 8:
+                return _modrm(b'\xc6', 0, dest, w, _immediate(source, 1, sign_extended=False))
+            if size == 64 and source.expression is None and not -2**31 <= source.value < 2**31:
+                if not isinstance(dest, Register):
+                    raise AssemblerError('A 64-bit immediate can only be moved to a register')
+                return _move_imm64(source, dest)
+            if size == 32 and isinstance(dest, Register):
+                return _prefixed(bytes([0xb8 + (dest.number & 7)]), False,
+                                 _immediate(source, 4, sign_extended=False), b=dest.number >> 3)
+            return _modrm(b'\xc7', 0, dest, w, _immediate(source, 4, sign_extended=w))
+        if isinstance(source, Register):
+            return _modrm(b'\x88' if size == 8 else b'\x89', source.number, dest, w,
+                          force_rex=_needs_rex(source))
+        if isinstance(dest, Register):
+            return _modrm(b'\x8a' if size == 8 else b'\x8b', dest.number, source, w,
+                          force_rex=_needs_rex(dest))
+        raise AssemblerError(f'Invalid operands for {mnemonic}')
+
+    if base == 'lea':
+        source, dest = operands
+        if not isinstance(source, Memory) or not isinstance(dest, Register):
+            raise AssemblerError('lea needs a memory operand and a register')
+        return _modrm(b'\x8d', dest.number, source, w)
+
+    if base in _unary_ops:
+        [operand] = operands
+        return _modrm(b'\xf6' if size == 8 else b'\xf7', _unary_ops[base], operand, w)
+
+    if base in ('inc', 'dec'):
+        [operand] = operands
+        return _modrm(b'\xfe' if size == 8 else b'\xff', 0 if base == 'inc' else 1, operand, w)
+
+    if base in _shift_ops:
+        if len(operands) == 1:
+            operands = [Immediate(1), operands[0]]
+        count, dest = operands
+        n = _shift_ops[base]
+        if isinstance(count, Register) and count.number == 1 and count.size == 8:
+            return _modrm(b'\xd2' if size == 8 else b'\xd3', n, dest, w)
+        if not isinstance(count, Immediate):
+            raise AssemblerError('Shift count must be an immediate or %cl')
+        if count.expression is None and count.value == 1:
+            return _modrm(b'\xd0' if size == 8 else b'\xd1', n, dest, w)
+        return _modrm(b'\xc0' if size == 8 else b'\xc1', n, dest, w, _immediate(count, 1))
+
+    if base == 'imul':
+        if len(operands) == 1:
+            return _modrm(b'\xf7', 5, operands[0], w)
+        if len(operands) == 2:
+            source, dest = operands
+            if isinstance(source, Immediate):
+                operands = [source, dest, dest]
+            elif isinstance(dest, Register):
+                return _modrm(b'\x0f\xaf', dest.number, source, w)
+        if len(operands) == 3:
+            factor, source, dest = operands
+            if isinstance(factor, Immediate) and isinstance(dest, Register):
+                if factor.expression is None and -128 <= factor.value <= 127:
+                    return _modrm(b'\x6b', dest.number, source, w, _immediate(factor, 1))
+                return _modrm(b'\x69', dest.number, source, w, _immediate(factor, 4))
+        raise AssemblerError(f'Invalid operands for {mnemonic}')
+
+    if base == 'push':
+        [operand] = operands
+        if isinstance(operand, Register):
+            return _prefixed(bytes([0x50 + (operand.number & 7)]), False, b=operand.number >> 3)
+        if isinstance(operand, Immediate):
+            if operand.expression is None and -128 <= operand.value <= 127:
+                return _Encoding(b'\x6a' + _immediate(operand, 1).code, [])
+            imm = _immediate(operand, 4)
+            return _Encoding(b'\x68' + imm.code, [(1 + o, s, e, p) for o, s, e, p in imm.fixups])
+        return _modrm(b'\xff', 6, operand, False)
+
+    if base == 'pop':
+        [operand] = operands
+        if isinstance(operand, Register):
+            return _prefixed(bytes([0x58 + (operand.number & 7)]), False, b=operand.number >> 3)
+        return _modrm(b'\x8f', 0, operand, False)
+
+    raise AssemblerError(f'Unsupported instruction: {mnemonic}')
+
+
+def _immediate(operand: Immediate, size: int, sign_extended: bool = True) -> _Encoding:
+    """Encodes an immediate of `size` bytes.
+
+    Immediates of 64-bit instructions are sign-extended by the CPU, so unless
+    `sign_extended` is False they must fit in the signed range.
+    """
+    if operand.expression is not None:
+        return _Encoding(bytes(size), [(0, size, operand.expression, False)])
+    value = operand.value
+    upper_limit = 2**(8 * size - 1) if sign_extended else 2**(8 * size)
+    if size < 8 and not -2**(8 * size - 1) <= value < upper_limit:
+        raise AssemblerError(f'Immediate {value} does not fit in {size} bytes')
+    if size == 8 and value >= 2**63:
+        return _Encoding(value.to_bytes(8, 'little'))
+    if value >= 2**(8 * size - 1):
+        value -= 2**(8 * size)
+    return _Encoding(value.to_bytes(size, 'little', signed=True))
+
+
+def _move_imm64(source: Immediate, dest: Register) -> _Encoding:
+    return _prefixed(bytes([0xb8 + (dest.number & 7)]), True, _immediate(source, 8), b=dest.number >> 3)
+
+
+def _rex(w: bool, r: int, x: int, b: int, force: bool) -> bytes:
+    rex = 0x40 | (w << 3) | ((r & 1) << 2) | ((x & 1) << 1) | (b & 1)
+    if rex != 0x40 or force:
+        return bytes([rex])
+    return b''
+
+
+def _prefixed(opcode: bytes, w: bool, imm: _Encoding | None = None, b: int = 0) -> _Encoding:
+    """Encodes an instruction without a ModRM byte."""
+    code = _rex(w, 0, 0, b, False) + opcode
+    fixups = []
+    if imm is not None:
+        fixups = [(len(code) + o, s, e, p) for o, s, e, p in imm.fixups]
+        code += imm.code
+    return _Encoding(code, fixups)
+
+
+def _needs_rex(register: Register) -> bool:
+    """Whether the register is one of spl, bpl, sil and dil, which can only be encoded with a REX prefix."""
+    return register.size == 8 and 4 <= register.number <= 7
+
+
+def _modrm(
+    opcode: bytes,
+    reg: int,
+    rm: Operand,
+    w: bool,
+    imm: _Encoding | None = None,
+    force_rex: bool = False,
+) -> _Encoding:
+    """Encodes an instruction with a ModRM byte addressing `rm`.
+
+    `reg` is either a register number or an opcode extension.
+    """
+    force_rex = force_rex or (isinstance(rm, Register) and _needs_rex(rm))
+    fixups: list[tuple[int, int, Expression, bool]] = []
+    x = 0
+    b = 0
+    sib = b''
+    displacement = b''
+    if isinstance(rm, Register):
+        modrm = 0xc0 | ((reg & 7) << 3) | (rm.number & 7)
+        b = rm.number >> 3
+    elif isinstance(rm, Memory):
+        expression = rm.expression
+        if expression is not None and rm.displacement:
+            expression = expression + [(1, str(rm.displacement))]
+        if rm.rip_relative:
+            modrm = ((reg & 7) << 3) | 5
+            displacement = bytes(4)
+            fixups.append((0, 4, expression or [(1, str(rm.displacement))], True))
+        elif rm.base is None and rm.index is None:
+            # Absolute 32-bit address
+            modrm = ((reg & 7) << 3) | 4
+            sib = bytes([0x25])
+            displacement = bytes(4)
+            fixups.append((0, 4, expression or [(1, str(rm.displacement))], False))
+        else:
+            base = rm.base.number if rm.base is not None else 5
+            if expression is not None:
+                mod = 2
+            elif rm.base is None:
+                mod = 0  # Index without base always takes a 32-bit displacement
+            elif rm.displacement == 0 and base & 7 != 5:
+                mod = 0
+            elif -128 <= rm.displacement <= 127:
+                mod = 1
+            else:
+                mod = 2
+            if rm.index is not None or base & 7 == 4:
+                if rm.index is not None and rm.index.number == 4:
+                    raise AssemblerError('%rsp cannot be an index register')
+                index = rm.index.number if rm.index is not None else 4
+                scale_bits = {1: 0, 2: 1, 4: 2, 8: 3}[rm.scale]
+                modrm = (mod << 6) | ((reg & 7) << 3) | 4
+                sib = bytes([(scale_bits << 6) | ((index & 7) << 3) | (base & 7)])
+                x = index >> 3
+            else:
+                modrm = (mod << 6) | ((reg & 7) << 3) | (base & 7)
+            b = base >> 3 if rm.base is not None else 0
+            if expression is not None:
+                displacement = bytes(4)
+                fixups.append((0, 4, expression, False))
+            elif mod == 1:
+                displacement = struct.pack('<b', rm.displacement)
+            elif mod == 2 or rm.base is None:
+                displacement = struct.pack('<i', rm.displacement)
+    else:
+        raise AssemblerError('Expected a register or memory operand')
+
+    code = _rex(w, reg >> 3, x, b, force_rex) + opcode + bytes([modrm]) + sib
+    fixups = [(len(code) + o, s, e, p) for o, s, e, p in fixups]
+    code += displacement
+    if imm is not None:
+        fixups += [(len(code) + o, s, e, p) for o, s, e, p in imm.fixups]
+        code += imm.code
+    return _Encoding(code, fixups)
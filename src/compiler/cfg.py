@@ -0,0 +1,177 @@
+from compiler import ir
+
+
+class ControlFlowGraph:
+    """The basic blocks of an IR instruction list and the control flow between them.
+
+    Blocks are numbered by their position in the instruction list, and block 0
+    is the entry. `blocks[b]` holds block b's instructions, starting with its
+    label if it has one and ending with its jump if it has one. A block
+    without a jump at the end falls through to block b + 1. Edges are kept
+    in adjacency lists of block numbers: `succs[b]` and `preds[b]`.
+    Blocks that can't be reached from the entry are kept but have no
+    predecessors.
+    """
+    blocks: list[list[ir.Instruction]]
+    succs: list[list[int]]
+    preds: list[list[int]]
+
+    def __init__(self, blocks: list[list[ir.Instruction]]) -> None:
+        self.blocks = blocks
+        block_of_label: dict[str, int] = {}
+        for b, block in enumerate(blocks):
+            if block and isinstance(block[0], ir.Label):
+                block_of_label[block[0].name] = b
+
+        self.succs = []
+        for b, block in enumerate(blocks):
+            last = block[-1] if block else None
+            match last:
+                case ir.Jump():
+                    succs = [block_of_label[last.label.name]]
+                case ir.CondJump():
+                    succs = [block_of_label[last.then_label.name]]
+                    if last.else_label.name != last.then_label.name:
+                        succs.append(block_of_label[last.else_label.name])
+                case _:
+                    succs = [b + 1] if b + 1 < len(blocks) else []
+            self.succs.append(succs)
+
+        self.preds = [[] for _ in blocks]
+        for b, succs in enumerate(self.succs):
+            for s in succs:
+                self.preds[s].append(b)
+
+    def label(self, b: int) -> ir.Label | None:
+        """Returns the label at the start of block `b`, if it has one."""
+        block = self.blocks[b]
+        return block[0] if block and isinstance(block[0], ir.Label) else None
+
+    def reverse_postorder(self) -> list[int]:
+        """Returns the blocks reachable from the entry in reverse postorder.
+
+        Every block comes before its successors, except along loop back edges.
+        Successors are explored last to first, so a block's first successor
+        (the `then` branch or loop body) comes right after it, ahead of the
+        code after a loop.
+        """
+        if not self.blocks:
+            return []
+        postorder: list[int] = []
+        visited = [False] * len(self.blocks)
+        visited[0] = True
+        # Iterative depth-first search, so deep programs don't hit the recursion limit
+        stack = [(0, 0)]
+        while stack:
+            b, explored = stack[-1]
+            succs = self.succs[b]
+            if explored < len(succs):
+                stack[-1] = (b, explored + 1)
+                s = succs[len(succs) - 1 - explored]
+                if not visited[s]:
+                    visited[s] = True
+                    stack.append((s, 0))
+            else:
+                stack.pop()
+                postorder.append(b)
+        postorder.reverse()
+        return postorder
+
+    def dominators(self) -> list[int]:
+        """Returns the immediate dominator of every block, or -1 for unreachable blocks.
+
+        The entry is its own immediate dominator. Uses the iterative algorithm
+        of Cooper, Harvey and Kennedy ("A Simple, Fast Dominance Algorithm").
+        """
+        order = self.reverse_postorder()
+        rpo_number = [-1] * len(self.blocks)
+        for i, b in enumerate(order):
+            rpo_number[b] = i
+        idom = [-1] * len(self.blocks)
+        if not order:
+            return idom
+        idom[0] = 0
+
+        def intersect(a: int, b: int) -> int:
+            while a != b:
+                while rpo_number[a] > rpo_number[b]:
+                    a = idom[a]
+                while rpo_number[b] > rpo_number[a]:
+                    b = idom[b]
+            return a
+
+        changed = True
+        while changed:
+            changed = False
+            for b in order[1:]:
+                new_idom = -1
+                for p in self.preds[b]:
+                    if idom[p] == -1:
+                        continue
+                    new_idom = p if new_idom == -1 else intersect(p, new_idom)
+                if idom[b] != new_idom:
+                    idom[b] = new_idom
+                    changed = True
+        return idom
+
+    def linearize(self, order: list[int] | None = None) -> list[ir.Instruction]:
+        """Returns the blocks as an instruction list again.
+
+        Blocks are placed in `order` (default: their original order), and
+        blocks left out of it are dropped. Where a block falls through to a
+        block that isn't placed right after it, a jump is added, and jumps
+        to the block placed right after are removed.
+        """
+        if order is None:
+            order = list(range(len(self.blocks)))
+        labels = [self.label(b) for b in range(len(self.blocks))]
+
+        def label_of(b: int) -> ir.Label:
+            label = labels[b]
+            if label is None:
+                label = labels[b] = ir.Label(f'block{b}')
+            return label
+
+        # Jumps need labels on their targets, so find all of them first
+        for i, b in enumerate(order):
+            block = self.blocks[b]
+            next_block = order[i + 1] if i + 1 < len(order) else None
+            falls_through = not block or not isinstance(block[-1], (ir.Jump, ir.CondJump))
+            if falls_through and self.succs[b] and self.succs[b][0] != next_block:
+                label_of(self.succs[b][0])
+
+        result: list[ir.Instruction] = []
+        for i, b in enumerate(order):
+            block = self.blocks[b]
+            next_block = order[i + 1] if i + 1 < len(order) else None
+            label = labels[b]
+            if label is not None and self.label(b) is None:
+                result.append(label)
+            last = block[-1] if block else None
+            if isinstance(last, ir.Jump) and self.succs[b][0] == next_block:
+                result.extend(block[:-1])
+            else:
+                result.extend(block)
+            if not isinstance(last, (ir.Jump, ir.CondJump)) and self.succs[b] and self.succs[b][0] != next_block:
+                result.append(ir.Jump(label_of(self.succs[b][0])))
+        return result
+
+
+def build_cfg(instructions: list[ir.Instruction]) -> ControlFlowGraph:
+    """Splits the instructions into basic blocks and connects them.
+
+    A block starts at every label and after every jump.
+    """
+    blocks: list[list[ir.Instruction]] = []
+    current: list[ir.Instruction] = []
+    for insn in instructions:
+        if isinstance(insn, ir.Label) and current:
+            blocks.append(current)
+            current = []
+        current.append(insn)
+        if isinstance(insn, (ir.Jump, ir.CondJump)):
+            blocks.append(current)
+            current = []
+    if current:
+        blocks.append(current)
+    return ControlFlowGraph(blocks)
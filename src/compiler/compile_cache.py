@@ -0,0 +1,183 @@
+import atexit
+import collections
+import fcntl
+import functools
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+
+@functools.cache
+def compiler_version() -> str:
+    """Returns a hash of the compiler's own source code.
+
+    Any change to the compiler invalidates everything cached by older versions.
+    """
+    h = hashlib.sha256()
+    package_dir = Path(__file__).parent
+    for source_file in sorted(package_dir.glob('*.py')):
+        h.update(source_file.name.encode())
+        h.update(source_file.read_bytes())
+    return h.hexdigest()
+
+
+class CompileCache:
+    """An on-disk cache of compiled executables, keyed by a hash of the source code.
+
+    Entries are evicted least recently used first once the total size of the
+    cached files exceeds `max_bytes`. Hit and miss counts are kept both for
+    this process and, in `stats.json`, for every process sharing the directory.
+    Updates to `stats.json` are batched, so that lookups in different
+    processes don't wait for each other's lock; call `flush_stats` to write
+    them out. They are also written at exit.
+    """
+    directory: Path
+    max_bytes: int
+    store_assembly: bool
+    hits: int
+    misses: int
+    # Counts not yet added to `stats.json`, by the process in `_pending_pid`
+    _pending: collections.Counter[str]
+    _pending_pid: int
+    _last_flush: float
+
+    # Pending counts are written after this many lookups or seconds
+    stats_batch_size = 100
+    stats_batch_seconds = 1.0
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024, store_assembly: bool = False) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.store_assembly = store_assembly
+        self.hits = 0
+        self.misses = 0
+        self._pending = collections.Counter()
+        self._pending_pid = os.getpid()
+        self._last_flush = time.monotonic()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        atexit.register(self.flush_stats)
+
+    def key(self, source_code: str, flags: str = '') -> str:
+        """Returns the cache key for compiling `source_code` with the given flags."""
+        h = hashlib.sha256()
+        for part in [compiler_version(), flags, source_code]:
+            h.update(part.encode())
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def get(self, key: str) -> bytes | None:
+        """Returns the cached executable, or None on a cache miss."""
+        path = self._path(key, '.bin')
+        try:
+            executable = path.read_bytes()
+            # The modification time doubles as the last access time for LRU eviction.
+            # Unlike `touch`, `utime` never recreates an entry evicted in the meantime.
+            os.utime(path)
+        except FileNotFoundError:
+            executable = b''
+        if not executable:
+            # Entries are never empty, so an empty file is not a complete entry
+            self.misses += 1
+            self._record('misses')
+            return None
+        self.hits += 1
+        self._record('hits')
+        return executable
+
+    def get_assembly(self, key: str) -> str | None:
+        """Returns the cached assembly code, if it was stored."""
+        try:
+            return self._path(key, '.s').read_text()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, executable: bytes, assembly_code: str | None = None) -> None:
+        """Stores a compiled executable, evicting old entries if the cache gets too big."""
+        if self.store_assembly and assembly_code is not None:
+            self._write(self._path(key, '.s'), assembly_code.encode())
+        self._write(self._path(key, '.bin'), executable)
+        self._evict()
+
+    def stats(self) -> dict[str, Any]:
+        """Returns hit/miss counters for this process and for all processes using the cache."""
+        self.flush_stats()
+        entries = self._entries()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'total': self._read_stats(),
+            'entries': len([e for e in entries if e.suffix == '.bin']),
+            'size_bytes': sum(e.stat().st_size for e in entries),
+            'max_bytes': self.max_bytes,
+        }
+
+    def _path(self, key: str, suffix: str) -> Path:
+        return self.directory / f'{key}{suffix}'
+
+    def _write(self, path: Path, data: bytes) -> None:
+        # Write to a temporary file first so readers never see a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def _entries(self) -> list[Path]:
+        return [p for p in self.directory.iterdir() if p.suffix in ('.bin', '.s')]
+
+    def _evict(self) -> None:
+        entries = []
+        for p in self._entries():
+            try:
+                st = p.stat()
+            except FileNotFoundError:
+                continue  # Evicted concurrently by another process
+            entries.append((st.st_mtime, st.st_size, p))
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+
+    def _read_stats(self) -> dict[str, int]:
+        try:
+            with open(self.directory / 'stats.json') as f:
+                fcntl.flock(f, fcntl.LOCK_SH)
+                return json.loads(f.read() or '{}')
+        except FileNotFoundError:
+            return {}
+
+    def flush_stats(self) -> None:
+        """Adds the counts recorded since the last flush to `stats.json`."""
+        if os.getpid() != self._pending_pid or not self._pending:
+            return
+        try:
+            with open(self.directory / 'stats.json', 'a+') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                f.seek(0)
+                stats = json.loads(f.read() or '{}')
+                for counter, n in self._pending.items():
+                    stats[counter] = stats.get(counter, 0) + n
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(stats))
+        except FileNotFoundError:
+            pass  # The cache directory was deleted
+        self._pending.clear()
+        self._last_flush = time.monotonic()
+
+    def _record(self, counter: str) -> None:
+        if os.getpid() != self._pending_pid:
+            # A forked child starts with a copy of the parent's pending counts,
+            # which the parent will write itself
+            self._pending.clear()
+            self._pending_pid = os.getpid()
+            self._last_flush = time.monotonic()
+        self._pending[counter] += 1
+        if (self._pending.total() >= self.stats_batch_size
+                or time.monotonic() - self._last_flush >= self.stats_batch_seconds):
+            self.flush_stats()
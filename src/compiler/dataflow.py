@@ -0,0 +1,254 @@
+"""Dataflow analyses over the basic blocks of the IR.
+
+Sets of variables and of definitions are Python ints used as bitsets: bit
+`n` is set if the set contains variable (or definition) number `n`. Union,
+intersection and difference are then single `|`, `&` and `& ~` operations
+however many variables the program has, and comparing two sets is one `==`.
+
+`solve` is a generic worklist solver for the equations
+
+    out[b] = gen[b] | (in[b] & ~kill[b])
+
+over a `ControlFlowGraph`, in either direction. `liveness` and
+`reaching_definitions` are built on it.
+"""
+import dataclasses
+import heapq
+from typing import Iterator
+
+from compiler import ir
+from compiler.cfg import ControlFlowGraph
+
+
+def uses_and_defs(insn: ir.Instruction) -> tuple[list[ir.IRvar], list[ir.IRvar]]:
+    """Returns the variables read and written by an instruction."""
+    match insn:
+        case ir.Call():
+            return list(insn.args), [insn.dest]
+        case ir.LoadIntConst() | ir.LoadBoolConst():
+            return [], [insn.dest]
+        case ir.Copy():
+            return [insn.source], [insn.dest]
+        case ir.CondJump():
+            return [insn.cond], []
+        case _:
+            return [], []
+
+
+def bits(bitset: int) -> Iterator[int]:
+    """Yields the numbers of the set bits, lowest first."""
+    while bitset:
+        lowest = bitset & -bitset
+        yield lowest.bit_length() - 1
+        bitset ^= lowest
+
+
+def global_names(cfg: ControlFlowGraph) -> dict[ir.IRvar, int]:
+    """Numbers the variables that some block reads before assigning them.
+
+    Only these can carry a value from one block to another. The rest, mostly
+    temporaries of a single expression, are left out of the bitsets, which
+    keeps the sets as narrow as the number of variables that matter.
+    Numbers are given in order of first appearance.
+    """
+    numbers: dict[ir.IRvar, int] = {}
+    for block in cfg.blocks:
+        assigned: set[ir.IRvar] = set()
+        for insn in block:
+            uses, defs = uses_and_defs(insn)
+            for var in uses:
+                if var not in assigned and var not in numbers:
+                    numbers[var] = len(numbers)
+            assigned.update(defs)
+    return numbers
+
+
+@dataclasses.dataclass
+class DataflowResult:
+    """The fixed point found by `solve`: the set at the start and end of every block.
+
+    For a backward analysis, `block_in[b]` is still the set at the start of
+    block b, i.e. the one computed from the blocks after it.
+    """
+    block_in: list[int]
+    block_out: list[int]
+    # How many times a block's transfer function was applied
+    steps: int
+
+
+def solve(
+    cfg: ControlFlowGraph,
+    gen: list[int],
+    kill: list[int],
+    forward: bool,
+    intersect: bool = False,
+    universe: int = 0,
+) -> DataflowResult:
+    """Solves a gen/kill dataflow problem with a worklist.
+
+    The sets flowing into a block are combined with union, or with
+    intersection if `intersect` is set, in which case `universe` must be the
+    set of everything and is the starting guess for every block with
+    incoming edges. Nothing flows into the others, or into the entry of a
+    forward intersection problem. Blocks are
+    processed in reverse postorder (postorder for backward problems), so
+    that on loop-free code every block is processed once, and a block is
+    only processed again when the set flowing into it changes.
+    """
+    n = len(cfg.blocks)
+    order = cfg.reverse_postorder()
+    reachable = set(order)
+    # Unreachable blocks still get analyzed, since their code is still generated
+    order += [b for b in range(n) if b not in reachable]
+    if forward:
+        incoming, outgoing = cfg.preds, cfg.succs
+    else:
+        order.reverse()
+        incoming, outgoing = cfg.succs, cfg.preds
+
+    # Nothing is known on entry to the program, even if the entry block is a
+    # loop header. With union this changes nothing, but with intersection
+    # the entry's predecessors mustn't count.
+    boundary = [not incoming[b] for b in range(n)]
+    if forward and intersect and n > 0:
+        boundary[0] = True
+    # `before` is the side the edges flow into, `after` the side the transfer function computes
+    before = [universe if intersect and not boundary[b] else 0 for b in range(n)]
+    after = [gen[b] | (before[b] & ~kill[b]) for b in range(n)]
+
+    # Always take the queued block that comes first in `order`, so that a loop
+    # settles before the blocks after it see its result. A plain FIFO queue
+    # would sweep through all the later blocks again after every loop.
+    position = [0] * n
+    for i, b in enumerate(order):
+        position[b] = i
+    worklist = list(range(n))
+    queued = [True] * n
+    steps = 0
+    while worklist:
+        b = order[heapq.heappop(worklist)]
+        queued[b] = False
+        steps += 1
+        sources = incoming[b]
+        if not boundary[b]:
+            combined = after[sources[0]]
+            for p in sources[1:]:
+                if intersect:
+                    combined &= after[p]
+                else:
+                    combined |= after[p]
+            before[b] = combined
+        new_after = gen[b] | (before[b] & ~kill[b])
+        if new_after != after[b]:
+            after[b] = new_after
+            for s in outgoing[b]:
+                if not queued[s]:
+                    queued[s] = True
+                    heapq.heappush(worklist, position[s])
+
+    if forward:
+        return DataflowResult(block_in=before, block_out=after, steps=steps)
+    return DataflowResult(block_in=after, block_out=before, steps=steps)
+
+
+@dataclasses.dataclass
+class Liveness:
+    """Which variables are live at the start and end of each block.
+
+    Bit `n` of a set stands for the variable numbered `n` in `variables`,
+    which has the `global_names` of the graph. No other variable is live at
+    the start or end of any block.
+    """
+    variables: dict[ir.IRvar, int]
+    live_in: list[int]
+    live_out: list[int]
+    _names: list[ir.IRvar] = dataclasses.field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self._names = list(self.variables)
+
+    def variables_in(self, bitset: int) -> set[ir.IRvar]:
+        """Turns a bitset of variable numbers back into variables."""
+        return {self._names[n] for n in bits(bitset)}
+
+
+def liveness(cfg: ControlFlowGraph) -> Liveness:
+    """Computes the variables whose current value may still be read later.
+
+    A variable is live at a point if some path from there reads it before
+    assigning it.
+    """
+    numbers = global_names(cfg)
+    upward_exposed: list[int] = []
+    assigned: list[int] = []
+    for block in cfg.blocks:
+        use = 0
+        define = 0
+        for insn in reversed(block):
+            uses, defs = uses_and_defs(insn)
+            for var in defs:
+                n = numbers.get(var)
+                if n is not None:
+                    define |= 1 << n
+                    use &= ~(1 << n)
+            for var in uses:
+                n = numbers.get(var)
+                if n is not None:
+                    use |= 1 << n
+        upward_exposed.append(use)
+        assigned.append(define)
+
+    result = solve(cfg, gen=upward_exposed, kill=assigned, forward=False)
+    return Liveness(variables=numbers, live_in=result.block_in, live_out=result.block_out)
+
+
+@dataclasses.dataclass(frozen=True)
+class Definition:
+    """An instruction assigning `var`: the `index`th instruction of `block`."""
+    var: ir.IRvar
+    block: int
+    index: int
+
+
+@dataclasses.dataclass
+class ReachingDefinitions:
+    """Which definitions may reach the start and end of each block.
+
+    Bit `n` of a set stands for `definitions[n]`.
+    """
+    definitions: list[Definition]
+    reach_in: list[int]
+    reach_out: list[int]
+
+    def definitions_in(self, bitset: int) -> list[Definition]:
+        return [self.definitions[n] for n in bits(bitset)]
+
+
+def reaching_definitions(cfg: ControlFlowGraph) -> ReachingDefinitions:
+    """Computes the assignments whose value a variable may still hold at each block.
+
+    A definition reaches a point if some path from it to the point doesn't
+    assign its variable again. Only assignments to `global_names` are
+    tracked, since the others are never read outside their own block.
+    """
+    numbers = global_names(cfg)
+    definitions: list[Definition] = []
+    definitions_of: dict[ir.IRvar, int] = {}
+    for b, block in enumerate(cfg.blocks):
+        for i, insn in enumerate(block):
+            for var in uses_and_defs(insn)[1]:
+                if var not in numbers:
+                    continue
+                definitions_of[var] = definitions_of.get(var, 0) | 1 << len(definitions)
+                definitions.append(Definition(var, b, i))
+
+    gen = [0] * len(cfg.blocks)
+    kill = [0] * len(cfg.blocks)
+    for n, definition in enumerate(definitions):
+        b = definition.block
+        # Definitions are in program order, so a later one in the block replaces this one
+        gen[b] = (gen[b] & ~definitions_of[definition.var]) | 1 << n
+        kill[b] |= definitions_of[definition.var]
+
+    result = solve(cfg, gen=gen, kill=kill, forward=True)
+    return ReachingDefinitions(definitions=definitions, reach_in=result.block_in, reach_out=result.block_out)
@@ -0,0 +1,51 @@
+"""Integer arithmetic with the semantics of the x86-64 instructions the compiler emits.
+
+Values are signed 64-bit integers: results wrap around like `addq`, `subq`,
+`imulq` and `negq` do, and division truncates toward zero like `idivq`.
+`parse_int` reads input the way the stdlib's `read_int` does.
+"""
+
+INT_MIN = -2**63
+INT_MAX = 2**63 - 1
+
+
+def wrap(value: int) -> int:
+    """Wraps an integer around to 64 bits."""
+    if INT_MIN <= value <= INT_MAX:
+        return value
+    return ((value - INT_MIN) & 0xFFFF_FFFF_FFFF_FFFF) + INT_MIN
+
+
+def division_traps(a: int, b: int) -> bool:
+    """Whether `idivq` raises a divide error (SIGFPE) for `a / b`: on division by zero or overflow."""
+    return b == 0 or (a == INT_MIN and b == -1)
+
+
+def divide(a: int, b: int) -> int:
+    """The quotient of `idivq`, truncated toward zero. Check `division_traps` first."""
+    quotient = abs(a) // abs(b)
+    return -quotient if (a < 0) != (b < 0) else quotient
+
+
+def remainder(a: int, b: int) -> int:
+    """The remainder of `idivq`, with the sign of `a`. Check `division_traps` first."""
+    return a - divide(a, b) * b
+
+
+def parse_int(line: str) -> int:
+    """Parses a line of input like the stdlib's `read_int`.
+
+    Characters other than digits are skipped, and each minus sign flips the sign.
+    """
+    stripped = line.strip()
+    # `isdigit` alone also accepts digits of other scripts, which the stdlib skips
+    if stripped.isascii() and stripped.isdigit():
+        return wrap(int(stripped))
+    negative = False
+    value = 0
+    for char in line:
+        if char == '-':
+            negative = not negative
+        elif '0' <= char <= '9':
+            value = value * 10 + ord(char) - 48
+    return wrap(-value if negative else value)
@@ -1,9 +1,16 @@
+import operator
+import signal
+import sys
 from typing import Any, Optional, Callable
 import compiler.ast as ast
 
 from compiler.SymTab import SymTab
+from compiler.int64 import divide, division_traps, parse_int, remainder, wrap
+from compiler.resolver import new_frames, resolve
+from compiler.vm import Trap
 
 type Value = int | bool | None
+type Frames = list[list[Any]]
 
 class BreakException(Exception):
     def __init__(self, value: Optional[Value] = None) -> None:
@@ -12,55 +19,311 @@ class BreakException(Exception):
 class ContinueException(Exception):
     pass
 
-def interpret(node: Optional[ast.Expression], symtab: SymTab) -> Value:
+
+def _print_int(value: Value) -> None:
+    sys.stdout.write(f'{value}\n')
+
+
+def _print_bool(value: Value) -> None:
+    sys.stdout.write('true\n' if value else 'false\n')
+
+
+def _read_int() -> Value:
+    line = sys.stdin.readline()
+    if not line:
+        raise EOFError("read_int: end of input")
+    return parse_int(line)
+
+
+# The functions a program can call, by name
+builtin_functions: dict[str, Callable[..., Value]] = {
+    'print_int': _print_int,
+    'print_bool': _print_bool,
+    'read_int': _read_int,
+}
+
+
+def _divide(a: int, b: int) -> int:
+    if division_traps(a, b):
+        raise Trap(signal.SIGFPE, 'Floating point exception')
+    return divide(a, b)
+
+
+def _remainder(a: int, b: int) -> int:
+    if division_traps(a, b):
+        raise Trap(signal.SIGFPE, 'Floating point exception')
+    return remainder(a, b)
+
+
+# The operators, computed like the compiled program computes them (see `compiler.int64`)
+binary_operators: dict[str, Callable[[Any, Any], Value]] = {
+    '+': lambda a, b: wrap(a + b),
+    '-': lambda a, b: wrap(a - b),
+    '*': lambda a, b: wrap(a * b),
+    '/': _divide,
+    '%': _remainder,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+unary_operators: dict[str, Callable[[Any], Value]] = {
+    '-': lambda a: wrap(-a),
+    'not': operator.not_,
+}
+
+
+def _function_name(node: ast.FunctionCall) -> str:
+    if not isinstance(node.name, ast.Identifier) or node.name.name not in builtin_functions:
+        raise NameError(f"Unknown function {node.name}")
+    return node.name.name
+
+
+def interpret(node: Optional[ast.Expression], symtab: SymTab, frames: Frames | None = None) -> Value:
+    """Evaluates the AST by walking it.
+
+    Variables live in `frames`, at the slots found by `resolve`. If no frames
+    are given, the program is resolved and gets new ones. Names the program
+    doesn't declare are looked up in `symtab`.
+    """
+    if frames is None:
+        frames = new_frames(resolve(node)) if node is not None else []
+
     match node:
         case ast.Literal():
             return node.value
 
+        case ast.Identifier():
+            if node.slot is None:
+                return symtab.lookup_variable(node.name)
+            depth, index = node.slot
+            return frames[depth][index]  # type: ignore[no-any-return]
+
         case ast.BinaryOp():
             if node.op == "=":
                 # 确保左侧是标识符
                 if isinstance(node.left, ast.Identifier):
                     # 计算右侧表达式的值
-                    value = interpret(node.right, symtab)
+                    value = interpret(node.right, symtab, frames)
                     # 更新现有变量的值
-                    symtab.update_variable(node.left.name, value)
+                    _assign(node.left, value, symtab, frames)
                     return value
                 else:
                     raise TypeError("Left side of assignment must be an identifier.")
             if node.op == 'and':
-                left_value = interpret(node.left, symtab)
+                left_value = interpret(node.left, symtab, frames)
                 if not left_value:  # 如果左侧为假，则不需要评估右侧
                     return False
-                return interpret(node.right, symtab)
+                return interpret(node.right, symtab, frames)
             elif node.op == 'or':
-                left_value = interpret(node.left, symtab)
+                left_value = interpret(node.left, symtab, frames)
                 if left_value:  # 如果左侧为真，则不需要评估右侧
                     return True
-                return interpret(node.right, symtab)
+                return interpret(node.right, symtab, frames)
             else:
-                a: Value = interpret(node.left, symtab)
-                b: Value = interpret(node.right, symtab)
-                op_func = symtab.lookup_variable(node.op)
-                return op_func(a, b)
+                a: Value = interpret(node.left, symtab, frames)
+                b: Value = interpret(node.right, symtab, frames)
+                return binary_operators[node.op](a, b)
+
+        case ast.Assignment():
+            value = interpret(node.value, symtab, frames)
+            _assign(node.target, value, symtab, frames)
+            return value
+
+        case ast.VariableDeclaration():
+            assert node.name.slot is not None
+            depth, index = node.name.slot
+            frames[depth][index] = interpret(node.value, symtab, frames)
+            return None
+
+        case ast.Block():
+            for expr in node.expressions:
+                interpret(expr, symtab, frames)
+            return interpret(node.result_expression, symtab, frames)
 
         case ast.IfExpression():
-            if interpret(node.condition, symtab):
-                return interpret(node.then_branch,symtab)
+            if interpret(node.condition, symtab, frames):
+                return interpret(node.then_branch, symtab, frames)
             else:
-                return interpret(node.else_branch,symtab)
-        
+                return interpret(node.else_branch, symtab, frames)
+
+        case ast.WhileExpr():
+            while interpret(node.condition, symtab, frames):
+                try:
+                    interpret(node.body, symtab, frames)
+                except BreakException:
+                    break
+                except ContinueException:
+                    continue
+            return None
+
+        case ast.FunctionCall():
+            func = builtin_functions[_function_name(node)]
+            return func(*[interpret(arg, symtab, frames) for arg in node.arguments])
+
         case ast.UnaryOp():
-            operand_val: Value = interpret(node.operand, symtab)
-            op_func = symtab.lookup_variable(f"unary_{node.op}")
-            return op_func(operand_val)
-        
+            operand_val: Value = interpret(node.operand, symtab, frames)
+            return unary_operators[node.op](operand_val)
+
         case ast.Break(value):
             # if break has value, return optional value
-            raise BreakException(interpret(value, symtab) if value else None)
+            raise BreakException(interpret(value, symtab, frames) if value else None)
         case ast.Continue():
             raise ContinueException()
-    
+
+        case None:
+            # A missing `else` branch or block result
+            return None
 
         case _:
             raise ValueError(f"Unknown AST node {node}")
+
+
+def _assign(target: ast.Identifier, value: Value, symtab: SymTab, frames: Frames) -> None:
+    if target.slot is None:
+        symtab.update_variable(target.name, value)
+    else:
+        depth, index = target.slot
+        frames[depth][index] = value
+
+
+type Thunk = Callable[[], Value]
+
+
+def compile_closure(node: Optional[ast.Expression], symtab: SymTab, frames: Frames | None = None) -> Thunk:
+    """Compiles the AST into nested Python closures that evaluate it like `interpret`.
+
+    Operators are looked up once, while compiling, and each variable access
+    is bound to its frame and index, so running the returned closure does no
+    dispatch on node types and no symbol table lookups.
+    Compile once and call the result as often as needed.
+    """
+    if frames is None:
+        frames = new_frames(resolve(node)) if node is not None else []
+
+    def compile(node: Optional[ast.Expression]) -> Thunk:
+        match node:
+            case ast.Literal():
+                value = node.value
+                return lambda: value
+
+            case ast.Identifier():
+                if node.slot is None:
+                    name = node.name
+                    return lambda: symtab.lookup_variable(name)
+                depth, index = node.slot
+                frame = frames[depth]
+                return lambda: frame[index]
+
+            case ast.BinaryOp():
+                if node.op == "=":
+                    if not isinstance(node.left, ast.Identifier):
+                        raise TypeError("Left side of assignment must be an identifier.")
+                    return compile_assignment(node.left, node.right)
+                left = compile(node.left)
+                right = compile(node.right)
+                if node.op == 'and':
+                    return lambda: right() if left() else False
+                if node.op == 'or':
+                    return lambda: True if left() else right()
+                op_func = binary_operators[node.op]
+                if isinstance(node.right, ast.Literal):
+                    # Common in loops like `i + 1`: skip a call for the constant
+                    constant = node.right.value
+                    return lambda: op_func(left(), constant)
+                return lambda: op_func(left(), right())
+
+            case ast.Assignment():
+                return compile_assignment(node.target, node.value)
+
+            case ast.VariableDeclaration():
+                assert node.name.slot is not None
+                depth, index = node.name.slot
+                frame = frames[depth]
+                initializer = compile(node.value)
+                def declare() -> Value:
+                    frame[index] = initializer()
+                    return None
+                return declare
+
+            case ast.Block():
+                expressions = [compile(expr) for expr in node.expressions]
+                result = compile(node.result_expression)
+                def block() -> Value:
+                    for expr in expressions:
+                        expr()
+                    return result()
+                return block
+
+            case ast.IfExpression():
+                condition = compile(node.condition)
+                then_branch = compile(node.then_branch)
+                else_branch = compile(node.else_branch)
+                return lambda: then_branch() if condition() else else_branch()
+
+            case ast.WhileExpr():
+                loop_condition = compile(node.condition)
+                body = compile(node.body)
+                def loop() -> Value:
+                    while loop_condition():
+                        try:
+                            body()
+                        except BreakException:
+                            break
+                        except ContinueException:
+                            continue
+                    return None
+                return loop
+
+            case ast.FunctionCall():
+                func = builtin_functions[_function_name(node)]
+                args = [compile(arg) for arg in node.arguments]
+                if not args:
+                    return func
+                if len(args) == 1:
+                    arg = args[0]
+                    return lambda: func(arg())
+                return lambda: func(*[arg() for arg in args])
+
+            case ast.UnaryOp():
+                operand = compile(node.operand)
+                unary_func = unary_operators[node.op]
+                return lambda: unary_func(operand())
+
+            case ast.Break(value):
+                break_value = compile(value) if value else None
+                def do_break() -> Value:
+                    raise BreakException(break_value() if break_value is not None else None)
+                return do_break
+
+            case ast.Continue():
+                def do_continue() -> Value:
+                    raise ContinueException()
+                return do_continue
+
+            case None:
+                # A missing `else` branch or block result
+                return lambda: None
+
+            case _:
+                raise ValueError(f"Unknown AST node {node}")
+
+    def compile_assignment(target: ast.Identifier, value_node: ast.Expression) -> Thunk:
+        assigned = compile(value_node)
+        if target.slot is None:
+            name = target.name
+            def assign_global() -> Value:
+                value = assigned()
+                symtab.update_variable(name, value)
+                return value
+            return assign_global
+        depth, index = target.slot
+        frame = frames[depth]
+        def assign() -> Value:
+            value = frame[index] = assigned()
+            return value
+        return assign
+
+    return compile(node)
@@ -1,12 +1,25 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Callable
 
 
 @dataclass
 class IntrinsicArgs():
+    # Each argument is either a register like `%rbx` or a memory reference
+    # like `-8(%rbp)`. Intrinsics may freely clobber `%rax` and `%rdx`,
+    # so those are never passed as arguments.
     arg_refs: list[str]
     result_register: str
     emit: Callable[[str], None]
+    # The value of each argument, where it is known to be a constant
+    arg_values: list[int | None] = field(default_factory=list)
+
+
+def _power_of_two(a: IntrinsicArgs, i: int) -> int | None:
+    """Returns k if argument i is known to be 2**k for some k >= 1."""
+    value = a.arg_values[i] if i < len(a.arg_values) else None
+    if value is None or isinstance(value, bool) or value < 2 or value & (value - 1):
+        return None
+    return value.bit_length() - 1
 
 
 Intrinsic = Callable[[IntrinsicArgs], None]
@@ -25,13 +38,15 @@ def _intrinsic(name: str) -> Callable[[Intrinsic], Intrinsic]:
 
 @_intrinsic("unary_-")
 def unary_minus(a: IntrinsicArgs) -> None:
-    a.emit(f'movq {a.arg_refs[0]}, {a.result_register}')
+    if a.result_register != a.arg_refs[0]:
+        a.emit(f'movq {a.arg_refs[0]}, {a.result_register}')
     a.emit(f'negq {a.result_register}')
 
 
 @_intrinsic("unary_not")
 def unary_not(a: IntrinsicArgs) -> None:
-    a.emit(f'movq {a.arg_refs[0]}, {a.result_register}')
+    if a.result_register != a.arg_refs[0]:
+        a.emit(f'movq {a.arg_refs[0]}, {a.result_register}')
     a.emit(f'xorq $1, {a.result_register}')
 
 
@@ -51,13 +66,40 @@ def minus(a: IntrinsicArgs) -> None:
 
 @_intrinsic("*")
 def multiply(a: IntrinsicArgs) -> None:
+    # Multiplying by 2**k is shifting left by k, wrapping around the same way
+    for factor, other in [(1, 0), (0, 1)]:
+        k = _power_of_two(a, factor)
+        if k is not None:
+            if a.result_register != a.arg_refs[other]:
+                a.emit(f'movq {a.arg_refs[other]}, {a.result_register}')
+            a.emit(f'shlq ${k}, {a.result_register}')
+            return
     if a.result_register != a.arg_refs[0]:
         a.emit(f'movq {a.arg_refs[0]}, {a.result_register}')
     a.emit(f'imulq {a.arg_refs[1]}, {a.result_register}')
 
 
+def _round_toward_zero(a: IntrinsicArgs, k: int) -> None:
+    """Loads the left argument into %rax, plus 2**k - 1 if it is negative, with the 2**k - 1 in %rdx.
+
+    Shifting right then rounds toward zero like `idivq`, instead of down.
+    """
+    a.emit(f'movq {a.arg_refs[0]}, %rax')
+    a.emit('movq %rax, %rdx')
+    a.emit('sarq $63, %rdx')  # All ones if negative, else zero
+    a.emit(f'shrq ${64 - k}, %rdx')
+    a.emit('addq %rdx, %rax')
+
+
 @_intrinsic("/")
 def divide(a: IntrinsicArgs) -> None:
+    k = _power_of_two(a, 1)
+    if k is not None:
+        _round_toward_zero(a, k)
+        a.emit(f'sarq ${k}, %rax')
+        if a.result_register != '%rax':
+            a.emit(f'movq %rax, {a.result_register}')
+        return
     a.emit(f'movq {a.arg_refs[0]}, %rax')
     a.emit('cqto')  # TODO: explain
     a.emit(f'idivq {a.arg_refs[1]}')
@@ -67,6 +109,15 @@ def divide(a: IntrinsicArgs) -> None:
 
 @_intrinsic("%")
 def remainder(a: IntrinsicArgs) -> None:
+    k = _power_of_two(a, 1)
+    if k is not None and k < 32:
+        # x % 2**k == ((x + bias) & (2**k - 1)) - bias, keeping the sign of x like `idivq`
+        _round_toward_zero(a, k)
+        a.emit(f'andq ${(1 << k) - 1}, %rax')
+        a.emit('subq %rdx, %rax')
+        if a.result_register != '%rax':
+            a.emit(f'movq %rax, {a.result_register}')
+        return
     # Same as division, but remainder is in register 'rdx'
     a.emit(f'movq {a.arg_refs[0]}, %rax')
     a.emit('cqto')
@@ -105,6 +156,10 @@ def ge(a: IntrinsicArgs) -> None:
     _int_comparison(a, 'setge')
 
 
+# The condition code (as in `setcc` and `jcc`) of each comparison operator
+comparison_conditions = {'==': 'e', '!=': 'ne', '<': 'l', '<=': 'le', '>': 'g', '>=': 'ge'}
+
+
 def _int_comparison(a: IntrinsicArgs, setcc_insn: str) -> None:
     # We use 'al' and 'eax' below, which means the lower bytes of 'rax'
     a.emit('xor %rax, %rax')  # Clear all bits of rax
@@ -1,5 +1,5 @@
 from compiler import ast
-from compiler import ir
+from compiler import ir, trace
 from compiler.SymTab import SymTab, add_builtin_symbols
 from compiler.ir import IRvar
 from compiler.type_checker import typecheck
@@ -7,7 +7,15 @@ from compiler.types import Type, Unit, Int, Bool
 from typing import Generic, TypeVar, Dict, Any, List, Optional, cast
 
 
-def generate_ir(root_node: ast.Expression) -> list[ir.Instruction]:
+def generate_ir(root_node: ast.Expression, typechecked: bool = False) -> list[ir.Instruction]:
+    """Generates IR code for the given AST.
+
+    The IR generator reads the types that `typecheck` stored in each node's
+    `type` field. Pass `typechecked=True` if the tree has already been
+    type-checked; otherwise the whole tree is type-checked once here.
+    """
+    if not typechecked:
+        typecheck(root_node, SymTab(parent=None))
 
     next_var_number = 1
     next_label_number = 1
@@ -37,7 +45,7 @@ def generate_ir(root_node: ast.Expression) -> list[ir.Instruction]:
 
     def visit(node: ast.Expression, loop_start: Optional[ir.Label] = None, loop_end: Optional[ir.Label] = None) -> IRvar:
         nonlocal symtab
-        var_type = typecheck(node, symtab)
+        var_type = node.type
 
         match node:
             case ast.Literal():
@@ -55,8 +63,8 @@ def generate_ir(root_node: ast.Expression) -> list[ir.Instruction]:
 
             case ast.Identifier():
                 var, var_type1 = symtab.lookup_variable(node.name, flag=True)
-                print('var',var)
-                print('var_type1',var_type1)
+                if trace.ir_generator.debug_enabled:
+                    trace.ir_generator.debug('identifier %s is %s of type %s', node.name, var, var_type1)
                 if not isinstance(var, IRvar):
                     raise TypeError(f"Identifier {node.name} is not an IR variable")
                 return var
@@ -68,9 +76,9 @@ def generate_ir(root_node: ast.Expression) -> list[ir.Instruction]:
                     # instructions.append(ir.Copy(source=var_left, dest=temp_var)) # 复制左操作数的值到临时变量
                     var_result = new_var(var_type)
 
-                    or_skip = ir.Label("or_skip")
-                    or_right = ir.Label("or_right")
-                    or_end = ir.Label("or_end")
+                    or_skip = new_label('or_skip')
+                    or_right = new_label('or_right')
+                    or_end = new_label('or_end')
 
                     # 使用临时变量作为条件
                     # instructions.append(ir.CondJump(cond=temp_var, then_label=or_skip, else_label=or_right))
@@ -95,9 +103,9 @@ def generate_ir(root_node: ast.Expression) -> list[ir.Instruction]:
                     var_left = visit(node.left)
                     var_result = new_var(var_type)
 
-                    and_skip = ir.Label("and_skip")
-                    and_right = ir.Label("and_right")
-                    and_end = ir.Label("and_end")
+                    and_skip = new_label('and_skip')
+                    and_right = new_label('and_right')
+                    and_end = new_label('and_end')
 
                     instructions.append(ir.CondJump(
                         cond=var_left, then_label=and_right, else_label=and_skip))
@@ -150,7 +158,6 @@ def generate_ir(root_node: ast.Expression) -> list[ir.Instruction]:
             case ast.IfExpression():
 
                 cond_var = visit(node.condition)
-                var_type = typecheck(node, symtab)
 
                 then_label = new_label('then')
                 else_label = new_label('else') if node.else_branch else None
@@ -215,7 +222,7 @@ def generate_ir(root_node: ast.Expression) -> list[ir.Instruction]:
             case ast.VariableDeclaration():
                 # nonlocal var_types
                 init_var = visit(node.value)
-                var_type = typecheck(node.value, symtab)
+                var_type = node.value.type
                 var = new_var(var_type)
 
                 symtab.define_variable(node.name.name, var, var_type)
@@ -298,13 +305,16 @@ def generate_ir(root_node: ast.Expression) -> list[ir.Instruction]:
     var_result = visit(root_node)
     #print(var_result,var_types)
     if var_result != None:
-        print(f"var_result type: {type(var_result)}, value: {var_result}")
+        if trace.ir_generator.debug_enabled:
+            trace.ir_generator.debug('result of the program is %s', var_result)
         result_type = var_types.get(var_result, Unit())
         if isinstance(result_type, Int):
             instructions.append(ir.Call(IRvar('print_int'), [var_result], new_var(Int())))
         elif isinstance(result_type, Bool):
             instructions.append(ir.Call(IRvar('print_bool'), [var_result], new_var(Int())))
 
+    if trace.ir_generator.info_enabled:
+        trace.ir_generator.info('generated %d instructions', len(instructions))
     return instructions
     #     if str(var_types[var_result]) == 'Int':
     #         instructions.append(ir.Call(IRvar('print_int'), [var_result], new_var(Int())))
@@ -0,0 +1,458 @@
+from typing import Callable
+
+from compiler import ir, trace
+from compiler.cfg import build_cfg
+from compiler.dataflow import bits, liveness, solve, uses_and_defs
+from compiler.int64 import divide, division_traps, remainder, wrap
+from compiler.ir import IRvar
+
+type Constant = int | bool
+
+
+def _divide(a: int, b: int) -> int | None:
+    # Leave divisions that trap to run time, so the program still fails like it should
+    return None if division_traps(a, b) else divide(a, b)
+
+
+def _remainder(a: int, b: int) -> int | None:
+    return None if division_traps(a, b) else remainder(a, b)
+
+
+# How to compute each operator on constants. A result of None means "don't fold".
+_operators: dict[str, Callable[..., Constant | None]] = {
+    '+': lambda a, b: wrap(a + b),
+    '-': lambda a, b: wrap(a - b),
+    '*': lambda a, b: wrap(a * b),
+    '/': _divide,
+    '%': _remainder,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+    '==': lambda a, b: a == b,
+    '!=': lambda a, b: a != b,
+    'unary_-': lambda a: wrap(-a),
+    'unary_not': lambda a: not a,
+}
+
+
+def optimize(instructions: list[ir.Instruction]) -> list[ir.Instruction]:
+    """Runs the IR optimization passes and returns the optimized instructions.
+
+    The passes are repeated while they make progress: removing unreachable
+    code may leave a variable with a single, constant assignment, which
+    can then be folded. Coalescing comes last, since merging variables
+    gives them more assignments and would get in the way of folding.
+    """
+    while True:
+        optimized = eliminate_dead_code(propagate_copies(simplify_algebra(fold_constants(instructions))))
+        if optimized == instructions:
+            break
+        instructions = optimized
+    return coalesce_copies(instructions)
+
+
+def _load_constant(value: Constant, dest: IRvar) -> ir.Instruction:
+    if isinstance(value, bool):
+        return ir.LoadBoolConst(value, dest)
+    return ir.LoadIntConst(value, dest)
+
+
+def _destination(insn: ir.Instruction) -> IRvar | None:
+    if isinstance(insn, (ir.LoadIntConst, ir.LoadBoolConst, ir.Copy, ir.Call)):
+        return insn.dest
+    return None
+
+
+def constants_assigned_once(instructions: list[ir.Instruction]) -> dict[IRvar, Constant]:
+    """Returns the variables whose only assignment loads a constant, with their values."""
+    definitions: dict[IRvar, int] = {}
+    constant_loads: dict[IRvar, Constant] = {}
+    for insn in instructions:
+        dest = _destination(insn)
+        if dest is not None:
+            definitions[dest] = definitions.get(dest, 0) + 1
+            if isinstance(insn, (ir.LoadIntConst, ir.LoadBoolConst)):
+                constant_loads[dest] = insn.value
+    return {var: value for var, value in constant_loads.items() if definitions[var] == 1}
+
+
+def fold_constants(instructions: list[ir.Instruction]) -> list[ir.Instruction]:
+    """Evaluates operators on constants at compile time.
+
+    A variable is known to be constant
+    - everywhere, if its only assignment in the program loads a constant, or
+    - from an assignment of a constant up to the next label, since control
+      may reach a label from elsewhere.
+    Operator calls on constants become constant loads, copies of constants
+    become loads of the constant, and conditional jumps on constants become
+    jumps. Divisions that would trap are left alone. Repeats until nothing
+    changes, since each folded call may make another variable constant.
+    """
+    passes = 0
+    while True:
+        passes += 1
+        constants = constants_assigned_once(instructions)
+
+        changed = False
+        local: dict[IRvar, Constant] = {}
+
+        def value_of(var: IRvar) -> Constant | None:
+            value = local.get(var)
+            return value if value is not None else constants.get(var)
+
+        result: list[ir.Instruction] = []
+        for insn in instructions:
+            match insn:
+                case ir.Label():
+                    local.clear()
+                case ir.LoadIntConst() | ir.LoadBoolConst():
+                    local[insn.dest] = insn.value
+                case ir.Copy():
+                    value = value_of(insn.source)
+                    if value is not None:
+                        local[insn.dest] = value
+                        insn = _load_constant(value, insn.dest)
+                        changed = True
+                    else:
+                        local.pop(insn.dest, None)
+                case ir.Call():
+                    operator = _operators.get(insn.fun.name)
+                    args = [value_of(arg) for arg in insn.args]
+                    value = None
+                    if operator is not None and all(arg is not None for arg in args):
+                        value = operator(*args)
+                    if value is not None:
+                        local[insn.dest] = value
+                        insn = _load_constant(value, insn.dest)
+                        changed = True
+                    else:
+                        local.pop(insn.dest, None)
+                case ir.CondJump():
+                    value = value_of(insn.cond)
+                    if value is not None:
+                        insn = ir.Jump(insn.then_label if value else insn.else_label)
+                        changed = True
+            result.append(insn)
+
+        instructions = result
+        if not changed:
+            break
+
+    if trace.optimizer.info_enabled:
+        trace.optimizer.info('constant folding took %d passes', passes)
+    return instructions
+
+
+# The result of comparing a variable with itself
+_self_comparisons = {'==': True, '<=': True, '>=': True, '!=': False, '<': False, '>': False}
+
+
+def simplify_algebra(instructions: list[ir.Instruction]) -> list[ir.Instruction]:
+    """Replaces operator calls whose result is known without computing it.
+
+    - `x + 0`, `0 + x`, `x - 0`, `x * 1`, `1 * x` and `x / 1` become copies of `x`
+    - `x * 0`, `0 * x` and `x % 1` become loads of 0
+    - `not not x` and `- - x` become copies of `x`
+    - comparing a variable with itself becomes a load of the result
+
+    Constants are known like in `fold_constants`. Negations are only
+    remembered up to the next label, and until either variable is assigned.
+    """
+    constants = constants_assigned_once(instructions)
+    local: dict[IRvar, Constant] = {}
+    # For each `y = op x` with a unary op: y -> (op, x), and x -> the ys
+    negations: dict[IRvar, tuple[str, IRvar]] = {}
+    negated_by: dict[IRvar, set[IRvar]] = {}
+
+    def value_of(var: IRvar) -> Constant | None:
+        value = local.get(var)
+        return value if value is not None else constants.get(var)
+
+    def assigned(var: IRvar) -> None:
+        local.pop(var, None)
+        negation = negations.pop(var, None)
+        if negation is not None:
+            negated_by[negation[1]].discard(var)
+        for result in negated_by.pop(var, set()):
+            del negations[result]
+
+    simplified = 0
+    result: list[ir.Instruction] = []
+    for insn in instructions:
+        if isinstance(insn, ir.Label):
+            local.clear()
+            negations.clear()
+            negated_by.clear()
+        elif isinstance(insn, ir.Call) and insn.fun.name in _operators:
+            new_insn = _simplify_call(insn, value_of, negations)
+            if new_insn is not None:
+                insn = new_insn
+                simplified += 1
+        for var in uses_and_defs(insn)[1]:
+            assigned(var)
+        match insn:
+            case ir.LoadIntConst() | ir.LoadBoolConst():
+                local[insn.dest] = insn.value
+            case ir.Call(fun=IRvar('unary_not' | 'unary_-'), args=[operand]) if operand != insn.dest:
+                negations[insn.dest] = (insn.fun.name, operand)
+                negated_by.setdefault(operand, set()).add(insn.dest)
+        result.append(insn)
+
+    if trace.optimizer.info_enabled:
+        trace.optimizer.info('algebraic simplification rewrote %d operators', simplified)
+    return result
+
+
+def _simplify_call(
+    insn: ir.Call,
+    value_of: Callable[[IRvar], Constant | None],
+    negations: dict[IRvar, tuple[str, IRvar]],
+) -> ir.Instruction | None:
+    name = insn.fun.name
+    if len(insn.args) == 1:
+        (operand,) = insn.args
+        negation = negations.get(operand)
+        if negation is not None and negation[0] == name:
+            return ir.Copy(negation[1], insn.dest)
+        return None
+
+    left, right = insn.args
+    if left == right and name in _self_comparisons:
+        return ir.LoadBoolConst(_self_comparisons[name], insn.dest)
+    left_value, right_value = value_of(left), value_of(right)
+    if name in ('+', '-', '*', '/', '%'):
+        # Bools never reach arithmetic, so `False == 0` can't cause mistakes here
+        if (name in ('+', '-') and right_value == 0) or (name in ('*', '/') and right_value == 1):
+            return ir.Copy(left, insn.dest)
+        if (name == '+' and left_value == 0) or (name == '*' and left_value == 1):
+            return ir.Copy(right, insn.dest)
+        if (name == '*' and (left_value == 0 or right_value == 0)) or (name == '%' and right_value == 1):
+            return ir.LoadIntConst(0, insn.dest)
+    return None
+
+
+# Operators that can't fail, so calls to them can be dropped if their result is unused.
+# Division and remainder may trap, which is a side effect the program must keep.
+_pure_operators = set(_operators) - {'/', '%'}
+
+
+def _removable(insn: ir.Instruction) -> bool:
+    match insn:
+        case ir.LoadIntConst() | ir.LoadBoolConst() | ir.Copy():
+            return True
+        case ir.Call():
+            return insn.fun.name in _pure_operators
+    return False
+
+
+def eliminate_dead_code(instructions: list[ir.Instruction]) -> list[ir.Instruction]:
+    """Removes code that can't run and instructions whose results are never read.
+
+    Blocks that can't be reached from the start of the program are dropped,
+    along with jumps to the instruction right after them. Then constant
+    loads, copies and calls to pure operators assigning a variable that
+    isn't live afterwards are removed, as are copies of a variable to
+    itself. Removing one may leave the instructions computing its operands
+    dead too, so this repeats until nothing changes.
+    """
+    before = len(instructions)
+    cfg = build_cfg(instructions)
+    reachable = set(cfg.reverse_postorder())
+    instructions = cfg.linearize([b for b in range(len(cfg.blocks)) if b in reachable])
+    after_unreachable = len(instructions)
+
+    passes = 0
+    while True:
+        passes += 1
+        cfg = build_cfg(instructions)
+        live = liveness(cfg)
+        removed = 0
+        result: list[ir.Instruction] = []
+        for b, block in enumerate(cfg.blocks):
+            live_after = live.variables_in(live.live_out[b])
+            kept: list[ir.Instruction] = []
+            for insn in reversed(block):
+                uses, defs = uses_and_defs(insn)
+                if _removable(insn) and (
+                        not any(var in live_after for var in defs)
+                        or isinstance(insn, ir.Copy) and insn.source == insn.dest):
+                    removed += 1
+                    continue
+                live_after.difference_update(defs)
+                live_after.update(uses)
+                kept.append(insn)
+            kept.reverse()
+            result += kept
+        instructions = result
+        if not removed:
+            break
+
+    if trace.optimizer.info_enabled:
+        trace.optimizer.info(
+            'dead code elimination removed %d unreachable and %d dead instructions in %d passes',
+            before - after_unreachable, after_unreachable - len(instructions), passes)
+    return instructions
+
+
+def _replace_uses(insn: ir.Instruction, replace: Callable[[IRvar], IRvar]) -> ir.Instruction:
+    match insn:
+        case ir.Call():
+            return ir.Call(insn.fun, [replace(arg) for arg in insn.args], insn.dest)
+        case ir.Copy():
+            return ir.Copy(replace(insn.source), insn.dest)
+        case ir.CondJump():
+            return ir.CondJump(replace(insn.cond), insn.then_label, insn.else_label)
+    return insn
+
+
+def propagate_copies(instructions: list[ir.Instruction]) -> list[ir.Instruction]:
+    """Replaces reads of a copied variable with reads of the original.
+
+    After `Copy(a, b)`, reads of `b` read `a` instead, for as long as
+    neither is assigned again on every path from the copy. Whether that holds
+    at the start of each block is an "available copies" problem, solved
+    with `dataflow.solve`. Chains of copies are followed to the first
+    variable. The copies themselves are left for `eliminate_dead_code`.
+    """
+    cfg = build_cfg(instructions)
+    copies: list[ir.Copy] = []
+    # For each variable, the copies reading or writing it
+    copies_of: dict[IRvar, int] = {}
+    for insn in instructions:
+        if isinstance(insn, ir.Copy) and insn.source != insn.dest:
+            bit = 1 << len(copies)
+            copies.append(insn)
+            copies_of[insn.source] = copies_of.get(insn.source, 0) | bit
+            copies_of[insn.dest] = copies_of.get(insn.dest, 0) | bit
+    if not copies:
+        return instructions
+
+    gen: list[int] = []
+    kill: list[int] = []
+    number = 0
+    for block in cfg.blocks:
+        available = 0
+        killed = 0
+        for insn in block:
+            for var in uses_and_defs(insn)[1]:
+                available &= ~copies_of.get(var, 0)
+                killed |= copies_of.get(var, 0)
+            if isinstance(insn, ir.Copy) and insn.source != insn.dest:
+                available |= 1 << number
+                number += 1
+        gen.append(available)
+        kill.append(killed)
+    result = solve(cfg, gen=gen, kill=kill, forward=True, intersect=True, universe=(1 << len(copies)) - 1)
+
+    replaced = 0
+    instructions = []
+    for b, block in enumerate(cfg.blocks):
+        # Where each copied variable's value came from, and the reverse
+        source_of: dict[IRvar, IRvar] = {}
+        copied_to: dict[IRvar, set[IRvar]] = {}
+
+        def forget(var: IRvar) -> None:
+            source = source_of.pop(var, None)
+            if source is not None:
+                copied_to[source].discard(var)
+            for dest in copied_to.pop(var, set()):
+                del source_of[dest]
+
+        def remember(source: IRvar, dest: IRvar) -> None:
+            source_of[dest] = source
+            copied_to.setdefault(source, set()).add(dest)
+
+        for n in bits(result.block_in[b]):
+            remember(copies[n].source, copies[n].dest)
+
+        def original(var: IRvar) -> IRvar:
+            nonlocal replaced
+            while var in source_of:
+                var = source_of[var]
+                replaced += 1
+            return var
+
+        for insn in block:
+            insn = _replace_uses(insn, original)
+            for var in uses_and_defs(insn)[1]:
+                forget(var)
+            if isinstance(insn, ir.Copy) and insn.source != insn.dest:
+                remember(insn.source, insn.dest)
+            instructions.append(insn)
+
+    if trace.optimizer.info_enabled:
+        trace.optimizer.info('copy propagation replaced %d reads', replaced)
+    return instructions
+
+
+def coalesce_copies(instructions: list[ir.Instruction]) -> list[ir.Instruction]:
+    """Merges the source and destination of copies into one variable where possible.
+
+    Two variables can be merged if they don't interfere, i.e. neither is
+    assigned while the other holds a value that is still needed. A copy
+    between them then copies a variable to itself and is removed. This
+    catches copies that `propagate_copies` can't remove, like the one
+    assigning a loop variable its next value.
+    """
+    cfg = build_cfg(instructions)
+    live = liveness(cfg)
+    interferes: dict[IRvar, set[IRvar]] = {}
+    for b, block in enumerate(cfg.blocks):
+        live_after = live.variables_in(live.live_out[b])
+        for insn in reversed(block):
+            uses, defs = uses_and_defs(insn)
+            for var in defs:
+                for other in live_after:
+                    # A copy's destination holds the same value as its source, so they don't clash
+                    if other != var and not (isinstance(insn, ir.Copy) and other == insn.source):
+                        interferes.setdefault(var, set()).add(other)
+                        interferes.setdefault(other, set()).add(var)
+            live_after.difference_update(defs)
+            live_after.update(uses)
+
+    # Union-find over the variables, with the interference of each merged group
+    merged_into: dict[IRvar, IRvar] = {}
+
+    def find(var: IRvar) -> IRvar:
+        while var in merged_into:
+            var = merged_into[var]
+        return var
+
+    coalesced = 0
+    for copy in instructions:
+        if not isinstance(copy, ir.Copy):
+            continue
+        source, dest = find(copy.source), find(copy.dest)
+        if source == dest:
+            continue
+        source_conflicts = interferes.get(source, set())
+        if any(find(var) == dest for var in source_conflicts):
+            continue
+        # Keep the destination's name: it is usually the program's own variable
+        merged_into[source] = dest
+        interferes[dest] = interferes.get(dest, set()) | source_conflicts
+        coalesced += 1
+    if not coalesced:
+        return instructions
+
+    result: list[ir.Instruction] = []
+    for insn in instructions:
+        match insn:
+            case ir.Call():
+                insn = ir.Call(insn.fun, [find(arg) for arg in insn.args], find(insn.dest))
+            case ir.LoadIntConst():
+                insn = ir.LoadIntConst(insn.value, find(insn.dest))
+            case ir.LoadBoolConst():
+                insn = ir.LoadBoolConst(insn.value, find(insn.dest))
+            case ir.Copy():
+                insn = ir.Copy(find(insn.source), find(insn.dest))
+                if insn.source == insn.dest:
+                    continue
+            case ir.CondJump():
+                insn = ir.CondJump(find(insn.cond), insn.then_label, insn.else_label)
+        result.append(insn)
+
+    if trace.optimizer.info_enabled:
+        trace.optimizer.info('coalesced %d copies', coalesced)
+    return result
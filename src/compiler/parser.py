@@ -1,4 +1,8 @@
-from compiler.tokenizer import Token
+from collections import deque
+from typing import Iterable
+
+from compiler import trace
+from compiler.tokenizer import SourceLocation, Token
 import compiler.ast as ast
 from compiler.types import Int, Bool, Type, PointerType
 
@@ -13,23 +17,37 @@ left_associative_binary_operators = [
 ]
 
 
-def parse(tokens: list[Token], right_associative: bool = False) -> ast.Expression:
-    pos = 0
+def parse(tokens: Iterable[Token], right_associative: bool = False) -> ast.Expression:
+    # Tokens are pulled from the iterable only as far as the parser looks ahead,
+    # so a generator like `iter_tokens` is never turned into a full list.
+    token_iter = iter(tokens)
+    lookahead: deque[Token] = deque()
+    last_token: Token | None = None
     scopes: list[set[str]] = [set()]
 
+    def token_at(offset: int) -> Token | None:  #查看当前位置之后第offset个token
+        nonlocal last_token
+        while len(lookahead) <= offset:
+            token = next(token_iter, None)
+            if token is None:
+                return None
+            lookahead.append(token)
+            last_token = token
+        return lookahead[offset]
+
     def peek() -> Token:     #查看当前位置的token
-        if pos < len(tokens):
-            return tokens[pos]
+        token = token_at(0)
+        if token is not None:
+            return token
         else:
             return Token(
-                loc=tokens[-1].loc,
+                loc=last_token.loc if last_token is not None else SourceLocation(row=1, column=1),
                 type="end",
                 text="",
             )
     
 
     def consume(expected: str | list[str] | None = None) -> Token:  #消耗当前位置的token
-        nonlocal pos
         token = peek()
         if expected is not None:
             if isinstance(expected, str):
@@ -45,7 +63,8 @@ def parse(tokens: list[Token], right_associative: bool = False) -> ast.Expressio
         #if isinstance(expected, list) and token.text not in expected:
         #    comma_separated = ", ".join([f'"{e}"' for e in expected])
         #    raise Exception(f' expected one of: {comma_separated}')
-        pos += 1
+        if lookahead:
+            lookahead.popleft()
         return token
     
 
@@ -79,8 +98,8 @@ def parse(tokens: list[Token], right_associative: bool = False) -> ast.Expressio
         elif peek().text == 'if':
             return parse_if_expression()
         elif peek().type == 'int_literal':
-            next_pos = pos +1
-            if next_pos < len(tokens) and tokens[next_pos].type == 'int_literal':
+            next_token = token_at(1)
+            if next_token is not None and next_token.type == 'int_literal':
                 raise Exception(f"Unexpected token '{peek().text}' after integer literal at {peek().loc}, expected operator or separator")
             return parse_int_literal()
         elif peek().text == 'while':
@@ -89,8 +108,8 @@ def parse(tokens: list[Token], right_associative: bool = False) -> ast.Expressio
             return parse_bool_literal()
         
         elif peek().type == 'identifier':
-            next_pos = pos +1
-            if next_pos < len(tokens) and tokens[next_pos].text == '(':
+            next_token = token_at(1)
+            if next_token is not None and next_token.text == '(':
                 return parse_function_call()
             else:
                 return parse_identifier()
@@ -141,13 +160,14 @@ def parse(tokens: list[Token], right_associative: bool = False) -> ast.Expressio
         #     return parse_if_expression()
         if peek().text == 'var':  # 先检查是否是 var 语句
             return parse_variable_declaration()
-        print(peek().text)
+        if trace.parser.debug_enabled:
+            trace.parser.debug('expression starting with %r at %s', peek().text, peek().loc)
         if peek().text == '{':  # 确保 `{}` 代码块在解析表达式时被正确解析
             return parse_block()
         #if peek().type == 'bool_literal':
         #    return parse_bool_literal()
-        next_pos = pos +1
-        if next_pos < len(tokens) and tokens[next_pos].text == '=':
+        next_token = token_at(1)
+        if next_token is not None and next_token.text == '=':
             return parse_assignment()
         left = parse_with_precedence(0)
 
@@ -279,7 +299,7 @@ def parse(tokens: list[Token], right_associative: bool = False) -> ast.Expressio
                 if peek().text == ';':
                     consume(';')
                     expressions.append(expr)
-                    if pos < len(tokens) and tokens[pos].text == 'var':
+                    if peek().text == 'var':
                         raise Exception(f"Unexpected 'var' after ';'")
                 elif peek().text == '}':
                     result_expression = expr
@@ -389,8 +409,8 @@ def parse(tokens: list[Token], right_associative: bool = False) -> ast.Expressio
 
         
     result = parse_top_level()
-    if pos != len(tokens):
-        remaining_token = tokens[pos]
+    remaining_token = token_at(0)
+    if remaining_token is not None:
         raise Exception(f"{remaining_token.loc}: Unexpected token '{remaining_token.text}'")
 
     return result
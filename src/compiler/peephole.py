@@ -0,0 +1,287 @@
+"""A peephole optimizer for the assembly code from `generate_assembly`.
+
+The assembly is parsed into `AsmInstruction`, `AsmLabel`, `AsmDirective`
+and `AsmComment` lines, and each rule in a table looks at a short window of consecutive
+lines and may replace it. Rules are registered with `@_rule` like the
+intrinsics are, and `peephole` takes the table to use, so rules can be
+turned off or added when tuning. It also counts how often each rule hits.
+
+Comment lines aren't seen by the rules. When a rule replaces some lines,
+the comments before the lines it keeps stay in place, and the others
+go before the replacement.
+"""
+import collections
+from dataclasses import dataclass
+from typing import Callable
+
+from compiler import trace
+
+
+@dataclass(frozen=True)
+class AsmInstruction:
+    mnemonic: str
+    operands: tuple[str, ...]
+
+    def __str__(self) -> str:
+        if not self.operands:
+            return self.mnemonic
+        return f'{self.mnemonic} {", ".join(self.operands)}'
+
+
+@dataclass(frozen=True)
+class AsmLabel:
+    name: str
+
+    def __str__(self) -> str:
+        return f'{self.name}:'
+
+
+@dataclass(frozen=True)
+class AsmDirective:
+    """A directive like `.global main`, or an empty line."""
+    text: str
+
+    def __str__(self) -> str:
+        return self.text
+
+
+@dataclass(frozen=True)
+class AsmComment:
+    text: str
+
+    def __str__(self) -> str:
+        return self.text
+
+
+type AsmLine = AsmInstruction | AsmLabel | AsmDirective | AsmComment
+
+
+def _split_operands(text: str) -> list[str]:
+    operands = []
+    depth = 0
+    current = ''
+    for c in text:
+        if c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        if c == ',' and depth == 0:
+            operands.append(current.strip())
+            current = ''
+        else:
+            current += c
+    if current.strip():
+        operands.append(current.strip())
+    return operands
+
+
+def parse_assembly(assembly_code: str) -> list[AsmLine]:
+    """Parses the lines of assembly code. Comments must be on lines of their own."""
+    lines: list[AsmLine] = []
+    for text in assembly_code.split('\n'):
+        stripped = text.strip()
+        if stripped.startswith('#'):
+            lines.append(AsmComment(stripped))
+        elif stripped.endswith(':') and ' ' not in stripped:
+            lines.append(AsmLabel(stripped[:-1]))
+        elif stripped.startswith('.') or not stripped:
+            lines.append(AsmDirective(stripped))
+        else:
+            mnemonic, _, rest = stripped.partition(' ')
+            lines.append(AsmInstruction(mnemonic, tuple(_split_operands(rest))))
+    return lines
+
+
+def format_assembly(lines: list[AsmLine]) -> str:
+    return '\n'.join(str(line) for line in lines)
+
+
+type RuleFunction = Callable[[list[AsmLine]], list[AsmLine] | None]
+
+
+@dataclass
+class Rule:
+    """Replaces a window of `length` lines with the lines `apply` returns, unless it returns None."""
+    name: str
+    length: int
+    apply: RuleFunction
+
+
+all_rules: dict[str, Rule] = {}
+
+
+def _rule(name: str, length: int) -> Callable[[RuleFunction], RuleFunction]:
+    """Function decorator that registers that function as a peephole rule."""
+    def wrapper(f: RuleFunction) -> RuleFunction:
+        assert name not in all_rules
+        all_rules[name] = Rule(name, length, f)
+        return f
+    return wrapper
+
+
+_inverted_conditions = {
+    'e': 'ne', 'ne': 'e', 'z': 'nz', 'nz': 'z',
+    'l': 'ge', 'ge': 'l', 'le': 'g', 'g': 'le',
+    'b': 'ae', 'ae': 'b', 'be': 'a', 'a': 'be',
+}
+
+
+def _is_move(line: AsmLine) -> bool:
+    return isinstance(line, AsmInstruction) and line.mnemonic == 'movq' and len(line.operands) == 2
+
+
+def _jump_target(line: AsmLine) -> str | None:
+    """Returns the label a `jmp` or conditional jump goes to."""
+    if not isinstance(line, AsmInstruction) or len(line.operands) != 1:
+        return None
+    if line.mnemonic == 'jmp' or line.mnemonic[1:] in _inverted_conditions and line.mnemonic[0] == 'j':
+        return line.operands[0]
+    return None
+
+
+@_rule('jump_to_next_label', 2)
+def jump_to_next_label(window: list[AsmLine]) -> list[AsmLine] | None:
+    """`jmp L` or `jcc L` right before `L:` does nothing."""
+    jump, label = window
+    if isinstance(label, AsmLabel) and _jump_target(jump) == label.name:
+        return [label]
+    return None
+
+
+@_rule('unreachable_after_jump', 2)
+def unreachable_after_jump(window: list[AsmLine]) -> list[AsmLine] | None:
+    """An instruction after `jmp` can only run if it is jumped to, which needs a label."""
+    jump, insn = window
+    if isinstance(jump, AsmInstruction) and jump.mnemonic == 'jmp' and isinstance(insn, AsmInstruction):
+        return [jump]
+    return None
+
+
+@_rule('invert_branch', 3)
+def invert_branch(window: list[AsmLine]) -> list[AsmLine] | None:
+    """`jcc L1; jmp L2; L1:` becomes `jncc L2; L1:`, saving a jump on one of the paths."""
+    branch, jump, label = window
+    target = _jump_target(branch)
+    if (isinstance(branch, AsmInstruction) and branch.mnemonic != 'jmp' and target is not None
+            and isinstance(jump, AsmInstruction) and jump.mnemonic == 'jmp'
+            and isinstance(label, AsmLabel) and label.name == target):
+        inverted = 'j' + _inverted_conditions[branch.mnemonic[1:]]
+        return [AsmInstruction(inverted, jump.operands), label]
+    return None
+
+
+@_rule('shorten_movabsq', 1)
+def shorten_movabsq(window: list[AsmLine]) -> list[AsmLine] | None:
+    """`movabsq` is only needed for constants that don't fit in 32 signed bits."""
+    (insn,) = window
+    if isinstance(insn, AsmInstruction) and insn.mnemonic == 'movabsq' and insn.operands[0].startswith('$'):
+        try:
+            value = int(insn.operands[0][1:])
+        except ValueError:
+            return None
+        if -2**31 <= value < 2**31:
+            return [AsmInstruction('movq', insn.operands)]
+    return None
+
+
+@_rule('reload_after_store', 2)
+def reload_after_store(window: list[AsmLine]) -> list[AsmLine] | None:
+    """`movq A, B; movq B, A` moves A back where it already is."""
+    first, second = window
+    if (_is_move(first) and _is_move(second)
+            and isinstance(first, AsmInstruction) and isinstance(second, AsmInstruction)
+            and first.operands == second.operands[::-1]):
+        return [first]
+    return None
+
+
+@_rule('forward_store', 2)
+def forward_store(window: list[AsmLine]) -> list[AsmLine] | None:
+    """`movq %r1, M; movq M, %r2` can copy %r1 to %r2 instead of reading memory."""
+    first, second = window
+    if not (_is_move(first) and _is_move(second)
+            and isinstance(first, AsmInstruction) and isinstance(second, AsmInstruction)):
+        return None
+    source, memory = first.operands
+    reloaded, dest = second.operands
+    if (source.startswith('%') and '(' in memory and reloaded == memory
+            and dest.startswith('%') and dest != source):
+        return [first, AsmInstruction('movq', (source, dest))]
+    return None
+
+
+def peephole(
+    lines: list[AsmLine],
+    rules: dict[str, Rule] | None = None,
+    hits: collections.Counter[str] | None = None,
+) -> list[AsmLine]:
+    """Applies the rules until none matches and returns the new lines.
+
+    The lines are read one at a time, and after each one the rules are
+    tried, in order, on the window of lines ending with it. Lines a rule
+    returns are read again, so they may match further rules together with
+    the lines before them. Rules must make the code shorter or stop
+    matching, so this ends. Each hit is counted in `hits` under the rule's
+    name.
+    """
+    if rules is None:
+        rules = all_rules
+    if hits is None:
+        hits = collections.Counter()
+    pending = list(reversed(lines))
+    result: list[AsmLine] = []
+    # The comments before each line in `result`
+    comments_before: list[list[AsmComment]] = []
+    comments: list[AsmComment] = []
+    while pending:
+        line = pending.pop()
+        if isinstance(line, AsmComment):
+            comments.append(line)
+            continue
+        result.append(line)
+        comments_before.append(comments)
+        comments = []
+        for rule in rules.values():
+            if len(result) < rule.length:
+                continue
+            replacement = rule.apply(result[-rule.length:])
+            if replacement is None:
+                continue
+            hits[rule.name] += 1
+            window = result[-rule.length:]
+            befores = comments_before[-rule.length:]
+            del result[-rule.length:]
+            del comments_before[-rule.length:]
+            # Lines the rule kept keep their comments, the rest go first
+            kept: dict[int, int] = {}
+            for i, new_line in enumerate(replacement):
+                j = next((j for j, old in enumerate(window) if old == new_line and j not in kept.values()), None)
+                if j is not None:
+                    kept[i] = j
+            rebuilt: list[AsmLine] = [
+                comment for j, before in enumerate(befores) if j not in kept.values() for comment in before]
+            for i, new_line in enumerate(replacement):
+                if i in kept:
+                    rebuilt += befores[kept[i]]
+                rebuilt.append(new_line)
+            pending.extend(reversed(rebuilt))
+            break
+
+    output: list[AsmLine] = []
+    for before, line in zip(comments_before, result):
+        output += before
+        output.append(line)
+    return output + comments
+
+
+def optimize_assembly(assembly_code: str, hits: collections.Counter[str] | None = None) -> str:
+    """Runs the peephole optimizer with all rules on assembly code."""
+    if hits is None:
+        hits = collections.Counter()
+    lines = parse_assembly(assembly_code)
+    result = peephole(lines, hits=hits)
+    if trace.optimizer.info_enabled:
+        trace.optimizer.info(
+            'peephole optimizer removed %d of %d assembly lines; rule hits: %s',
+            len(lines) - len(result), len(lines), ', '.join(f'{name}={n}' for name, n in sorted(hits.items())))
+    return format_assembly(result)
@@ -0,0 +1,79 @@
+import dataclasses
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+from compiler import ast
+
+
+class Profile:
+    """Per-phase measurements of one compilation.
+
+    Each phase records its wall and CPU time, the peak memory allocated
+    while it ran (measured with `tracemalloc`, which slows compilation
+    down noticeably), and any counts the caller adds to it.
+    CPU time includes child processes like `as` and `ld`.
+    """
+    track_memory: bool
+    phases: list[dict[str, Any]]
+
+    def __init__(self, track_memory: bool = True) -> None:
+        self.track_memory = track_memory
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[dict[str, Any]]:
+        """Measures the code in the `with` block as the phase `name`.
+
+        Yields the phase's record, to which the caller may add counts.
+        """
+        record: dict[str, Any] = {'name': name}
+        started_tracing = self.track_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if self.track_memory:
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+        wall_start = time.perf_counter()
+        cpu_start = _cpu_time()
+        try:
+            yield record
+        finally:
+            record['wall_seconds'] = time.perf_counter() - wall_start
+            record['cpu_seconds'] = _cpu_time() - cpu_start
+            if self.track_memory:
+                record['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1] - memory_before
+            if started_tracing:
+                tracemalloc.stop()
+            self.phases.append(record)
+
+    def to_json(self) -> dict[str, Any]:
+        """Returns the measurements as a JSON-serializable dict."""
+        total: dict[str, Any] = {
+            'wall_seconds': sum(p['wall_seconds'] for p in self.phases),
+            'cpu_seconds': sum(p['cpu_seconds'] for p in self.phases),
+        }
+        if self.track_memory:
+            total['peak_memory_bytes'] = max((p['peak_memory_bytes'] for p in self.phases), default=0)
+        return {'phases': self.phases, 'total': total}
+
+
+def _cpu_time() -> float:
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def count_ast_nodes(node: ast.Expression) -> int:
+    """Returns the number of AST nodes in the tree rooted at `node`."""
+    count = 0
+    stack: list[Any] = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, ast.Expression):
+            count += 1
+            stack.extend(getattr(item, f.name) for f in dataclasses.fields(item) if f.name != 'type')
+        elif isinstance(item, list):
+            stack.extend(item)
+    return count
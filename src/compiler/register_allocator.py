@@ -0,0 +1,126 @@
+from dataclasses import dataclass
+from compiler import ir
+from compiler.cfg import build_cfg
+from compiler.dataflow import bits, liveness, uses_and_defs
+from compiler.intrinsics import all_intrinsics
+
+# %rax and %rdx are never allocated: every instruction sequence in
+# `generate_assembly` and `intrinsics` uses them as scratch registers.
+caller_saved_registers = ['%rcx', '%rsi', '%rdi', '%r8', '%r9', '%r10', '%r11']
+callee_saved_registers = ['%rbx', '%r12', '%r13', '%r14', '%r15']
+
+
+@dataclass
+class LiveInterval:
+    """The range of instruction indices where a variable holds a value."""
+    var: ir.IRvar
+    start: int
+    end: int
+    crosses_call: bool = False
+
+
+def is_external_call(insn: ir.Instruction) -> bool:
+    """Whether the instruction calls a stdlib function that clobbers caller-saved registers."""
+    return isinstance(insn, ir.Call) and insn.fun.name not in all_intrinsics
+
+
+def compute_live_intervals(instructions: list[ir.Instruction]) -> list[LiveInterval]:
+    """Computes a live interval for every variable read or written by the instructions.
+
+    Liveness comes from `dataflow.liveness` on the basic blocks, so values
+    that are carried around `while` loops get intervals covering the whole
+    loop. A variable live into or out of a block has its interval extended
+    to the block's first or last instruction; otherwise only the
+    instructions that read or write it count.
+    """
+    cfg = build_cfg(instructions)
+    live = liveness(cfg)
+    variables = list(live.variables)
+    intervals: dict[ir.IRvar, LiveInterval] = {}
+
+    def extend(v: ir.IRvar, i: int) -> None:
+        interval = intervals.get(v)
+        if interval is None:
+            intervals[v] = LiveInterval(v, i, i)
+        else:
+            interval.start = min(interval.start, i)
+            interval.end = max(interval.end, i)
+
+    first = 0
+    for b, block in enumerate(cfg.blocks):
+        last = first + len(block) - 1
+        for n in bits(live.live_in[b]):
+            extend(variables[n], first)
+        for n in bits(live.live_out[b]):
+            extend(variables[n], last)
+
+        # Walk the block backward to find what is live after each call. Variables
+        # that never leave the block have no number, so they are kept in a set.
+        live_after = live.live_out[b]
+        live_locals: set[ir.IRvar] = set()
+        for i in reversed(range(len(block))):
+            insn = block[i]
+            uses, defs = uses_and_defs(insn)
+            defined = 0
+            for v in defs:
+                extend(v, first + i)
+                number = live.variables.get(v)
+                if number is not None:
+                    defined |= 1 << number
+            if is_external_call(insn):
+                for n in bits(live_after & ~defined):
+                    intervals[variables[n]].crosses_call = True
+                for v in live_locals.difference(defs):
+                    intervals[v].crosses_call = True
+            live_after &= ~defined
+            live_locals.difference_update(defs)
+            for v in uses:
+                extend(v, first + i)
+                number = live.variables.get(v)
+                if number is not None:
+                    live_after |= 1 << number
+                else:
+                    live_locals.add(v)
+        first = last + 1
+
+    return sorted(intervals.values(), key=lambda interval: (interval.start, interval.end))
+
+
+def allocate_registers(instructions: list[ir.Instruction]) -> dict[ir.IRvar, str]:
+    """Assigns registers to variables with linear scan.
+
+    Variables whose values must survive a call to the stdlib only get
+    callee-saved registers. Variables missing from the result are spilled
+    and should be kept in stack slots.
+    """
+    result: dict[ir.IRvar, str] = {}
+    active: list[LiveInterval] = []
+    free = set(caller_saved_registers + callee_saved_registers)
+
+    for current in compute_live_intervals(instructions):
+        # Release the registers of intervals that ended before this one starts
+        for interval in [a for a in active if a.end < current.start]:
+            active.remove(interval)
+            free.add(result[interval.var])
+
+        if current.crosses_call:
+            candidates = callee_saved_registers
+        else:
+            candidates = caller_saved_registers + callee_saved_registers
+
+        register = next((r for r in candidates if r in free), None)
+        if register is not None:
+            free.remove(register)
+            result[current.var] = register
+            active.append(current)
+            continue
+
+        # No register free: spill whichever interval ends last.
+        stealable = [a for a in active if result[a.var] in candidates]
+        victim = max(stealable, key=lambda a: a.end, default=None)
+        if victim is not None and victim.end > current.end:
+            result[current.var] = result.pop(victim.var)
+            active.remove(victim)
+            active.append(current)
+
+    return result
@@ -0,0 +1,72 @@
+import dataclasses
+from typing import Any
+
+from compiler import ast
+
+
+def resolve(root: ast.Expression) -> list[int]:
+    """Maps every variable of the program to a slot in a flat list of values.
+
+    Stores the slot of each `Identifier` in its `slot` field as a pair
+    (depth, index): the nesting depth of the block declaring the variable
+    (0 for the top level) and the variable's position among that block's
+    declarations. Names the program doesn't declare get the slot None.
+
+    Returns the number of slots needed at each depth. Blocks can't be
+    re-entered while they run, so one frame per depth, allocated up front
+    with `new_frames`, serves every block at that depth.
+    """
+    frame_sizes = [0]
+    # For each enclosing block, its variables' indices and how many it has declared
+    scopes: list[dict[str, int]] = [{}]
+    counts = [0]
+
+    def lookup(name: str) -> tuple[int, int] | None:
+        for depth in range(len(scopes) - 1, -1, -1):
+            index = scopes[depth].get(name)
+            if index is not None:
+                return (depth, index)
+        return None
+
+    def visit(node: Any) -> None:
+        match node:
+            case ast.Identifier():
+                node.slot = lookup(node.name)
+
+            case ast.VariableDeclaration():
+                # The initializer can't see the variable it initializes
+                visit(node.value)
+                depth = len(scopes) - 1
+                index = counts[depth]
+                counts[depth] += 1
+                frame_sizes[depth] = max(frame_sizes[depth], counts[depth])
+                scopes[depth][node.name.name] = index
+                node.name.slot = (depth, index)
+
+            case ast.Block():
+                scopes.append({})
+                counts.append(0)
+                if len(frame_sizes) < len(scopes):
+                    frame_sizes.append(0)
+                for expr in node.expressions:
+                    visit(expr)
+                visit(node.result_expression)
+                scopes.pop()
+                counts.pop()
+
+            case ast.Expression():
+                for f in dataclasses.fields(node):
+                    if f.name != 'type':
+                        visit(getattr(node, f.name))
+
+            case list():
+                for item in node:
+                    visit(item)
+
+    visit(root)
+    return frame_sizes
+
+
+def new_frames(frame_sizes: list[int]) -> list[list[Any]]:
+    """Returns empty frames for a program whose `resolve` returned `frame_sizes`."""
+    return [[None] * size for size in frame_sizes]
@@ -0,0 +1,137 @@
+import dataclasses
+import math
+import os
+import resource
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+
+@dataclasses.dataclass
+class RunLimits:
+    """Resource limits for running a compiled program.
+
+    The CPU time, address space and output size are enforced with rlimits.
+    The wall-clock limit catches programs that block without using CPU time.
+    """
+    cpu_seconds: float = 5.0
+    wall_seconds: float = 10.0
+    memory_bytes: int = 256 * 1024 * 1024
+    output_bytes: int = 16 * 1024 * 1024
+
+    def restricted(self, requested: dict[str, Any]) -> 'RunLimits':
+        """Returns these limits lowered to any smaller values in `requested`.
+
+        Clients may only tighten the limits, never loosen them.
+        """
+        values = dataclasses.asdict(self)
+        for name, value in requested.items():
+            if name not in values:
+                raise ValueError(f"Unknown limit: {name}")
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0:
+                raise ValueError(f"Invalid value for limit {name}: {value!r}")
+            values[name] = min(values[name], type(values[name])(value))
+        return RunLimits(**values)
+
+
+@dataclasses.dataclass
+class RunResult:
+    """The outcome of running a program with `run_executable`."""
+    stdout: bytes
+    exit_code: int
+    # 'cpu_time', 'wall_time' or 'output' if the program was stopped for exceeding a limit
+    limit_exceeded: str | None
+    wall_seconds: float
+    cpu_seconds: float
+
+    def to_json(self) -> dict[str, Any]:
+        """Returns the result as a JSON-serializable dict, with stdout decoded as UTF-8."""
+        result: dict[str, Any] = {
+            'stdout': self.stdout.decode(errors='replace'),
+            'exit_code': self.exit_code,
+            'timing': {
+                'wall_seconds': self.wall_seconds,
+                'cpu_seconds': self.cpu_seconds,
+            },
+        }
+        if self.exit_code < 0:
+            result['signal'] = signal.Signals(-self.exit_code).name
+        if self.limit_exceeded is not None:
+            result['limit_exceeded'] = self.limit_exceeded
+        return result
+
+
+def run_executable(executable: bytes, stdin: bytes = b'', limits: RunLimits | None = None) -> RunResult:
+    """Runs a compiled program in a fresh temporary directory and returns its output.
+
+    The program gets an empty environment, `stdin` as its standard input
+    and the temporary directory as its working directory. Its output goes
+    to a file in that directory, so the output size limit is simply the
+    file size rlimit. The exit code is negative if a signal killed it.
+    """
+    if limits is None:
+        limits = RunLimits()
+
+    def set_limits() -> None:
+        cpu = max(1, math.ceil(limits.cpu_seconds))
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+        resource.setrlimit(resource.RLIMIT_AS, (limits.memory_bytes, limits.memory_bytes))
+        resource.setrlimit(resource.RLIMIT_FSIZE, (limits.output_bytes, limits.output_bytes))
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+    with tempfile.TemporaryDirectory(prefix='compiler-run-') as workdir:
+        program = Path(workdir) / 'program'
+        program.write_bytes(executable)
+        program.chmod(0o700)
+        stdin_path = Path(workdir) / 'stdin'
+        stdin_path.write_bytes(stdin)
+        stdout_path = Path(workdir) / 'stdout'
+
+        timed_out = threading.Event()
+        with open(stdin_path, 'rb') as stdin_file, open(stdout_path, 'wb') as stdout_file:
+            start = time.perf_counter()
+            proc = subprocess.Popen(
+                [str(program)],
+                stdin=stdin_file,
+                stdout=stdout_file,
+                stderr=subprocess.DEVNULL,
+                cwd=workdir,
+                env={},
+                preexec_fn=set_limits,
+            )
+
+            def kill() -> None:
+                timed_out.set()
+                proc.kill()
+
+            timer = threading.Timer(limits.wall_seconds, kill)
+            timer.start()
+            try:
+                # wait4 rather than proc.wait() to get the program's own resource usage
+                _, status, rusage = os.wait4(proc.pid, 0)
+            finally:
+                timer.cancel()
+            wall_seconds = time.perf_counter() - start
+            proc.returncode = os.waitstatus_to_exitcode(status)
+
+        exit_code = proc.returncode
+        limit_exceeded: str | None = None
+        if timed_out.is_set():
+            limit_exceeded = 'wall_time'
+        elif exit_code == -signal.SIGXCPU:
+            # Sent only at the soft CPU time rlimit. The recorded CPU time may be a tick short of it.
+            limit_exceeded = 'cpu_time'
+        elif exit_code == -signal.SIGXFSZ:
+            limit_exceeded = 'output'
+
+        return RunResult(
+            stdout=stdout_path.read_bytes(),
+            exit_code=exit_code,
+            limit_exceeded=limit_exceeded,
+            wall_seconds=wall_seconds,
+            cpu_seconds=rusage.ru_utime + rusage.ru_stime,
+        )
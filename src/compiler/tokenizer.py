@@ -1,18 +1,13 @@
 import re
+from bisect import bisect_right
 from dataclasses import dataclass
-from typing import List
+from typing import Iterator, List
 
 @dataclass
 class SourceLocation:
     row: int
     column: int
 
-@dataclass
-class Token:
-    loc: SourceLocation
-    type:str
-    text:str
-
 class Location(SourceLocation):
     def __eq__(self, other: object) -> bool:
         if isinstance(other, SourceLocation):
@@ -21,44 +16,101 @@ class Location(SourceLocation):
 
 L = Location(row=0, column=0)
 
-def tokenize(source_code: str) -> List[Token]:
-    token_specification = [
-        ("bool_literal", r'True|true|False|false'),
-        ('identifier', r'[a-zA-Z_][a-zA_Z0-9_]*'),
-        ('int_literal', r'\b\d+\b'),
-        ('comment', r'//.*|#.*'),
-        ('operator', r'==|!=|<=|>=|\+|\*|\-|/|=|<|>|%'),
-        ('punctuation', r'[(){},;:]'),
-        ('SKIP', r'[ \t\n]+'),
-        ('NEWLINE', r'\n'),
-    ]
-
-    token_regex = '|'.join(f'(?P<{name}>{regex})'for name, regex in token_specification)
-
-    tokens=[]
-    line_num = 1       # 当前行号
-    line_start = 0   # 当前行的起始位置
-
-    for match in re.finditer(token_regex, source_code):
-        type = match.lastgroup # 当前匹配的 token 类型
-        assert type is not None, "Unexpected error: type is None."
-        text = match.group()
-        start = match.start()
 
-        if type == 'NEWLINE':
-            line_num += 1
-            line_start = match.end()
-        elif type == 'SKIP' or type == 'comment':
-            # 跳过空白和注释
-            continue
-        else:
-            # 计算列号：当前匹配起始位置相对于当前行的偏移，加1后得到列号（从1开始）
-            column = start - line_start + 1
-            loc = SourceLocation(row=line_num, column=column)
-            tokens.append(Token(loc=loc, type=type, text=text))
+class SourcePositions:
+    """Turns offsets in a source file into locations.
 
-    return tokens
+    Tokens only record their offset. Line starts are only found when a
+    location is first asked for, so tokenizing doesn't pay for locations
+    nobody reads.
+    """
+    __slots__ = ('source_code', '_line_starts')
 
+    def __init__(self, source_code: str) -> None:
+        self.source_code = source_code
+        self._line_starts: list[int] | None = None
 
+    def location(self, offset: int) -> SourceLocation:
+        if self._line_starts is None:
+            self._line_starts = [0] + [m.end() for m in re.finditer('\n', self.source_code)]
+        row = bisect_right(self._line_starts, offset)
+        return SourceLocation(row=row, column=offset - self._line_starts[row - 1] + 1)
 
 
+class Token:
+    """A token, and where to find its location once someone asks for it."""
+    __slots__ = ('type', 'text', '_loc', '_offset', '_positions')
+
+    def __init__(
+        self,
+        loc: SourceLocation | None = None,
+        type: str = '',
+        text: str = '',
+        offset: int = 0,
+        positions: SourcePositions | None = None,
+    ) -> None:
+        self.type = type
+        self.text = text
+        self._loc = loc
+        self._offset = offset
+        self._positions = positions
+
+    @property
+    def loc(self) -> SourceLocation:
+        if self._loc is None:
+            if self._positions is not None:
+                self._loc = self._positions.location(self._offset)
+            else:
+                self._loc = SourceLocation(row=0, column=0)
+        return self._loc
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Token):
+            return NotImplemented
+        return self.type == other.type and self.text == other.text and self.loc == other.loc
+
+    def __repr__(self) -> str:
+        return f'Token(loc={self.loc!r}, type={self.type!r}, text={self.text!r})'
+
+
+token_specification = [
+    ("bool_literal", r'True|true|False|false'),
+    ('identifier', r'[a-zA-Z_][a-zA_Z0-9_]*'),
+    ('int_literal', r'\b\d+\b'),
+    ('comment', r'//.*|#.*'),
+    ('operator', r'==|!=|<=|>=|\+|\*|\-|/|=|<|>|%'),
+    ('punctuation', r'[(){},;:]'),
+]
+
+# Compiled once, at import time. Whitespace is skipped by the search itself.
+# The alternatives are tried in order, so a match's token type can be told
+# from its text alone.
+token_regex = re.compile('|'.join(f'(?:{regex})' for _, regex in token_specification))
+
+_bool_literals = {'True', 'true', 'False', 'false'}
+_type_by_first_char = {
+    **{c: 'int_literal' for c in '0123456789'},
+    **{c: 'identifier' for c in 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_'},
+    **{c: 'operator' for c in '=!<>+*-/%'},
+    **{c: 'punctuation' for c in '(){},;:'},
+    '#': 'comment',
+}
+
+
+def iter_tokens(source_code: str) -> Iterator[Token]:
+    """Yields the tokens of the source code one at a time, as the regex finds them."""
+    positions = SourcePositions(source_code)
+    for match in token_regex.finditer(source_code):
+        text = match.group()
+        type = _type_by_first_char[text[0]]
+        if type == 'identifier':
+            if text in _bool_literals:
+                type = 'bool_literal'
+        elif type == 'comment' or text.startswith('//'):
+            # 跳过注释
+            continue
+        yield Token(type=type, text=text, offset=match.start(), positions=positions)
+
+
+def tokenize(source_code: str) -> List[Token]:
+    return list(iter_tokens(source_code))
@@ -0,0 +1,81 @@
+"""Opt-in traces of what the compiler's phases are doing, for debugging.
+
+Each phase has a `Tracer` writing to the `logging` logger `compiler.<phase>`.
+Nothing is traced until `enable` is called. Call sites check the tracer's
+flag before building the message, so a disabled trace costs one attribute
+lookup:
+
+    if trace.parser.debug_enabled:
+        trace.parser.debug('parsing expression starting with %r', peek().text)
+"""
+import logging
+import sys
+from typing import Iterable
+
+
+class Tracer:
+    """Traces one compiler phase at the levels 'debug' (every step) and 'info' (summaries)."""
+    __slots__ = ('phase', 'logger', 'debug_enabled', 'info_enabled')
+
+    def __init__(self, phase: str) -> None:
+        self.phase = phase
+        self.logger = logging.getLogger(f'compiler.{phase}')
+        self.debug_enabled = False
+        self.info_enabled = False
+
+    def debug(self, message: str, *args: object) -> None:
+        self.logger.debug(message, *args)
+
+    def info(self, message: str, *args: object) -> None:
+        self.logger.info(message, *args)
+
+
+parser = Tracer('parser')
+symtab = Tracer('symtab')
+type_checker = Tracer('type_checker')
+ir_generator = Tracer('ir_generator')
+optimizer = Tracer('optimizer')
+assembly_generator = Tracer('assembly_generator')
+
+tracers = {t.phase: t for t in [parser, symtab, type_checker, ir_generator, optimizer, assembly_generator]}
+
+levels = {'debug': logging.DEBUG, 'info': logging.INFO}
+
+
+def enable(phases: Iterable[str] | None = None, level: str = 'debug') -> None:
+    """Turns on traces of the given phases (default: all) at the given level and above.
+
+    Traces go to stderr unless the application has configured a handler
+    for the `compiler` logger itself.
+    """
+    if level not in levels:
+        raise ValueError(f"Unknown trace level: {level}")
+    selected = list(tracers) if phases is None else list(phases)
+    for phase in selected:
+        if phase not in tracers:
+            raise ValueError(f"Unknown compiler phase: {phase}")
+        tracer = tracers[phase]
+        tracer.logger.setLevel(levels[level])
+        tracer.debug_enabled = levels[level] <= logging.DEBUG
+        tracer.info_enabled = levels[level] <= logging.INFO
+
+    root = logging.getLogger('compiler')
+    if not root.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter('[%(name)s] %(message)s'))
+        root.addHandler(handler)
+
+
+def disable() -> None:
+    """Turns off the traces of every phase."""
+    for tracer in tracers.values():
+        tracer.logger.setLevel(logging.NOTSET)
+        tracer.debug_enabled = False
+        tracer.info_enabled = False
+
+
+def enable_from_spec(spec: str) -> None:
+    """Enables traces from a command line value like 'all', 'parser,ir_generator' or 'parser:info'."""
+    phases_part, _, level = spec.partition(':')
+    phases = None if phases_part == 'all' else phases_part.split(',')
+    enable(phases, level or 'debug')
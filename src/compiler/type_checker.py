@@ -1,9 +1,23 @@
-from compiler import ast, types
+from compiler import ast, trace, types
 from compiler.SymTab import SymTab
 from compiler.types import Type, Unit, FunctionType
 
 
 def typecheck(node: ast.Expression, symtab: SymTab) -> Type:
+    """Type-checks `node` and its subtree.
+
+    Every visited AST node gets its resolved type stored in `node.type`,
+    so `generate_ir` can reuse the result instead of type-checking again.
+    """
+    node_type = _typecheck(node, symtab)
+    if isinstance(node, ast.Expression):
+        node.type = node_type
+    if trace.type_checker.debug_enabled:
+        trace.type_checker.debug('%s: %s', type(node).__name__, node_type)
+    return node_type
+
+
+def _typecheck(node: ast.Expression, symtab: SymTab) -> Type:
     match node:
 
         case bool():
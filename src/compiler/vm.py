@@ -0,0 +1,283 @@
+"""A register-based bytecode VM for running IR without assembling it.
+
+`generate_bytecode` turns the IR into a flat list of ints. Each instruction
+takes four ints: an opcode and three operands, which are register numbers,
+constants or code offsets depending on the opcode. Every `IRvar` gets a
+register number and every jump target is resolved to a code offset, so
+`execute` needs no lookups by name.
+
+Programs behave like the compiled executables: integers are 64-bit and wrap
+around, division truncates toward zero, and dividing by zero traps like
+the `idivq` instruction does.
+"""
+import dataclasses
+import io
+import signal
+import time
+from typing import TextIO
+
+from compiler import ir
+from compiler.int64 import INT_MAX, INT_MIN, divide, division_traps, parse_int, remainder, wrap
+from compiler.sandbox import RunLimits, RunResult
+
+INSTRUCTION_SIZE = 4
+
+# Opcodes, roughly in order of how often programs execute them
+COND_JUMP = 0     # cond, then offset, else offset
+JUMP = 1          # offset
+COPY = 2          # dest, source
+LOAD_CONST = 3    # dest, value
+ADD = 4           # dest, left, right
+SUB = 5
+MUL = 6
+DIV = 7
+MOD = 8
+LT = 9
+LE = 10
+GT = 11
+GE = 12
+EQ = 13
+NE = 14
+NEG = 15          # dest, operand
+NOT = 16
+PRINT_INT = 17    # source
+PRINT_BOOL = 18
+READ_INT = 19     # dest
+
+opcode_names = [
+    'COND_JUMP', 'JUMP', 'COPY', 'LOAD_CONST', 'ADD', 'SUB', 'MUL', 'DIV', 'MOD',
+    'LT', 'LE', 'GT', 'GE', 'EQ', 'NE', 'NEG', 'NOT', 'PRINT_INT', 'PRINT_BOOL', 'READ_INT',
+]
+
+_binary_opcodes = {
+    '+': ADD, '-': SUB, '*': MUL, '/': DIV, '%': MOD,
+    '<': LT, '<=': LE, '>': GT, '>=': GE, '==': EQ, '!=': NE,
+}
+_unary_opcodes = {'unary_-': NEG, 'unary_not': NOT}
+
+# How many backward jumps to execute between checks of the time limit
+_TIME_CHECK_INTERVAL = 4096
+
+
+@dataclasses.dataclass
+class Bytecode:
+    code: list[int]
+    register_count: int
+    # Register number of each IR variable, for debugging
+    registers: dict[ir.IRvar, int]
+
+    def disassemble(self) -> str:
+        lines = []
+        for pc in range(0, len(self.code), INSTRUCTION_SIZE):
+            op, a, b, c = self.code[pc:pc + INSTRUCTION_SIZE]
+            lines.append(f'{pc:>6}: {opcode_names[op]:<10} {a} {b} {c}')
+        return '\n'.join(lines)
+
+
+class Trap(Exception):
+    """Raised where the compiled program would be killed by a signal."""
+    def __init__(self, signum: int, message: str) -> None:
+        super().__init__(message)
+        self.signum = signum
+
+
+class ProgramExit(Exception):
+    """Raised where the compiled program would exit early, like `read_int` at the end of its input."""
+    def __init__(self, exit_code: int, message: str) -> None:
+        super().__init__(message)
+        self.exit_code = exit_code
+
+
+class LimitExceeded(Exception):
+    def __init__(self, limit: str) -> None:
+        super().__init__(f'Program exceeded the {limit} limit')
+        self.limit = limit
+
+
+def generate_bytecode(instructions: list[ir.Instruction]) -> Bytecode:
+    """Translates IR instructions into bytecode."""
+    registers: dict[ir.IRvar, int] = {}
+
+    def reg(var: ir.IRvar) -> int:
+        number = registers.get(var)
+        if number is None:
+            number = registers[var] = len(registers)
+        return number
+
+    # Labels take no space, so each one's offset is that of the next real instruction
+    label_offsets: dict[str, int] = {}
+    offset = 0
+    for insn in instructions:
+        if isinstance(insn, ir.Label):
+            if insn.name in label_offsets:
+                raise ValueError(f"Duplicate label: {insn.name}")
+            label_offsets[insn.name] = offset
+        else:
+            offset += INSTRUCTION_SIZE
+
+    def target(label: ir.Label) -> int:
+        return label_offsets[label.name]
+
+    code: list[int] = []
+    for insn in instructions:
+        match insn:
+            case ir.Label():
+                continue
+            case ir.LoadIntConst():
+                code += [LOAD_CONST, reg(insn.dest), insn.value, 0]
+            case ir.LoadBoolConst():
+                code += [LOAD_CONST, reg(insn.dest), int(insn.value), 0]
+            case ir.Copy():
+                code += [COPY, reg(insn.dest), reg(insn.source), 0]
+            case ir.Jump():
+                code += [JUMP, target(insn.label), 0, 0]
+            case ir.CondJump():
+                code += [COND_JUMP, reg(insn.cond), target(insn.then_label), target(insn.else_label)]
+            case ir.Call():
+                name = insn.fun.name
+                if name in _binary_opcodes:
+                    left, right = insn.args
+                    code += [_binary_opcodes[name], reg(insn.dest), reg(left), reg(right)]
+                elif name in _unary_opcodes:
+                    (operand,) = insn.args
+                    code += [_unary_opcodes[name], reg(insn.dest), reg(operand), 0]
+                elif name == 'print_int' or name == 'print_bool':
+                    (value,) = insn.args
+                    code += [PRINT_INT if name == 'print_int' else PRINT_BOOL, reg(value), 0, 0]
+                    reg(insn.dest)
+                elif name == 'read_int':
+                    code += [READ_INT, reg(insn.dest), 0, 0]
+                else:
+                    raise ValueError(f"Unknown function: {name}")
+            case _:
+                raise ValueError(f"Unknown instruction: {insn}")
+
+    return Bytecode(code=code, register_count=len(registers), registers=registers)
+
+
+def _divide(a: int, b: int, op: int) -> int:
+    if division_traps(a, b):
+        raise Trap(signal.SIGFPE, 'Floating point exception')
+    return divide(a, b) if op == DIV else remainder(a, b)
+
+
+def execute(
+    bytecode: Bytecode,
+    stdin: TextIO,
+    stdout: TextIO,
+    limits: RunLimits | None = None,
+) -> None:
+    """Runs the bytecode until it finishes.
+
+    Raises `ProgramExit` or `Trap` where the compiled program would have
+    exited early or been killed. With `limits`, raises `LimitExceeded` once
+    the program has used `cpu_seconds` of CPU time or printed `output_bytes`.
+    CPU time is that of the current thread, so other threads of a server
+    don't count. `memory_bytes` is not enforced.
+    """
+    code = bytecode.code
+    r = [0] * bytecode.register_count
+    end = len(code)
+    pc = 0
+    write = stdout.write
+    readline = stdin.readline
+    deadline = time.thread_time() + limits.cpu_seconds if limits is not None else None
+    output_left = limits.output_bytes if limits is not None else None
+    backward_jumps = 0
+
+    while pc < end:
+        op = code[pc]
+        a = code[pc + 1]
+        if op == COND_JUMP:
+            target = code[pc + 2] if r[a] else code[pc + 3]
+            if target <= pc and deadline is not None:
+                backward_jumps += 1
+                if backward_jumps % _TIME_CHECK_INTERVAL == 0 and time.thread_time() > deadline:
+                    raise LimitExceeded('cpu_time')
+            pc = target
+            continue
+        if op == JUMP:
+            if a <= pc and deadline is not None:
+                backward_jumps += 1
+                if backward_jumps % _TIME_CHECK_INTERVAL == 0 and time.thread_time() > deadline:
+                    raise LimitExceeded('cpu_time')
+            pc = a
+            continue
+        b = code[pc + 2]
+        if op == COPY:
+            r[a] = r[b]
+        elif op == LOAD_CONST:
+            r[a] = b
+        elif op <= MOD:
+            x = r[b]
+            y = r[code[pc + 3]]
+            if op == ADD:
+                v = x + y
+            elif op == SUB:
+                v = x - y
+            elif op == MUL:
+                v = x * y
+            else:
+                v = _divide(x, y, op)
+            r[a] = v if INT_MIN <= v <= INT_MAX else wrap(v)
+        elif op <= NE:
+            x = r[b]
+            y = r[code[pc + 3]]
+            if op == LT:
+                r[a] = x < y
+            elif op == LE:
+                r[a] = x <= y
+            elif op == GT:
+                r[a] = x > y
+            elif op == GE:
+                r[a] = x >= y
+            elif op == EQ:
+                r[a] = x == y
+            else:
+                r[a] = x != y
+        elif op == NEG:
+            r[a] = wrap(-r[b])
+        elif op == NOT:
+            r[a] = not r[b]
+        elif op == PRINT_INT or op == PRINT_BOOL:
+            text = f'{r[a]}\n' if op == PRINT_INT else ('true\n' if r[a] else 'false\n')
+            if output_left is not None:
+                output_left -= len(text)
+                if output_left < 0:
+                    raise LimitExceeded('output')
+            write(text)
+        elif op == READ_INT:
+            line = readline()
+            if not line:
+                raise ProgramExit(1, 'Error: read_int() failed to read input')
+            r[a] = parse_int(line)
+        else:
+            raise ValueError(f"Unknown opcode {op} at {pc}")
+        pc += INSTRUCTION_SIZE
+
+
+def run_bytecode(bytecode: Bytecode, stdin: bytes = b'', limits: RunLimits | None = None) -> RunResult:
+    """Runs the bytecode with the given input like `sandbox.run_executable` runs an executable."""
+    if limits is None:
+        limits = RunLimits()
+    stdout = io.StringIO()
+    limit_exceeded = None
+    exit_code = 0
+    start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        execute(bytecode, io.StringIO(stdin.decode(errors='replace')), stdout, limits)
+    except ProgramExit as e:
+        exit_code = e.exit_code
+    except Trap as e:
+        exit_code = -e.signum
+    except LimitExceeded as e:
+        limit_exceeded = e.limit
+        exit_code = -signal.SIGXCPU if e.limit == 'cpu_time' else -signal.SIGXFSZ
+    return RunResult(
+        stdout=stdout.getvalue().encode(),
+        exit_code=exit_code,
+        limit_exceeded=limit_exceeded,
+        wall_seconds=time.perf_counter() - start,
+        cpu_seconds=time.thread_time() - cpu_start,
+    )
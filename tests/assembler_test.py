@@ -0,0 +1,110 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from compiler.assembler import assemble_and_get_executable, get_stdlib_object, make_private_directory
+from compiler.assembly_generator import generate_assembly
+from compiler.ir_generator import generate_ir
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+
+
+@unittest.skipIf(shutil.which('as') is None, "requires GNU as and ld")
+class MyTestCase(unittest.TestCase):
+    def test_stdlib_object_is_reused(self) -> None:
+        stdlib_obj = get_stdlib_object()
+        assert os.path.exists(stdlib_obj)
+        assert get_stdlib_object() == stdlib_obj
+        assert get_stdlib_object(link_with_c=True) != stdlib_obj
+
+    def test_stdlib_cache_directory_is_private(self) -> None:
+        assert os.stat(os.path.dirname(get_stdlib_object())).st_mode & 0o077 == 0
+        with tempfile.TemporaryDirectory() as tempdir:
+            new_dir = os.path.join(tempdir, 'new')
+            make_private_directory(new_dir)
+            assert os.stat(new_dir).st_mode & 0o777 == 0o700
+            shared_dir = os.path.join(tempdir, 'shared')
+            os.mkdir(shared_dir)
+            os.chmod(shared_dir, 0o777)
+            with self.assertRaises(Exception):
+                make_private_directory(shared_dir)
+            link = os.path.join(tempdir, 'link')
+            os.symlink(new_dir, link)
+            with self.assertRaises(Exception):
+                make_private_directory(link)
+
+    def test_timings(self) -> None:
+        assembly_code = generate_assembly(generate_ir(parse(tokenize("1 + 2"))))
+        timings: dict[str, float] = {}
+        executable = assemble_and_get_executable(assembly_code, timings=timings)
+        assert executable.startswith(b'\x7fELF')
+        assert set(timings) == {'as_stdlib', 'as_program', 'ld'}
+
+
+def run_program(
+    source_code: str,
+    stdin: str = '',
+    buffered_output: bool = False,
+    link_with_c: bool = False,
+) -> subprocess.CompletedProcess[bytes]:
+    assembly_code = generate_assembly(generate_ir(parse(tokenize(source_code))))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'program')
+        with open(path, 'wb') as f:
+            f.write(assemble_and_get_executable(
+                assembly_code, buffered_output=buffered_output, link_with_c=link_with_c))
+        os.chmod(path, 0o755)
+        return subprocess.run([path], input=stdin.encode(), capture_output=True)
+
+
+@unittest.skipIf(shutil.which('as') is None, "requires GNU as and ld")
+class TestBufferedOutput(unittest.TestCase):
+    def test_same_output_as_unbuffered(self) -> None:
+        # Prints more than the 64 KiB buffer holds
+        source_code = "var i = 0; while i < 20000 do { print_int(i - 10000); print_bool(i % 3 == 0); i = i + 1; }"
+        expected = run_program(source_code)
+        for link_with_c in [False, True]:
+            result = run_program(source_code, buffered_output=True, link_with_c=link_with_c)
+            assert result.returncode == 0
+            assert result.stdout == expected.stdout
+
+    def test_flushes_before_reading_input(self) -> None:
+        result = run_program("print_int(1); print_int(read_int() + 1)", "41\n", buffered_output=True)
+        assert result.stdout == b'1\n42\n'
+
+    def test_flushes_before_read_int_error(self) -> None:
+        result = run_program("print_bool(true); read_int()", buffered_output=True)
+        assert result.returncode == 1
+        assert result.stdout == b'true\n'
+
+
+@unittest.skipIf(shutil.which('as') is None, "requires GNU as and ld")
+class TestReadInt(unittest.TestCase):
+    read_three = "print_int(read_int()); print_int(read_int()); print_int(read_int())"
+
+    def test_skips_junk_and_handles_minus(self) -> None:
+        result = run_program(self.read_three, "12\n  -3x4\nabc5\n")
+        assert result.stdout == b'12\n-34\n5\n'
+
+    def test_last_number_without_newline(self) -> None:
+        result = run_program(self.read_three, "1\n2\n3")
+        assert result.stdout == b'1\n2\n3\n'
+
+    def test_error_at_end_of_input(self) -> None:
+        result = run_program(self.read_three, "1\n2\n")
+        assert result.returncode == 1
+        assert result.stdout == b'1\n2\n'
+        assert b'read_int' in result.stderr
+
+    def test_input_larger_than_buffer(self) -> None:
+        count = 30000
+        stdin = ''.join(f'{i * 7 - 100000}\n' for i in range(count))
+        source_code = f"var s = 0; var i = 0; while i < {count} do {{ s = s + read_int(); i = i + 1; }} print_int(s)"
+        result = run_program(source_code, stdin)
+        assert result.stdout == f'{sum(i * 7 - 100000 for i in range(count))}\n'.encode()
+
+
+if __name__ == '__main__':
+    unittest.main()
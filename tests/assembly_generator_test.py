@@ -1,6 +1,13 @@
+import os
+import shutil
+import subprocess
+import tempfile
 import unittest
 
-from compiler.assembly_generator import generate_assembly
+from compiler.assembler import assemble
+from compiler import ir
+from compiler.assembly_generator import find_fused_comparisons, generate_assembly
+from compiler.int64 import divide, remainder, wrap
 from compiler.ir_generator import generate_ir
 from compiler.parser import parse
 from compiler.tokenizer import tokenize
@@ -23,5 +30,82 @@ class MyTestCase(unittest.TestCase):
         assembly_code = generate_assembly(ir_instructions)
         print(assembly_code)
 
+def compile_and_run(source_code: str, stdin: str = '', allocate_registers: bool = True) -> str:
+    ir_instructions = generate_ir(parse(tokenize(source_code)))
+    assembly_code = generate_assembly(ir_instructions, allocate_registers=allocate_registers)
+    with tempfile.TemporaryDirectory() as workdir:
+        executable = os.path.join(workdir, 'program')
+        assemble(assembly_code, executable)
+        result = subprocess.run([executable], input=stdin.encode(), capture_output=True, check=True)
+    return result.stdout.decode()
+
+
+@unittest.skipIf(shutil.which('as') is None, "requires GNU as and ld")
+class TestRegisterAllocation(unittest.TestCase):
+    def assert_same_output(self, source_code: str, expected: str, stdin: str = '') -> None:
+        assert compile_and_run(source_code, stdin, allocate_registers=False) == expected
+        assert compile_and_run(source_code, stdin, allocate_registers=True) == expected
+
+    def test_while_loop(self) -> None:
+        self.assert_same_output(
+            "var i = 0; var s = 0; while i < 100 do { s = s + i * i; i = i + 1; } s",
+            "328350\n")
+
+    def test_values_survive_calls(self) -> None:
+        self.assert_same_output(
+            "var n = read_int(); var s = 0; var i = 0; while i < n do { s = s + read_int(); i = i + 1; } s",
+            "12\n", stdin="3\n10\n-5\n7\n")
+
+    def test_division_and_remainder(self) -> None:
+        self.assert_same_output(
+            "var x = -17; print_int(x / 5); print_int(x % 5); x / 5 * 5 + x % 5",
+            "-3\n-2\n-17\n")
+
+    def test_spilled_variables(self) -> None:
+        source_code = "".join(f"var a{i} = {i}; " for i in range(30))
+        source_code += "print_int(a0); " + " + ".join(f"a{i}" for i in range(30))
+        self.assert_same_output(source_code, "0\n435\n")
+
+
+class TestFusedComparisons(unittest.TestCase):
+    def test_finds_comparison_only_used_by_cond_jump(self) -> None:
+        instructions = generate_ir(parse(tokenize("var i = 0; while i < 10 do i = i + 1; i")))
+        (index,) = find_fused_comparisons(instructions)
+        insn = instructions[index]
+        assert isinstance(insn, ir.Call) and insn.fun.name == '<'
+        assembly_code = generate_assembly(instructions)
+        assert 'setl' not in assembly_code
+        assert 'jl .Lwhile_body2' in assembly_code
+
+    def test_keeps_comparison_used_elsewhere(self) -> None:
+        instructions = generate_ir(parse(tokenize("var b = 1 < 2; if b then print_bool(b); b")))
+        assert find_fused_comparisons(instructions) == set()
+
+    @unittest.skipIf(shutil.which('as') is None, "requires GNU as and ld")
+    def test_all_comparisons(self) -> None:
+        source_code = "var a = read_int(); var b = read_int(); " + " ".join(
+            f"if a {op} b then print_int(1) else print_int(0);" for op in ['<', '<=', '>', '>=', '==', '!=']
+        ) + " 0"
+        for stdin, expected in [('1\n2\n', '1 1 0 0 0 1'), ('2\n2\n', '0 1 0 1 1 0'), ('3\n-2\n', '0 0 1 1 0 1')]:
+            expected_output = expected.replace(' ', '\n') + '\n0\n'
+            # Without register allocation, both operands are in memory
+            for allocate_registers in [True, False]:
+                assert compile_and_run(source_code, stdin, allocate_registers) == expected_output
+
+
+@unittest.skipIf(shutil.which('as') is None, "requires GNU as and ld")
+class TestStrengthReduction(unittest.TestCase):
+    def test_powers_of_two(self) -> None:
+        source_code = (
+            "var x = read_int(); var y = 2 * x; print_int(x * 8); print_int(y); "
+            "print_int(x / 4); print_int(x % 4); print_int(x / 1024); x % 1024"
+        )
+        assembly_code = generate_assembly(generate_ir(parse(tokenize(source_code))))
+        assert 'imulq' not in assembly_code and 'idivq' not in assembly_code
+        for x in [0, 7, -7, 8, -8, 5000, -5000, -9223372036854775808]:
+            expected = [wrap(x * 8), wrap(2 * x), divide(x, 4), remainder(x, 4), divide(x, 1024), remainder(x, 1024)]
+            assert compile_and_run(source_code, f'{x}\n') == ''.join(f'{v}\n' for v in expected), x
+
+
 if __name__ == '__main__':
     unittest.main()
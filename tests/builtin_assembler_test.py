@@ -0,0 +1,161 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from compiler.assembler import assemble_and_get_executable
+from compiler.assembly_generator import generate_assembly
+from compiler.builtin_assembler import AssemblerError, assemble_executable, encode_unit
+from compiler.ir_generator import generate_ir
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+
+# Every instruction form the code generator and stdlib use, plus some variants
+encoding_corpus = """
+    movq %rax, %rbx
+    movq %r8, %r15
+    movq -8(%rbp), %rax
+    movq %rax, -16(%rbp)
+    movq -200(%rbp), %r12
+    movq %r13, -4096(%rbp)
+    movq (%rsp), %r8
+    movq 8(%rsp), %r12
+    movq (%r12), %rax
+    movq (%r13), %rax
+    movq 16(%rax,%rcx,8), %rdx
+    movq (%rsi,%r9), %r10
+    movq $0, %rax
+    movq $-1, %r11
+    movq $2147483647, -8(%rbp)
+    movq $4294967296, %rax
+    movabsq $0, %rax
+    movabsq $-9223372036854775808, %r9
+    movl $5, %eax
+    movb $10, (%rsp)
+    movb %dl, (%rsp)
+    movb %sil, 3(%rdi)
+    movb (%rsi), %al
+    movzbq (%rsi,%rcx), %rax
+    movzbq %dil, %r8
+    addq $48, %rdx
+    addq $1000, %rax
+    addq $1000, %rbx
+    addq %r8, %r10
+    addq -8(%rbp), %rax
+    subq %rsp, %rdx
+    subq $128, %rsp
+    cmpq $0, %rdi
+    cmpq $0, -24(%rbp)
+    cmpq -8(%rbp), %rdx
+    cmpq %rbx, %r12
+    cmpb $45, (%rsi)
+    xorq %r9, %r9
+    xor %rax, %rax
+    xorq $1, %r9
+    andq $-16, %rsp
+    orq %rax, %rcx
+    testq %rax, %rax
+    imulq $10, %r10
+    imulq -8(%rbp), %rax
+    imulq %rcx, %r14
+    imulq $1000, %rdx, %rax
+    idivq %rcx
+    idivq -16(%rbp)
+    negq %rdx
+    neg %r10
+    notq %rax
+    incq %r9
+    decq %rsp
+    decq -8(%rbp)
+    shlq $3, %rax
+    sarq $63, %rdx
+    shrq $1, %rcx
+    sarq %cl, %rax
+    cqto
+    sete %al
+    setne %al
+    setl %al
+    setle %r8b
+    setg %sil
+    setge %al
+    cmovlq %rcx, %rax
+    leaq 8(%rsp), %rsi
+    leaq (%rax,%rax,4), %rax
+    pushq %rbp
+    pushq %r12
+    pushq $0
+    pushq $1000
+    popq %rbp
+    popq %r15
+    ret
+    syscall
+"""
+
+
+def run_executable(executable: bytes, stdin: str = '') -> tuple[str, int]:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'program')
+        with open(path, 'wb') as f:
+            f.write(executable)
+        os.chmod(path, 0o755)
+        result = subprocess.run([path], input=stdin.encode(), capture_output=True)
+    return result.stdout.decode(), result.returncode
+
+
+class TestEncoding(unittest.TestCase):
+    def test_labels_and_jumps(self) -> None:
+        unit = encode_unit("start:\njmp end\nnop\nend:\njne start\n")
+        assert bytes(unit.text) == bytes.fromhex('e900000000' + '90' + '0f8500000000')
+        assert unit.labels['end'] == ('.text', 6)
+        assert len(unit.fixups) == 2
+
+    def test_unknown_instruction(self) -> None:
+        with self.assertRaises(AssemblerError):
+            encode_unit("frobq %rax")
+
+    def test_undefined_symbol(self) -> None:
+        with self.assertRaises(AssemblerError):
+            assemble_executable(".global main\nmain:\ncall nowhere\nret\n")
+
+    @unittest.skipIf(shutil.which('as') is None or shutil.which('objcopy') is None, "requires GNU as and objcopy")
+    def test_same_bytes_as_gnu_as(self) -> None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(f'{tmpdir}/a.s', 'w') as f:
+                f.write(encoding_corpus)
+            subprocess.run(['as', '-o', f'{tmpdir}/a.o', f'{tmpdir}/a.s'], check=True)
+            subprocess.run(['objcopy', '-O', 'binary', '-j', '.text', f'{tmpdir}/a.o', f'{tmpdir}/a.bin'], check=True)
+            with open(f'{tmpdir}/a.bin', 'rb') as f:
+                expected = f.read()
+        for line in encoding_corpus.strip().split('\n'):
+            encoded = bytes(encode_unit(line).text)
+            assert expected[:len(encoded)] == encoded, line
+            expected = expected[len(encoded):]
+        assert expected == b''
+
+
+@unittest.skipIf(shutil.which('as') is None, "requires GNU as and ld")
+class TestAgainstGnuBackend(unittest.TestCase):
+    programs = [
+        ("var i = 0; var s = 0; while i < 100 do { s = s + i * i; i = i + 1; } s", ""),
+        ("var i = 0; while i < 5 do { print_int(i - 2); print_bool(i % 2 == 0); i = i + 1; }", ""),
+        ("var n = read_int(); var s = 0; var i = 0; while i < n do { s = s + read_int(); i = i + 1; } s", "3\n10\n-5\n7\n"),
+        ("var a = 3; var b = 5; if a < b and not (b == 4) or false then a * 100 + b else -1", ""),
+        ("var x = -17; print_int(x / 5); print_int(x % 5); print_int(1000000000000 * 3); x", ""),
+    ]
+
+    def test_same_behavior(self) -> None:
+        for source_code, stdin in self.programs:
+            assembly_code = generate_assembly(generate_ir(parse(tokenize(source_code))))
+            for buffered_output in [False, True]:
+                gnu = assemble_and_get_executable(assembly_code, buffered_output=buffered_output)
+                builtin = assemble_and_get_executable(assembly_code, backend='builtin', buffered_output=buffered_output)
+                assert run_executable(builtin, stdin) == run_executable(gnu, stdin), source_code
+
+    def test_cannot_link_with_c(self) -> None:
+        with self.assertRaises(Exception):
+            assemble_and_get_executable("", link_with_c=True, backend='builtin')
+
+
+if __name__ == '__main__':
+    unittest.main()
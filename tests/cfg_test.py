@@ -0,0 +1,90 @@
+import shutil
+import unittest
+
+from compiler import ir
+from compiler.__main__ import call_bytecode_compiler, call_compiler
+from compiler.cfg import build_cfg
+from compiler.ir import IRvar
+from compiler.ir_generator import generate_ir
+from compiler.parser import parse
+from compiler.sandbox import run_executable
+from compiler.tokenizer import tokenize
+from compiler.vm import run_bytecode
+
+
+def ir_of(source_code: str) -> list[ir.Instruction]:
+    return generate_ir(parse(tokenize(source_code)))
+
+
+class TestCfg(unittest.TestCase):
+    def test_blocks_and_edges(self) -> None:
+        # 0: entry, 1: while_start, 2: while_body, 3: while_end
+        cfg = build_cfg(ir_of("var i = 0; while i < 10 do i = i + 1; i"))
+        assert len(cfg.blocks) == 4
+        assert [cfg.label(b) for b in range(4)] == [
+            None, ir.Label('while_start1'), ir.Label('while_body2'), ir.Label('while_end3')]
+        assert cfg.succs == [[1], [2, 3], [1], []]
+        assert cfg.preds == [[], [0, 2], [1], [1]]
+        assert cfg.reverse_postorder() == [0, 1, 3, 2] or cfg.reverse_postorder() == [0, 1, 2, 3]
+        assert cfg.dominators() == [0, 0, 1, 1]
+
+    def test_if_else_dominators(self) -> None:
+        # 0: entry, 1: then, 2: else, 3: if_end
+        cfg = build_cfg(ir_of("var x = 1; if x < 2 then print_int(1) else print_int(2); x"))
+        assert cfg.succs == [[1, 2], [3], [3], []]
+        assert cfg.dominators() == [0, 0, 0, 0]
+        order = cfg.reverse_postorder()
+        assert order[0] == 0 and order[-1] == 3
+
+    def test_unreachable_block(self) -> None:
+        x = IRvar('x')
+        end = ir.Label('end')
+        cfg = build_cfg([
+            ir.LoadIntConst(1, x),
+            ir.Jump(end),
+            ir.LoadIntConst(2, x),
+            end,
+            ir.Call(IRvar('print_int'), [x], IRvar('unit')),
+        ])
+        assert cfg.succs == [[2], [2], []]
+        assert cfg.preds == [[], [], [0, 1]]
+        assert cfg.reverse_postorder() == [0, 2]
+        assert cfg.dominators() == [0, -1, 0]
+        # Dropping the unreachable block leaves a jump to the next block, which is removed
+        assert cfg.linearize([0, 2]) == [ir.LoadIntConst(1, x), end, ir.Call(IRvar('print_int'), [x], IRvar('unit'))]
+
+    def test_linearize_round_trip(self) -> None:
+        instructions = ir_of("var i = 0; while i < 10 do { if i % 2 == 0 then print_int(i); i = i + 1 }; i")
+        # Only the jump to the label right after it goes away
+        without_jumps_to_next = [
+            insn for insn, next_insn in zip(instructions, instructions[1:] + [None])
+            if not (isinstance(insn, ir.Jump) and insn.label == next_insn)
+        ]
+        assert len(without_jumps_to_next) == len(instructions) - 1
+        assert build_cfg(instructions).linearize() == without_jumps_to_next
+
+    def test_linearize_adds_jumps_for_moved_fallthrough(self) -> None:
+        x = IRvar('x')
+        cfg = build_cfg([ir.LoadIntConst(1, x), ir.Label('a'), ir.Call(IRvar('print_int'), [x], IRvar('unit'))])
+        assert cfg.linearize([1, 0]) == [
+            ir.Label('a'), ir.Call(IRvar('print_int'), [x], IRvar('unit')),
+            ir.LoadIntConst(1, x), ir.Jump(ir.Label('a')),
+        ]
+
+    def test_large_program(self) -> None:
+        source_code = "var x = 0; " + "if x < 1 then x = x + 1 else x = x - 1; " * 3000 + "x"
+        cfg = build_cfg(ir_of(source_code))
+        assert len(cfg.reverse_postorder()) == len(cfg.blocks)
+        idom = cfg.dominators()
+        assert all(d != -1 for d in idom)
+
+    def test_nested_and_or(self) -> None:
+        source_code = "var a = 1; var b = 2; var c = (a < b or b < a) and (a == 1 or b == 1); print_bool(c); a < b and not (a == b or b == 3)"
+        result = run_bytecode(call_bytecode_compiler(source_code))
+        assert result.stdout == b'true\ntrue\n'
+        if shutil.which('as') is not None:
+            assert run_executable(call_compiler(source_code, 'test')).stdout == b'true\ntrue\n'
+
+
+if __name__ == '__main__':
+    unittest.main()
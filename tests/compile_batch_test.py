@@ -0,0 +1,86 @@
+import contextlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+
+from compiler.__main__ import BatchItem, batch_items, compile_batch
+
+
+class TestCompileBatch(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tempdir.name)
+        (self.root / 'progs' / 'sub').mkdir(parents=True)
+        (self.root / 'progs' / 'a.src').write_text('1 + 2')
+        (self.root / 'progs' / 'sub' / 'b.src').write_text('var x = 5; x * x')
+        (self.root / 'bad.src').write_text('1 +')
+        (self.root / 'manifest.jsonl').write_text(
+            json.dumps({"name": "c", "code": "print_int(7)"}) + '\n'
+            + json.dumps({"file": "progs/a.src", "output": "again"}) + '\n')
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_batch_items(self) -> None:
+        out = str(self.root / 'out')
+        items = batch_items([str(self.root / 'progs'), str(self.root / 'bad.src'), str(self.root / 'manifest.jsonl')], out)
+        assert items == [
+            BatchItem('a.src', f'{out}/a', source_file=str(self.root / 'progs' / 'a.src')),
+            BatchItem('sub/b.src', f'{out}/sub/b', source_file=str(self.root / 'progs' / 'sub' / 'b.src')),
+            BatchItem('bad.src', f'{out}/bad', source_file=str(self.root / 'bad.src')),
+            BatchItem('c', f'{out}/c', source_code='print_int(7)'),
+            BatchItem('progs/a.src', f'{out}/again', source_file=str(self.root / 'progs' / 'a.src')),
+        ]
+
+    def test_hidden_files_and_backups_are_skipped(self) -> None:
+        (self.root / 'progs' / '.DS_Store').write_text('junk')
+        (self.root / 'progs' / 'a.src~').write_text('1 +')
+        (self.root / 'progs' / '.git').mkdir()
+        (self.root / 'progs' / '.git' / 'HEAD').write_text('junk')
+        items = batch_items([str(self.root / 'progs')], str(self.root / 'out'))
+        assert [item.name for item in items] == ['a.src', 'sub/b.src']
+
+    @unittest.skipIf(shutil.which('as') is None, "requires GNU as and ld")
+    def test_same_output_path_is_an_error(self) -> None:
+        (self.root / 'progs' / 'a.txt').write_text('print_int(1)')
+        (self.root / 'other').mkdir()
+        (self.root / 'other' / 'b.src').write_text('2')
+        out = self.root / 'out'
+        report = io.StringIO()
+        with contextlib.redirect_stdout(report):
+            failures = compile_batch(
+                [str(self.root / 'progs'), str(self.root / 'progs' / 'sub' / 'b.src'), str(self.root / 'other' / 'b.src')],
+                str(out), workers=1)
+        lines = report.getvalue().splitlines()
+        assert failures == 4
+        assert f"ERROR a.src: output {out}/a is also the output of a.txt" in lines
+        assert f"ERROR a.txt: output {out}/a is also the output of a.src" in lines
+        assert sum(line.startswith('ERROR b.src: ') for line in lines) == 2
+        assert [line for line in lines if line.startswith('OK')] == [line for line in lines if 'sub/b.src' in line]
+        assert not os.path.exists(out / 'a')
+
+    @unittest.skipIf(shutil.which('as') is None, "requires GNU as and ld")
+    def test_compile_batch(self) -> None:
+        out = self.root / 'out'
+        report = io.StringIO()
+        with contextlib.redirect_stdout(report):
+            failures = compile_batch(
+                [str(self.root / 'progs'), str(self.root / 'bad.src'), str(self.root / 'manifest.jsonl')],
+                str(out), workers=2)
+        assert failures == 1
+        lines = report.getvalue().splitlines()
+        assert sum(line.startswith('OK') for line in lines) == 4
+        assert [line for line in lines if line.startswith('ERROR')][0].startswith('ERROR bad.src: ')
+        assert lines[-1].startswith('Compiled 4 of 5 programs')
+        assert not os.path.exists(out / 'bad')
+        assert subprocess.run([out / 'sub' / 'b'], capture_output=True).stdout == b'25\n'
+        assert subprocess.run([out / 'c'], capture_output=True).stdout == b'7\n'
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+
+from compiler.compile_cache import CompileCache
+
+
+class MyTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.cache = CompileCache(self.tempdir.name, max_bytes=1000)
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_hit_and_miss(self) -> None:
+        key = self.cache.key("1 + 2")
+        assert self.cache.get(key) is None
+        self.cache.put(key, b'executable')
+        assert self.cache.get(key) == b'executable'
+        assert (self.cache.hits, self.cache.misses) == (1, 1)
+        assert self.cache.stats()['total'] == {'hits': 1, 'misses': 1}
+
+    def test_key_depends_on_source_and_flags(self) -> None:
+        assert self.cache.key("1 + 2") == self.cache.key("1 + 2")
+        assert self.cache.key("1 + 2") != self.cache.key("1 + 3")
+        assert self.cache.key("1 + 2") != self.cache.key("1 + 2", flags='-O')
+
+    def test_least_recently_used_entry_is_evicted(self) -> None:
+        keys = [self.cache.key(str(i)) for i in range(3)]
+        for i, key in enumerate(keys[:2]):
+            self.cache.put(key, b'x' * 400)
+            os.utime(self.cache.directory / f'{key}.bin', (i, i))
+        # Reading the oldest entry makes it the most recently used one
+        assert self.cache.get(keys[0]) is not None
+        self.cache.put(keys[2], b'x' * 400)
+        assert self.cache.get(keys[1]) is None
+        assert self.cache.get(keys[0]) is not None
+        assert self.cache.get(keys[2]) is not None
+
+    def test_empty_entry_is_a_miss(self) -> None:
+        key = self.cache.key("1 + 2")
+        (self.cache.directory / f'{key}.bin').write_bytes(b'')
+        assert self.cache.get(key) is None
+        assert self.cache.misses == 1
+
+    def test_lookup_does_not_recreate_evicted_entry(self) -> None:
+        key = self.cache.key("1 + 2")
+        assert self.cache.get(key) is None
+        assert not (self.cache.directory / f'{key}.bin').exists()
+
+    def test_stats_are_written_in_batches(self) -> None:
+        self.cache.stats_batch_seconds = 3600
+        self.cache.stats_batch_size = 3
+        other = CompileCache(self.tempdir.name)
+        self.cache.get('a')
+        self.cache.get('b')
+        assert other.stats()['total'] == {}
+        self.cache.get('c')
+        assert other.stats()['total'] == {'misses': 3}
+        self.cache.get('d')
+        self.cache.flush_stats()
+        assert other.stats()['total'] == {'misses': 4}
+
+    def test_stores_assembly_when_asked(self) -> None:
+        cache = CompileCache(self.tempdir.name, store_assembly=True)
+        key = cache.key("1 + 2")
+        cache.put(key, b'executable', 'movq $1, %rax')
+        assert cache.get_assembly(key) == 'movq $1, %rax'
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+
+from compiler import ir
+from compiler.cfg import build_cfg
+from compiler.dataflow import Definition, bits, liveness, reaching_definitions, solve
+from compiler.ir import IRvar
+
+
+class TestDataflow(unittest.TestCase):
+    def test_bits(self) -> None:
+        assert list(bits(0)) == []
+        assert list(bits(0b101001)) == [0, 3, 5]
+        assert list(bits(1 << 200)) == [200]
+
+    def test_liveness_in_loop(self) -> None:
+        i, one, t, c = IRvar('i'), IRvar('one'), IRvar('t'), IRvar('c')
+        # 0: entry, 1: loop, 2: end
+        cfg = build_cfg([
+            ir.LoadIntConst(0, i),
+            ir.LoadBoolConst(True, c),
+            ir.Label('loop'),
+            ir.LoadIntConst(1, one),
+            ir.Call(IRvar('+'), [i, one], t),
+            ir.Copy(t, i),
+            ir.CondJump(c, ir.Label('loop'), ir.Label('end')),
+            ir.Label('end'),
+            ir.Call(IRvar('print_int'), [i], IRvar('r')),
+        ])
+        live = liveness(cfg)
+        assert set(live.variables) == {i, c}
+        assert live.variables_in(live.live_in[0]) == set()
+        assert live.variables_in(live.live_out[0]) == {i, c}
+        # `i` and `c` are carried around the back edge, `one` and `t` are not
+        assert live.variables_in(live.live_in[1]) == {i, c}
+        assert live.variables_in(live.live_out[1]) == {i, c}
+        assert live.variables_in(live.live_in[2]) == {i}
+        assert live.variables_in(live.live_out[2]) == set()
+
+    def test_reaching_definitions(self) -> None:
+        x, c = IRvar('x'), IRvar('c')
+        # 0: entry, 1: then, 2: end
+        cfg = build_cfg([
+            ir.LoadIntConst(1, x),
+            ir.LoadBoolConst(True, c),
+            ir.CondJump(c, ir.Label('then'), ir.Label('end')),
+            ir.Label('then'),
+            ir.LoadIntConst(2, x),
+            ir.LoadIntConst(3, x),
+            ir.Label('end'),
+            ir.Call(IRvar('print_int'), [x], IRvar('r')),
+        ])
+        reaching = reaching_definitions(cfg)
+        # `c` and `r` are only used in the block that assigns them, so they aren't tracked
+        x1, x2, x3 = Definition(x, 0, 0), Definition(x, 1, 1), Definition(x, 1, 2)
+        assert reaching.definitions == [x1, x2, x3]
+        assert reaching.definitions_in(reaching.reach_out[0]) == [x1]
+        # Only the last assignment in `then` survives it
+        assert reaching.definitions_in(reaching.reach_out[1]) == [x3]
+        assert reaching.definitions_in(reaching.reach_in[2]) == [x1, x3]
+
+    def test_intersection(self) -> None:
+        # Available-expressions style: only what every path provides
+        # 0 -> 1 -> 3, 0 -> 2 -> 3
+        cfg = build_cfg([
+            ir.CondJump(IRvar('c'), ir.Label('a'), ir.Label('b')),
+            ir.Label('a'),
+            ir.Jump(ir.Label('end')),
+            ir.Label('b'),
+            ir.Jump(ir.Label('end')),
+            ir.Label('end'),
+        ])
+        gen = [0b001, 0b010, 0b110, 0]
+        result = solve(cfg, gen=gen, kill=[0] * 4, forward=True, intersect=True, universe=0b111)
+        assert result.block_in[3] == 0b011
+
+    def test_loop_free_code_visits_each_block_once(self) -> None:
+        instructions: list[ir.Instruction] = []
+        c = IRvar('c')
+        for n in range(100):
+            instructions += [
+                ir.CondJump(c, ir.Label(f'then{n}'), ir.Label(f'end{n}')),
+                ir.Label(f'then{n}'),
+                ir.LoadIntConst(n, IRvar(f'x{n}')),
+                ir.Label(f'end{n}'),
+            ]
+        cfg = build_cfg(instructions)
+        result = solve(cfg, gen=[1] * len(cfg.blocks), kill=[0] * len(cfg.blocks), forward=True)
+        assert result.steps == len(cfg.blocks)
+
+    def test_unreachable_blocks_are_analyzed(self) -> None:
+        x = IRvar('x')
+        cfg = build_cfg([
+            ir.Jump(ir.Label('end')),
+            ir.Label('dead'),
+            ir.Call(IRvar('print_int'), [x], IRvar('r')),
+            ir.Label('end'),
+        ])
+        live = liveness(cfg)
+        assert live.variables_in(live.live_in[1]) == {x}
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,19 @@
+import contextlib
+import io
 import unittest
+import unittest.mock
 from compiler.tokenizer import tokenize, Token
 from compiler.parser import parse
 from compiler.tokenizer import Token, tokenize
 import compiler.ast as ast
-from compiler.interpreter import interpret
+from compiler.interpreter import Value, compile_closure, interpret
 from compiler.SymTab import SymTab, add_builtin_symbols
+from compiler.__main__ import call_bytecode_compiler
+from compiler.vm import Trap, run_bytecode
+
+def run_compiled(node: ast.Expression, symtab: SymTab) -> Value:
+    return compile_closure(node, symtab)()
+
 
 class MyTestCase(unittest.TestCase):
     def setUp(self) -> None:
@@ -23,5 +32,95 @@ class MyTestCase(unittest.TestCase):
         assert interpret(parse(tokenize("if 2 < 1 then 3 else 4")),self.symtab) == 4
         assert interpret(parse(tokenize("10 + if 2 < 1 then 3 else 4")),self.symtab) == 14
 
+    def test_compile_closure(self) -> None:
+        for code in ["1 + 2", "( 1 + 2 ) * 3", "10 + if 2 < 1 then 3 else 4", "-(3 - 10) % 4",
+                     "true and false or not false", "if 1 < 2 and 2 < 3 then 1 + 1 else 0"]:
+            node = parse(tokenize(code))
+            assert compile_closure(node, self.symtab)() == interpret(node, self.symtab), code
+
+    def test_compile_closure_reruns(self) -> None:
+        closure = compile_closure(parse(tokenize("2 * 3 + 1")), self.symtab)
+        assert [closure(), closure()] == [7, 7]
+        assert compile_closure(parse(tokenize("if false then 1")), self.symtab)() is None
+
+    def run_both(self, code: str, stdin: str = '') -> tuple[object, str]:
+        """Runs the program with both evaluators and returns the result and output of `interpret`."""
+        outputs = []
+        for evaluate in [interpret, run_compiled]:
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out), unittest.mock.patch('sys.stdin', io.StringIO(stdin)):
+                result = evaluate(parse(tokenize(code)), SymTab(parent=None))
+            outputs.append((result, out.getvalue()))
+        assert outputs[0] == outputs[1], code
+        return outputs[0]
+
+    def test_variables_and_blocks(self) -> None:
+        assert self.run_both("var x = 5; x * x") == (25, '')
+        assert self.run_both("var x = 1; { var x = 2; x = x + 10; print_int(x) }; x") == (1, '12\n')
+        assert self.run_both("var a = 3; var b = { var c = a * 2; c + 1 }; print_bool(b == 7); b") == (7, 'true\n')
+        assert self.run_both("{ var a = 1; a } + { var b = 2; b }") == (3, '')
+
+    def test_while(self) -> None:
+        code = "var s = 0; var i = 0; while i < 10 do { s = s + i; i = i + 1 }; s"
+        assert self.run_both(code) == (45, '')
+        code = "var i = 0; while i < 5 do { i = i + 1; if i % 2 == 0 then print_int(i) }; i"
+        assert self.run_both(code) == (5, '2\n4\n')
+
+    def test_break_and_continue(self) -> None:
+        i = ast.Identifier('i')
+        body = ast.Block([
+            ast.Assignment(i, ast.BinaryOp(i, '+', ast.Literal(1))),
+            ast.IfExpression(ast.BinaryOp(i, '>', ast.Literal(5)), ast.Break(), None),
+            ast.IfExpression(ast.BinaryOp(i, '<', ast.Literal(3)), ast.Continue(), None),
+            ast.FunctionCall(ast.Identifier('print_int'), [i]),
+        ])
+        program = ast.Block([
+            ast.VariableDeclaration(ast.Identifier('i'), ast.Literal(0)),
+            ast.WhileExpr(ast.Literal(True), body),
+        ], ast.Identifier('i'))
+        for evaluate in [interpret, run_compiled]:
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                assert evaluate(program, self.symtab) == 6
+            assert out.getvalue() == '3\n4\n5\n'
+
+    def test_read_int(self) -> None:
+        assert self.run_both("var x = read_int(); var y = read_int(); x + y", "3\n4\n") == (7, '')
+        with self.assertRaises(EOFError):
+            self.run_both("read_int()")
+
+    def test_int64_arithmetic(self) -> None:
+        assert self.run_both("var m = 0 - 2; print_int(0 - 7 / 2); print_int((0 - 7) % 2); print_int(7 % m)") == (
+            None, '-3\n-1\n1\n')
+        assert self.run_both("9223372036854775807 + 1") == (-9223372036854775808, '')
+        assert self.run_both("var x = 4294967296; x * x * 3 + 1") == (1, '')
+        assert self.run_both("var x = 0 - 9223372036854775807 - 1; -x") == (-9223372036854775808, '')
+
+    def test_division_traps(self) -> None:
+        for code in ["1 / 0", "1 % 0", "var x = 0 - 9223372036854775807 - 1; x / (0 - 1)"]:
+            for evaluate in [interpret, run_compiled]:
+                with self.assertRaises(Trap):
+                    evaluate(parse(tokenize(code)), SymTab(parent=None))
+
+    def test_read_int_skips_junk(self) -> None:
+        assert self.run_both("read_int() + read_int()", "x-12y\n5\n") == (-7, '')
+        assert self.run_both("read_int()", "99999999999999999999\n") == (7766279631452241919, '')
+        assert self.run_both("read_int()", "\u00b2\n") == (0, '')
 
+    def test_same_output_as_vm(self) -> None:
+        programs = [
+            ("print_int(0 - 7 / 2); print_int((0 - 7) % 2); var m = 0 - 2; print_int(7 % m); print_int(-m)", ''),
+            ("print_int(9223372036854775807 + 1); var x = 4294967296; print_int(x * x * 3 + 1)", ''),
+            ("var n = read_int(); var s = 0; var i = 0; while i < n do { s = s + i * i * i; i = i + 1 }; print_int(s)",
+             '100000\n'),
+            ("print_int(read_int() - read_int()); print_bool(3 == 4 or 5 != 6)", 'a-9223372036854775808\n1\n'),
+        ]
+        for code, stdin in programs:
+            expected = run_bytecode(call_bytecode_compiler(code), stdin.encode())
+            assert expected.exit_code == 0
+            for evaluate in [interpret, run_compiled]:
+                out = io.StringIO()
+                with contextlib.redirect_stdout(out), unittest.mock.patch('sys.stdin', io.StringIO(stdin)):
+                    evaluate(parse(tokenize(code)), SymTab(parent=None))
+                assert out.getvalue().encode() == expected.stdout, (evaluate, code)
 
@@ -6,6 +6,8 @@ from compiler.ir import Call, LoadIntConst, IRvar, Label, Jump, Copy, CondJump,
 from compiler.ir_generator import generate_ir
 from compiler.parser import parse
 from compiler.tokenizer import tokenize
+from compiler.type_checker import typecheck
+from compiler.SymTab import SymTab
 
 
 class MyTestCase(unittest.TestCase):
@@ -45,6 +47,13 @@ class MyTestCase(unittest.TestCase):
             Copy(source=IRvar('x1'), dest=IRvar('x2'))  # x2 代表变量 x
         ]
 
+    def test_generate_ir_from_typechecked_tree(self) -> None:
+        source_code = "var x = 3; if x < 4 then x else 5"
+        ast_root = parse(tokenize(source_code))
+        typecheck(ast_root, SymTab(parent=None))
+        typechecked_ir = generate_ir(ast_root, typechecked=True)
+        assert typechecked_ir == generate_ir(parse(tokenize(source_code)))
+
     def test_single_integer_literal(self) -> None:
         source_code = "123;"
         ast_root = parse(tokenize(source_code))
@@ -224,15 +233,15 @@ class MyTestCase(unittest.TestCase):
         ir_instructions = generate_ir(ast_root)
         assert ir_instructions == [
             LoadBoolConst(value=True, dest=IRvar('x1')),
-            CondJump(cond=IRvar('x1'), then_label=Label('or_skip'), else_label=Label('or_right')),
-            Label('or_right'),
+            CondJump(cond=IRvar('x1'), then_label=Label('or_skip1'), else_label=Label('or_right2')),
+            Label('or_right2'),
             LoadBoolConst(value=False, dest=IRvar('x3')),
             Copy(source=IRvar('x3'), dest=IRvar('x2')),
-            Jump(label=Label('or_end')),
-            Label('or_skip'),
+            Jump(label=Label('or_end3')),
+            Label('or_skip1'),
             LoadBoolConst(value=True, dest=IRvar('x2')),
-            Jump(label=Label('or_end')),
-            Label('or_end'),
+            Jump(label=Label('or_end3')),
+            Label('or_end3'),
             Call(fun=IRvar('print_bool'), args=[IRvar('x2')], dest=IRvar('x4'))
         ]
 
@@ -0,0 +1,219 @@
+import shutil
+import unittest
+
+from compiler import ir
+from compiler.__main__ import call_bytecode_compiler, call_compiler
+from compiler.ir import IRvar
+from compiler.ir_generator import generate_ir
+from compiler.optimizer import (
+    coalesce_copies, eliminate_dead_code, fold_constants, propagate_copies, simplify_algebra,
+)
+from compiler.parser import parse
+from compiler.sandbox import run_executable
+from compiler.tokenizer import tokenize
+from compiler.vm import run_bytecode
+
+# Programs whose output must not change when optimized, with their input
+PROGRAMS = [
+    ("1 + 2 * 3", b''),
+    ("var x = 10; var y = x * 2; if y > 5 then print_int(y) else print_int(0); y", b''),
+    ("var i = 0; var s = 0; while i < 10 do { s = s + i * 3 % 7; i = i + 1 }; s", b''),
+    ("var n = read_int(); var k = 4 / 2; n * k + (0 - 7) / 2 + (0 - 7) % 2", b'5\n'),
+    ("9223372036854775807 + 1", b''),
+    ("var x = 0 - 9223372036854775807 - 1; print_int(x); x * (0 - 1)", b''),
+    ("var b = 1 < 2; if not b then 1 else 2", b''),
+    ("print_int(1); 1 / 0", b''),
+    ("var x = 0 - 9223372036854775807 - 1; x % (0 - 1)", b''),
+    ("var a = true; var b = 3; if a or b < 2 then print_int(b); { b }", b''),
+    ("var i = 0; while i < 5 do { var t = i * 7; read_int(); i = i + 1 }; i", b'1\n2\n3\n4\n5\n'),
+    ("var x = read_int(); var y = 10 / x; 1", b'0\n'),
+    ("var a = 1; var b = 2; var i = 0; while i < 3 do { var t = a; a = b; b = t; i = i + 1 }; print_int(a); b", b''),
+    ("var a = read_int(); var b = a; var c = b > 3 and a < 10; if c then b else a + 1", b'5\n'),
+    ("var x = read_int(); var y = x; x = x + 1; print_int(y); x", b'7\n'),
+    ("var x = read_int(); var y = -x; x = 5; print_int(-y); not not (x == x)", b'-3\n'),
+    ("var x = read_int(); print_int(x * 8 + x / 4 + x % 16); print_int(0 * x + x * 1 - 0); x % 1", b'-13\n'),
+]
+
+
+def ir_of(source_code: str) -> list[ir.Instruction]:
+    return generate_ir(parse(tokenize(source_code)))
+
+
+class TestFoldConstants(unittest.TestCase):
+    def test_folds_constant_expression(self) -> None:
+        instructions = fold_constants(ir_of("1 + 2 * 3"))
+        assert not any(isinstance(insn, ir.Call) and insn.fun.name in '+*' for insn in instructions)
+        assert ir.LoadIntConst(7, IRvar('x5')) in instructions
+
+    def test_wraps_and_truncates(self) -> None:
+        assert ir.LoadIntConst(-2**63, IRvar('x3')) in fold_constants(ir_of("9223372036854775807 + 1"))
+        assert ir.LoadIntConst(-3, IRvar('x5')) in fold_constants(ir_of("(0 - 7) / 2"))
+        assert ir.LoadIntConst(-1, IRvar('x5')) in fold_constants(ir_of("(0 - 7) % 2"))
+
+    def test_keeps_trapping_division(self) -> None:
+        instructions = fold_constants(ir_of("1 / 0"))
+        assert any(isinstance(insn, ir.Call) and insn.fun.name == '/' for insn in instructions)
+
+    def test_constant_condition_becomes_jump(self) -> None:
+        instructions = fold_constants(ir_of("if 1 < 2 then print_int(1)"))
+        assert not any(isinstance(insn, ir.CondJump) for insn in instructions)
+        assert ir.Jump(ir.Label('then1')) in instructions
+
+    def test_no_propagation_across_labels(self) -> None:
+        # `i` is reassigned in the loop, so it isn't constant at the loop condition
+        instructions = fold_constants(ir_of("var i = 0; while i < 10 do i = i + 1; i"))
+        assert any(isinstance(insn, ir.CondJump) for insn in instructions)
+        assert any(isinstance(insn, ir.Call) and insn.fun.name == '+' for insn in instructions)
+
+    def test_same_output_in_vm(self) -> None:
+        for source_code, stdin in PROGRAMS:
+            expected = run_bytecode(call_bytecode_compiler(source_code), stdin)
+            optimized = run_bytecode(call_bytecode_compiler(source_code, optimize=True), stdin)
+            assert (optimized.stdout, optimized.exit_code) == (expected.stdout, expected.exit_code), source_code
+
+    @unittest.skipIf(shutil.which('as') is None, "requires GNU as and ld")
+    def test_same_output_when_compiled(self) -> None:
+        for source_code, stdin in PROGRAMS:
+            expected = run_executable(call_compiler(source_code, 'test'), stdin)
+            optimized = run_executable(call_compiler(source_code, 'test', optimize=True), stdin)
+            assert (optimized.stdout, optimized.exit_code) == (expected.stdout, expected.exit_code), source_code
+
+
+class TestEliminateDeadCode(unittest.TestCase):
+    def test_removes_unused_results(self) -> None:
+        instructions = eliminate_dead_code(ir_of("var x = 1 + 2; var y = x * 0; 5"))
+        assert instructions == [
+            ir.LoadIntConst(5, IRvar('x8')),
+            ir.Call(IRvar('print_int'), [IRvar('x8')], IRvar('x9')),
+        ]
+
+    def test_keeps_side_effects(self) -> None:
+        instructions = eliminate_dead_code(ir_of("var x = read_int(); var y = x / 0; var z = x % 2; true"))
+        names = [insn.fun.name for insn in instructions if isinstance(insn, ir.Call)]
+        assert names == ['read_int', '/', '%', 'print_bool']
+
+    def test_removes_dead_code_in_loop(self) -> None:
+        instructions = eliminate_dead_code(ir_of("var i = 0; while i < 10 do { var t = i * 7; i = i + 1 }; i"))
+        assert not any(isinstance(insn, ir.Call) and insn.fun.name == '*' for insn in instructions)
+        # `i` is still needed by the loop condition
+        assert any(isinstance(insn, ir.Call) and insn.fun.name == '+' for insn in instructions)
+
+    def test_removes_unreachable_blocks(self) -> None:
+        x = IRvar('x')
+        instructions = eliminate_dead_code([
+            ir.LoadIntConst(1, x),
+            ir.Jump(ir.Label('end')),
+            ir.Jump(ir.Label('end')),
+            ir.Label('dead'),
+            ir.Call(IRvar('print_int'), [x], IRvar('r1')),
+            ir.Label('end'),
+            ir.Call(IRvar('print_int'), [x], IRvar('r2')),
+        ])
+        assert instructions == [
+            ir.LoadIntConst(1, x),
+            ir.Label('end'),
+            ir.Call(IRvar('print_int'), [x], IRvar('r2')),
+        ]
+
+
+class TestCopies(unittest.TestCase):
+    def test_propagates_chain_of_copies(self) -> None:
+        a, b, c = IRvar('a'), IRvar('b'), IRvar('c')
+        instructions = propagate_copies([
+            ir.Call(IRvar('read_int'), [], a),
+            ir.Copy(a, b),
+            ir.Copy(b, c),
+            ir.Call(IRvar('print_int'), [c], IRvar('r')),
+        ])
+        assert instructions[-1] == ir.Call(IRvar('print_int'), [a], IRvar('r'))
+
+    def test_stops_at_reassignment(self) -> None:
+        # `y` keeps the value read into `x1` after `x` is reassigned
+        instructions = propagate_copies(ir_of("var x = read_int(); var y = x; x = x + 1; print_int(y); x"))
+        prints = [insn for insn in instructions if isinstance(insn, ir.Call) and insn.fun.name == 'print_int']
+        assert prints[0].args == [IRvar('x1')]
+        assert prints[1].args == [IRvar('x5')]
+
+    def test_needs_copy_on_every_path(self) -> None:
+        x, y, c = IRvar('x'), IRvar('y'), IRvar('c')
+        instructions = [
+            ir.Call(IRvar('read_int'), [], x),
+            ir.Call(IRvar('read_int'), [], y),
+            ir.Call(IRvar('read_int'), [], c),
+            ir.CondJump(c, ir.Label('then'), ir.Label('end')),
+            ir.Label('then'),
+            ir.Copy(x, y),
+            ir.Label('end'),
+            ir.Call(IRvar('print_int'), [y], IRvar('r')),
+        ]
+        assert propagate_copies(instructions) == instructions
+
+    def test_coalesces_loop_variable(self) -> None:
+        instructions = optimize_copies("var i = 0; while i < 10 do i = i + 1; i")
+        assert not any(isinstance(insn, ir.Copy) for insn in instructions)
+        assert any(isinstance(insn, ir.Call) and insn.args[0] == insn.dest for insn in instructions)
+
+    def test_keeps_interfering_copy(self) -> None:
+        # Swapping needs `t`, `a` and `b` to hold different values at once
+        instructions = optimize_copies(
+            "var a = read_int(); var b = read_int(); while a > 0 do { var t = a; a = b; b = t - 1; }; b")
+        copies = [insn for insn in instructions if isinstance(insn, ir.Copy)]
+        assert len(copies) == 2
+
+
+class TestSimplifyAlgebra(unittest.TestCase):
+    def test_identities(self) -> None:
+        x, zero, one = IRvar('x'), IRvar('zero'), IRvar('one')
+        instructions = simplify_algebra([
+            ir.Call(IRvar('read_int'), [], x),
+            ir.LoadIntConst(0, zero),
+            ir.LoadIntConst(1, one),
+            ir.Call(IRvar('+'), [x, zero], IRvar('a')),
+            ir.Call(IRvar('+'), [zero, x], IRvar('b')),
+            ir.Call(IRvar('-'), [x, zero], IRvar('c')),
+            ir.Call(IRvar('*'), [one, x], IRvar('d')),
+            ir.Call(IRvar('/'), [x, one], IRvar('e')),
+            ir.Call(IRvar('*'), [x, zero], IRvar('f')),
+            ir.Call(IRvar('%'), [x, one], IRvar('g')),
+            ir.Call(IRvar('-'), [zero, x], IRvar('h')),
+            ir.Call(IRvar('/'), [one, x], IRvar('i')),
+        ])
+        assert instructions[3:] == [
+            ir.Copy(x, IRvar('a')),
+            ir.Copy(x, IRvar('b')),
+            ir.Copy(x, IRvar('c')),
+            ir.Copy(x, IRvar('d')),
+            ir.Copy(x, IRvar('e')),
+            ir.LoadIntConst(0, IRvar('f')),
+            ir.LoadIntConst(0, IRvar('g')),
+            ir.Call(IRvar('-'), [zero, x], IRvar('h')),
+            ir.Call(IRvar('/'), [one, x], IRvar('i')),
+        ]
+
+    def test_self_comparison(self) -> None:
+        x = IRvar('x')
+        instructions = simplify_algebra([
+            ir.Call(IRvar('<='), [x, x], IRvar('a')),
+            ir.Call(IRvar('!='), [x, x], IRvar('b')),
+        ])
+        assert instructions == [ir.LoadBoolConst(True, IRvar('a')), ir.LoadBoolConst(False, IRvar('b'))]
+
+    def test_double_negation(self) -> None:
+        x, y, z = IRvar('x'), IRvar('y'), IRvar('z')
+        negate_twice: list[ir.Instruction] = [
+            ir.Call(IRvar('unary_-'), [x], y),
+            ir.Call(IRvar('unary_-'), [y], z),
+        ]
+        assert simplify_algebra(negate_twice)[1] == ir.Copy(x, z)
+        # Not if `x` changes in between, or the operators differ
+        assert simplify_algebra([negate_twice[0], ir.LoadIntConst(1, x), negate_twice[1]])[2] == negate_twice[1]
+        mixed = [negate_twice[0], ir.Call(IRvar('unary_not'), [y], z)]
+        assert simplify_algebra(mixed) == mixed
+
+
+def optimize_copies(source_code: str) -> list[ir.Instruction]:
+    return coalesce_copies(eliminate_dead_code(propagate_copies(ir_of(source_code))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,6 @@
 import unittest
 from compiler.parser import parse
-from compiler.tokenizer import Token, tokenize
+from compiler.tokenizer import Token, iter_tokens, tokenize
 import compiler.ast as ast
 
 
@@ -151,6 +151,15 @@ class MyTestCase(unittest.TestCase):
                 value=ast.Identifier(name='c')
             )
         )
+
+    def test_parse_token_stream(self) -> None:
+        source_code = "var x = 1; while x < 10 do { x = x + f(x, 2) }; x"
+        assert parse(iter_tokens(source_code)) == parse(tokenize(source_code))
+
+    def test_unexpected_token_location(self) -> None:
+        with self.assertRaisesRegex(Exception, 'row=2, column=3'):
+            parse(iter_tokens("(1)\n  )"))
+
     #def test_parse_integer_literal(self) -> None:
     #    tokens = tokenize("123;")  # 对输入进行词法分析，生成 token 列表
     #    print(tokens)  # 打印 token 方便调试
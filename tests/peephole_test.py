@@ -0,0 +1,84 @@
+import collections
+import unittest
+
+from compiler.__main__ import call_compiler
+from compiler.assembly_generator import generate_assembly
+from compiler.ir_generator import generate_ir
+from compiler.parser import parse
+from compiler.peephole import (
+    AsmComment, AsmInstruction, AsmLabel, all_rules, format_assembly, optimize_assembly, parse_assembly, peephole,
+)
+from compiler.sandbox import run_executable
+from compiler.tokenizer import tokenize
+
+
+def optimized(assembly_code: str) -> tuple[str, dict[str, int]]:
+    hits: collections.Counter[str] = collections.Counter()
+    result = optimize_assembly(assembly_code.strip(), hits)
+    return result, dict(hits)
+
+
+class TestPeephole(unittest.TestCase):
+    def test_parse_and_format_round_trip(self) -> None:
+        assembly_code = generate_assembly(generate_ir(parse(tokenize("var x = 1; while x < 10 do x = x + 1; x"))))
+        lines = parse_assembly(assembly_code)
+        assert AsmInstruction('movq', ('%rsp', '%rbp')) in lines
+        assert AsmLabel('.Lwhile_start1') in lines
+        assert format_assembly(lines) == '\n'.join(line.strip() for line in assembly_code.split('\n'))
+        assert parse_assembly('movq $1, 8(%rbp, %rax)') == [AsmInstruction('movq', ('$1', '8(%rbp, %rax)'))]
+
+    def test_jump_to_next_label(self) -> None:
+        assert optimized("jmp .L1\n.L1:") == (".L1:", {'jump_to_next_label': 1})
+        assert optimized("jl .L1\n.L1:") == (".L1:", {'jump_to_next_label': 1})
+        assert optimized("jmp .L2\n.L1:")[1] == {}
+
+    def test_invert_branch(self) -> None:
+        code, hits = optimized("cmpq $0, %rcx\njne .Lthen\njmp .Lelse\n.Lthen:")
+        assert code == "cmpq $0, %rcx\nje .Lelse\n.Lthen:"
+        assert hits == {'invert_branch': 1}
+
+    def test_unreachable_after_jump(self) -> None:
+        code, hits = optimized("jmp .L1\nmovq %rax, %rcx\njmp .L2\n.L3:\nret")
+        assert code == "jmp .L1\n.L3:\nret"
+        assert hits == {'unreachable_after_jump': 2}
+
+    def test_store_and_reload(self) -> None:
+        assert optimized("movq %rax, -8(%rbp)\nmovq -8(%rbp), %rax") == (
+            "movq %rax, -8(%rbp)", {'reload_after_store': 1})
+        assert optimized("movq %rax, -8(%rbp)\nmovq -8(%rbp), %rcx") == (
+            "movq %rax, -8(%rbp)\nmovq %rax, %rcx", {'forward_store': 1})
+        assert optimized("movq %rax, -8(%rbp)\nmovq -16(%rbp), %rcx")[1] == {}
+
+    def test_shorten_movabsq(self) -> None:
+        assert optimized("movabsq $5, %rcx") == ("movq $5, %rcx", {'shorten_movabsq': 1})
+        assert optimized("movabsq $-2147483648, %rcx")[1] == {'shorten_movabsq': 1}
+        assert optimized("movabsq $2147483648, %rcx")[1] == {}
+
+    def test_rules_apply_to_their_results(self) -> None:
+        # Removing the unreachable `movq` makes the `jmp` jump to the next label
+        code, hits = optimized("jmp .L1\nmovq %rax, %rcx\n.L1:\nret")
+        assert code == ".L1:\nret"
+        assert hits == {'unreachable_after_jump': 1, 'jump_to_next_label': 1}
+
+    def test_comments_stay_with_kept_lines(self) -> None:
+        code, _ = optimized("# a\njne .L1\n# b\njmp .L2\n# c\n.L1:\n# d")
+        assert code == "# a\n# b\nje .L2\n# c\n.L1:\n# d"
+
+    def test_custom_rule_table(self) -> None:
+        rules = {name: rule for name, rule in all_rules.items() if name != 'jump_to_next_label'}
+        lines = parse_assembly("jmp .L1\n.L1:")
+        assert peephole(lines, rules) == lines
+        hits: collections.Counter[str] = collections.Counter()
+        assert peephole(lines, hits=hits) == [AsmLabel('.L1')]
+        assert hits['jump_to_next_label'] == 1
+        assert AsmComment('# x') in parse_assembly('# x')
+
+    def test_same_output_with_builtin_assembler(self) -> None:
+        source_code = "var i = 0; var s = 0; while i < 10 do { if i % 3 == 0 and i > 2 then s = s + i else s = s - 1; i = i + 1 }; s"
+        expected = run_executable(call_compiler(source_code, 'test', assembler='builtin'))
+        result = run_executable(call_compiler(source_code, 'test', assembler='builtin', optimize=True))
+        assert (result.stdout, result.exit_code) == (expected.stdout, expected.exit_code)
+
+
+if __name__ == '__main__':
+    unittest.main()
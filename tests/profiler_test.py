@@ -0,0 +1,50 @@
+import json
+import shutil
+import unittest
+
+from compiler.__main__ import call_compiler
+from compiler.parser import parse
+from compiler.profiler import Profile, count_ast_nodes
+from compiler.tokenizer import tokenize
+
+
+class TestProfiler(unittest.TestCase):
+    def test_phase_records(self) -> None:
+        profile = Profile()
+        with profile.phase('first') as record:
+            record['things'] = len([object() for _ in range(1000)])
+        with profile.phase('second'):
+            pass
+        result = json.loads(json.dumps(profile.to_json()))
+        first, second = result['phases']
+        assert first['name'] == 'first'
+        assert first['things'] == 1000
+        assert first['peak_memory_bytes'] > 1000 * 16
+        assert first['wall_seconds'] >= 0 and first['cpu_seconds'] >= 0
+        assert second['name'] == 'second'
+        assert result['total']['peak_memory_bytes'] == first['peak_memory_bytes']
+
+    def test_without_memory_tracking(self) -> None:
+        profile = Profile(track_memory=False)
+        with profile.phase('only'):
+            pass
+        assert 'peak_memory_bytes' not in profile.to_json()['phases'][0]
+
+    def test_count_ast_nodes(self) -> None:
+        # Block, VariableDeclaration, Identifier, Literal, BinaryOp, Identifier, Literal
+        assert count_ast_nodes(parse(tokenize("{ var x = 1; x + 2 }"))) == 7
+
+    @unittest.skipIf(shutil.which('as') is None, "requires GNU as and ld")
+    def test_call_compiler(self) -> None:
+        profile = Profile()
+        call_compiler("var x = 1; while x < 10 do x = x + 1; x", "(test)", profile=profile)
+        phases = {p['name']: p for p in profile.to_json()['phases']}
+        assert list(phases) == ['tokenize', 'parse', 'typecheck', 'generate_ir', 'generate_assembly', 'assemble']
+        assert phases['tokenize']['tokens'] == 17
+        assert phases['parse']['ast_nodes'] > 0
+        assert phases['generate_ir']['ir_instructions'] > 0
+        assert phases['generate_assembly']['asm_lines'] > 0
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+from compiler.ir import Call, LoadIntConst, IRvar, Label, Jump, Copy, CondJump
+from compiler.ir_generator import generate_ir
+from compiler.parser import parse
+from compiler.register_allocator import (
+    allocate_registers, compute_live_intervals, callee_saved_registers,
+)
+from compiler.tokenizer import tokenize
+
+
+class MyTestCase(unittest.TestCase):
+    def test_live_interval_spans_loop(self) -> None:
+        instructions = [
+            LoadIntConst(value=0, dest=IRvar('i')),
+            Label('start'),
+            LoadIntConst(value=1, dest=IRvar('one')),
+            Call(fun=IRvar('+'), args=[IRvar('i'), IRvar('one')], dest=IRvar('t')),
+            Copy(source=IRvar('t'), dest=IRvar('i')),
+            CondJump(cond=IRvar('c'), then_label=Label('start'), else_label=Label('end')),
+            Label('end'),
+        ]
+        intervals = {interval.var.name: interval for interval in compute_live_intervals(instructions)}
+        # `i` is read again at the top of the loop, so it stays live until the back edge
+        assert (intervals['i'].start, intervals['i'].end) == (0, 5)
+        assert (intervals['t'].start, intervals['t'].end) == (3, 4)
+
+    def test_value_live_across_call_gets_callee_saved_register(self) -> None:
+        instructions = [
+            LoadIntConst(value=1, dest=IRvar('a')),
+            Call(fun=IRvar('print_int'), args=[IRvar('a')], dest=IRvar('r1')),
+            Call(fun=IRvar('print_int'), args=[IRvar('a')], dest=IRvar('r2')),
+        ]
+        registers = allocate_registers(instructions)
+        assert registers[IRvar('a')] in callee_saved_registers
+
+    def test_overlapping_intervals_get_different_registers(self) -> None:
+        # All 30 variables are live until the final sum
+        source_code = "".join(f"var a{i} = {i}; " for i in range(30))
+        source_code += " + ".join(f"a{i}" for i in range(30))
+        instructions = generate_ir(parse(tokenize(source_code)))
+        registers = allocate_registers(instructions)
+        intervals = compute_live_intervals(instructions)
+        assert len(registers) < len(intervals), "expected some variables to be spilled"
+        for a in intervals:
+            for b in intervals:
+                if a is b or a.var not in registers or b.var not in registers:
+                    continue
+                if a.start <= b.end and b.start <= a.end:
+                    assert registers[a.var] != registers[b.var]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+
+from compiler import ast
+from compiler.parser import parse
+from compiler.resolver import new_frames, resolve
+from compiler.tokenizer import tokenize
+
+
+def identifiers(node: ast.Expression) -> list[ast.Identifier]:
+    """Returns the identifiers of the tree in source order."""
+    found: list[ast.Identifier] = []
+    def visit(item: object) -> None:
+        if isinstance(item, ast.Identifier):
+            found.append(item)
+        elif isinstance(item, ast.Expression):
+            for value in vars(item).values():
+                visit(value)
+        elif isinstance(item, list):
+            for value in item:
+                visit(value)
+    visit(node)
+    return found
+
+
+class TestResolver(unittest.TestCase):
+    def test_slots(self) -> None:
+        root = parse(tokenize("var x = 1; var y = x; { var x = y; x + y }; x"))
+        frame_sizes = resolve(root)
+        assert frame_sizes == [0, 2, 1]
+        slots = [(i.name, i.slot) for i in identifiers(root)]
+        assert slots == [
+            ('x', (1, 0)),
+            ('y', (1, 1)), ('x', (1, 0)),
+            ('x', (2, 0)), ('y', (1, 1)), ('x', (2, 0)), ('y', (1, 1)),
+            ('x', (1, 0)),
+        ]
+
+    def test_initializer_sees_outer_variable(self) -> None:
+        root = parse(tokenize("var x = 1; { var x = x + 1; x }"))
+        resolve(root)
+        assert [i.slot for i in identifiers(root)] == [(1, 0), (2, 0), (1, 0), (2, 0)]
+
+    def test_undeclared_names(self) -> None:
+        root = parse(tokenize("print_int(1)"))
+        assert resolve(root) == [0]
+        assert [i.slot for i in identifiers(root)] == [None]
+
+    def test_sibling_blocks_share_a_frame(self) -> None:
+        root = parse(tokenize("{ var a = 1; a } + { var b = 2; b * b }"))
+        frame_sizes = resolve(root)
+        assert frame_sizes == [0, 1]
+        assert [i.slot for i in identifiers(root)] == [(1, 0)] * 5
+        assert new_frames(frame_sizes) == [[], [None]]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import shutil
+import unittest
+
+from compiler.__main__ import call_compiler, handle_request
+from compiler.sandbox import RunLimits, run_executable
+
+
+class TestRunLimits(unittest.TestCase):
+    def test_restricted(self) -> None:
+        limits = RunLimits(cpu_seconds=5.0, output_bytes=1000)
+        assert limits.restricted({"cpu_seconds": 1, "output_bytes": 5000}) == RunLimits(cpu_seconds=1.0, output_bytes=1000)
+        with self.assertRaises(ValueError):
+            limits.restricted({"stack_bytes": 1})
+        with self.assertRaises(ValueError):
+            limits.restricted({"cpu_seconds": -1})
+
+
+@unittest.skipIf(shutil.which('as') is None, "requires GNU as and ld")
+class TestRunExecutable(unittest.TestCase):
+    def test_stdin_and_exit_code(self) -> None:
+        executable = call_compiler("print_int(read_int() * 2)", "test")
+        result = run_executable(executable, b'21\n')
+        assert result.stdout == b'42\n'
+        assert result.exit_code == 0
+        assert result.limit_exceeded is None
+        # read_int exits with status 1 at the end of the input
+        assert run_executable(executable, b'').exit_code == 1
+
+    def test_output_limit(self) -> None:
+        executable = call_compiler("while true do { print_int(1) }", "test")
+        result = run_executable(executable, limits=RunLimits(output_bytes=100))
+        assert result.limit_exceeded == 'output'
+        assert result.exit_code < 0
+        assert len(result.stdout) == 100
+
+    def test_cpu_limit(self) -> None:
+        executable = call_compiler("var i = 0; while true do { i = i + 1 }", "test")
+        result = run_executable(executable, limits=RunLimits(cpu_seconds=1))
+        assert result.limit_exceeded == 'cpu_time'
+        # The CPU time in rusage may be short of the limit when SIGXCPU arrives, more so on a loaded machine
+        assert result.cpu_seconds > 0.5
+
+    def test_run_request(self) -> None:
+        result = handle_request({"command": "run", "code": "print_int(read_int() + 1)", "input": "41\n"})
+        assert result["stdout"] == "42\n"
+        assert result["exit_code"] == 0
+        assert set(result["timing"]) == {"compile_seconds", "wall_seconds", "cpu_seconds"}
+        result = handle_request({"command": "run", "code": "1", "limits": {"memory_bytes": "lots"}})
+        assert "error" in result
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,205 @@
+import asyncio
+import json
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import unittest
+from base64 import b64decode
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any
+
+from compiler.__main__ import NdjsonServer, PoolServer
+
+
+def send_request(port: int, request: dict[str, Any]) -> dict[str, Any]:
+    with socket.create_connection(('127.0.0.1', port)) as sock:
+        sock.sendall(json.dumps(request).encode())
+        sock.shutdown(socket.SHUT_WR)
+        response = b''
+        while chunk := sock.recv(65536):
+            response += chunk
+    result: dict[str, Any] = json.loads(response)
+    return result
+
+
+@unittest.skipIf(shutil.which('as') is None, "requires GNU as and ld")
+class TestPoolServer(unittest.TestCase):
+    def setUp(self) -> None:
+        options = {'cache': None, 'assembler': 'gnu', 'buffered_output': False}
+        self.server = PoolServer(('127.0.0.1', 0), workers=2, queue_size=0, worker_options=options)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+
+    def test_compile_and_ping(self) -> None:
+        assert send_request(self.port, {"command": "ping"}) == {}
+        result = send_request(self.port, {"command": "compile", "code": "1 + 2"})
+        assert b64decode(result["program"]).startswith(b'\x7fELF')
+        result = send_request(self.port, {"command": "compile", "code": "1 +"})
+        assert "error" in result
+
+    def test_concurrent_requests(self) -> None:
+        results: list[dict[str, Any]] = []
+        def compile() -> None:
+            results.append(send_request(self.port, {"command": "compile", "code": "var x = 3; x * x"}))
+        threads = [threading.Thread(target=compile) for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert all("program" in r for r in results)
+
+    def test_busy_when_saturated(self) -> None:
+        for _ in range(2):
+            self.server.slots.acquire()
+        try:
+            result = send_request(self.port, {"command": "compile", "code": "1"})
+            assert result.get("busy") is True
+            assert send_request(self.port, {"command": "ping"}) == {}
+        finally:
+            for _ in range(2):
+                self.server.slots.release()
+        assert "program" in send_request(self.port, {"command": "compile", "code": "1"})
+
+    def test_pool_is_replaced_when_a_worker_dies(self) -> None:
+        pool = self.server.pool
+        for pid in list(pool._processes):
+            os.kill(pid, signal.SIGKILL)
+        assert send_request(self.port, {"command": "compile", "code": "1"}) == {"error": "Worker process died"}
+        assert self.server.pool is not pool
+        assert "program" in send_request(self.port, {"command": "compile", "code": "1"})
+
+
+@unittest.skipIf(shutil.which('as') is None, "requires GNU as and ld")
+class TestGracefulShutdown(unittest.TestCase):
+    def test_sigterm_finishes_accepted_requests(self) -> None:
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        env = {**os.environ, 'PYTHONPATH': str(Path(__file__).parent.parent / 'src')}
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'compiler', 'serve', f'--port={port}', '--workers=1'],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            for _ in range(100):
+                try:
+                    send_request(port, {"command": "ping"})
+                    break
+                except ConnectionRefusedError:
+                    time.sleep(0.1)
+            with socket.create_connection(('127.0.0.1', port)) as sock:
+                # The request is accepted, but not complete, when the server is told to stop
+                sock.sendall(json.dumps({"command": "compile", "code": "1 + 2"}).encode())
+                time.sleep(0.2)
+                server.send_signal(signal.SIGTERM)
+                time.sleep(0.2)
+                sock.shutdown(socket.SHUT_WR)
+                response = b''
+                while chunk := sock.recv(65536):
+                    response += chunk
+            assert "program" in json.loads(response)
+            assert server.wait(timeout=30) == 0
+        finally:
+            server.kill()
+            server.wait()
+
+
+@unittest.skipIf(shutil.which('as') is None, "requires GNU as and ld")
+class TestNdjsonServer(unittest.TestCase):
+    def setUp(self) -> None:
+        self.executor = ThreadPoolExecutor(4)
+        started = threading.Event()
+        self.port = 0
+
+        async def serve() -> None:
+            self.loop = asyncio.get_running_loop()
+            self.stop = asyncio.Event()
+
+            def on_started(port: int) -> None:
+                self.port = port
+                started.set()
+            self.server = NdjsonServer(self.executor)
+            await self.server.serve('127.0.0.1', 0, self.stop, on_started)
+
+        self.thread = threading.Thread(target=asyncio.run, args=(serve(),))
+        self.thread.start()
+        started.wait()
+
+    def tearDown(self) -> None:
+        try:
+            self.loop.call_soon_threadsafe(self.stop.set)
+        except RuntimeError:
+            pass  # The test stopped the server itself and its loop is already closed
+        self.thread.join()
+        self.executor.shutdown()
+
+    def test_pipelined_requests_on_one_connection(self) -> None:
+        requests = [
+            {"command": "compile", "code": "var x = 1; while x < 1000 do x = x + 1; x", "id": 1},
+            {"command": "ping", "id": 2},
+            {"command": "compile", "code": "1 +", "id": 3},
+            {"command": "compile", "code": "true"},
+        ]
+        with socket.create_connection(('127.0.0.1', self.port)) as sock:
+            sock.sendall(b''.join(json.dumps(r).encode() + b'\n' for r in requests) + b'not json\n')
+            f = sock.makefile('rb')
+            responses = [json.loads(f.readline()) for _ in range(5)]
+            # The connection stays open for more requests
+            sock.sendall(b'{"command": "ping", "id": "again"}\n')
+            assert json.loads(f.readline()) == {"id": "again"}
+        assert "program" in responses[0] and responses[0]["id"] == 1
+        assert responses[1] == {"id": 2}
+        assert "error" in responses[2] and responses[2]["id"] == 3
+        assert "program" in responses[3] and "id" not in responses[3]
+        assert "Invalid JSON" in responses[4]["error"]
+
+    def test_request_that_is_not_an_object(self) -> None:
+        with socket.create_connection(('127.0.0.1', self.port)) as sock:
+            sock.sendall(b'{"command": "ping", "id": 1}\n[1, 2]\n"ping"\n{"command": "ping", "id": 3}\n')
+            f = sock.makefile('rb')
+            responses = [json.loads(f.readline()) for _ in range(4)]
+        assert responses[0] == {"id": 1}
+        assert "must be a JSON object" in responses[1]["error"]
+        assert "must be a JSON object" in responses[2]["error"]
+        assert responses[3] == {"id": 3}
+
+    def test_broken_pool_is_replaced(self) -> None:
+        class BrokenExecutor(ThreadPoolExecutor):
+            def submit(self, *args: Any, **kwargs: Any) -> Any:
+                raise BrokenProcessPool("A worker died")
+
+        broken = BrokenExecutor(1)
+        self.server.executor = broken
+        self.server.replace_executor = lambda: self.executor
+        with socket.create_connection(('127.0.0.1', self.port)) as sock:
+            sock.sendall(b'{"command": "compile", "code": "1", "id": 1}\n')
+            f = sock.makefile('rb')
+            assert json.loads(f.readline()) == {"error": "Worker process died", "id": 1}
+            sock.sendall(b'{"command": "compile", "code": "1", "id": 2}\n')
+            assert "program" in json.loads(f.readline())
+        assert self.server.executor is self.executor
+
+    def test_stop_answers_requests_already_sent(self) -> None:
+        with socket.create_connection(('127.0.0.1', self.port)) as sock:
+            sock.sendall(b'{"command": "compile", "code": "1 + 2"}\n')
+            time.sleep(0.1)
+            self.loop.call_soon_threadsafe(self.stop.set)
+            f = sock.makefile('rb')
+            assert "program" in json.loads(f.readline())
+            assert f.readline() == b''
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,5 @@
 import unittest
-from compiler.tokenizer import tokenize, Token, L
+from compiler.tokenizer import iter_tokens, tokenize, Token, L, SourceLocation
 
 class test_tokenizer(unittest.TestCase):
     def test_1token(self) -> None:
@@ -53,4 +53,20 @@ class test_tokenizer(unittest.TestCase):
             Token(loc=L, type='int_literal', text='1'),
         ]
 
-    
+    def test_locations(self) -> None:
+        tokens = tokenize("a = 1;\n// comment\n  if b\n\tthen")
+        assert [t.loc for t in tokens] == [
+            SourceLocation(row=1, column=1),
+            SourceLocation(row=1, column=3),
+            SourceLocation(row=1, column=5),
+            SourceLocation(row=1, column=6),
+            SourceLocation(row=3, column=3),
+            SourceLocation(row=3, column=6),
+            SourceLocation(row=4, column=2),
+        ]
+
+    def test_iter_tokens(self) -> None:
+        source_code = "var x = 1; # comment\nif x >= 10 then print_int(x) else true"
+        tokens = iter_tokens(source_code)
+        assert next(tokens) == Token(loc=SourceLocation(row=1, column=1), type='identifier', text='var')
+        assert list(tokens) == tokenize(source_code)[1:]
@@ -0,0 +1,48 @@
+import contextlib
+import io
+import unittest
+
+from compiler import trace
+from compiler.assembly_generator import generate_assembly
+from compiler.ir_generator import generate_ir
+from compiler.parser import parse
+from compiler.tokenizer import tokenize
+
+source_code = "var x = 1; while x < 10 do { x = x + 1 }; print_bool(x == 10); x"
+
+
+def compile_to_assembly() -> str:
+    return generate_assembly(generate_ir(parse(tokenize(source_code))))
+
+
+class TestTrace(unittest.TestCase):
+    def tearDown(self) -> None:
+        trace.disable()
+
+    def test_compiling_prints_nothing(self) -> None:
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout), self.assertNoLogs('compiler'):
+            compile_to_assembly()
+        assert stdout.getvalue() == ''
+
+    def test_enabled_phases_are_traced(self) -> None:
+        trace.enable(['ir_generator', 'symtab'])
+        with self.assertLogs('compiler', level='DEBUG') as logs:
+            compile_to_assembly()
+        names = {record.name for record in logs.records}
+        assert names == {'compiler.ir_generator', 'compiler.symtab'}
+
+    def test_info_level(self) -> None:
+        trace.enable_from_spec('all:info')
+        with self.assertLogs('compiler', level='DEBUG') as logs:
+            compile_to_assembly()
+        assert all(record.levelname == 'INFO' for record in logs.records)
+        assert any('instructions' in record.getMessage() for record in logs.records)
+
+    def test_unknown_phase(self) -> None:
+        with self.assertRaises(ValueError):
+            trace.enable_from_spec('lexer')
+
+
+if __name__ == '__main__':
+    unittest.main()
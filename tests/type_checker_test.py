@@ -145,4 +145,21 @@ class TestBlockTypeCheck(unittest.TestCase):
         self.assertIsInstance(result_type, Bool)
 
 
+class TestTypeAnnotations(unittest.TestCase):
+    def setUp(self) -> None:
+        self.symtab = SymTab(parent=None)
+        add_builtin_symbols(self.symtab)
+
+    def test_typecheck_annotates_nodes(self) -> None:
+        node = parse(tokenize("1 + 2 < 3"))
+        typecheck(node, self.symtab)
+        assert isinstance(node, ast.BinaryOp)
+        self.assertIsInstance(node.type, Bool)
+        assert isinstance(node.left, ast.BinaryOp)
+        self.assertIsInstance(node.left.type, Int)
+        self.assertIsInstance(node.left.left.type, Int)
+
+    def test_shadowed_variable_type(self) -> None:
+        node = parse(tokenize("{ var x = 1; { var x = true; x }; x }"))
+        self.assertIsInstance(typecheck(node, self.symtab), Int)
 
@@ -0,0 +1,82 @@
+import io
+import shutil
+import signal
+import unittest
+
+from compiler.__main__ import call_bytecode_compiler, call_compiler, handle_request
+from compiler import ir
+from compiler.ir import IRvar
+from compiler.sandbox import RunLimits, run_executable
+from compiler.vm import ProgramExit, Trap, execute, generate_bytecode, run_bytecode
+
+PROGRAMS = [
+    ("var n = read_int(); var s = 0; var i = 0; while i < n do { s = s + i; i = i + 1 }; s", b'100\n'),
+    ("print_int(0 - 7 / 2); print_int((0 - 7) % 2); var m = 0 - 2; print_int(7 % m); -(0 - 5)", b''),
+    ("var b = not (2 <= 1); print_bool(1 < 2); print_bool(b); print_bool(3 == 4 or 5 != 6); 3 > 2", b''),
+    ("9223372036854775807 + 1", b''),
+    ("var x = 4294967296; x * x * 3 + 1", b''),
+    ("read_int() + read_int()", b'x-12y\n5'),
+    ("read_int() + read_int()", '²\n١٢3\n'.encode()),
+    ("var x = 3; if x >= 3 and x < 10 then print_int(x) else print_int(0); x", b''),
+    ("1 / 0", b''),
+    ("read_int()", b''),
+]
+
+
+class TestVm(unittest.TestCase):
+    def run_program(self, source_code: str, stdin: bytes = b'') -> tuple[bytes, int]:
+        result = run_bytecode(call_bytecode_compiler(source_code), stdin)
+        return result.stdout, result.exit_code
+
+    def test_arithmetic_wraps_and_truncates(self) -> None:
+        assert self.run_program("9223372036854775807 + 1") == (b'-9223372036854775808\n', 0)
+        assert self.run_program("print_int(0 - 7 / 2); (0 - 7) % 2") == (b'-3\n-1\n', 0)
+
+    def test_traps(self) -> None:
+        assert self.run_program("print_int(1); 1 / 0") == (b'1\n', -signal.SIGFPE)
+        assert self.run_program("var x = 0 - 9223372036854775807 - 1; x / (0 - 1)") == (b'', -signal.SIGFPE)
+
+    def test_read_int(self) -> None:
+        assert self.run_program("read_int() * 2", b'21\n') == (b'42\n', 0)
+        # Only ASCII digits count, like in the stdlib
+        assert self.run_program("read_int()", '²\n'.encode()) == (b'0\n', 0)
+        assert self.run_program("read_int()", '١٢3\n'.encode()) == (b'3\n', 0)
+        with self.assertRaises(ProgramExit):
+            execute(call_bytecode_compiler("read_int()"), io.StringIO(''), io.StringIO())
+
+    def test_labels_resolve_to_offsets(self) -> None:
+        x = IRvar('x')
+        end = ir.Label('end')
+        bytecode = generate_bytecode([
+            ir.LoadBoolConst(True, x),
+            ir.CondJump(x, end, end),
+            ir.Call(IRvar('print_bool'), [x], IRvar('unit')),
+            end,
+        ])
+        assert bytecode.code[4:8] == [0, 0, 12, 12]
+        with self.assertRaises(ValueError):
+            generate_bytecode([end, end])
+
+    def test_limits(self) -> None:
+        bytecode = call_bytecode_compiler("while true do print_int(1)")
+        result = run_bytecode(bytecode, limits=RunLimits(output_bytes=100))
+        assert result.limit_exceeded == 'output'
+        assert result.stdout == b'1\n' * 50
+        bytecode = call_bytecode_compiler("var i = 0; while true do i = i + 1")
+        assert run_bytecode(bytecode, limits=RunLimits(cpu_seconds=0.1)).limit_exceeded == 'cpu_time'
+
+    def test_run_vm_request(self) -> None:
+        result = handle_request({"command": "run_vm", "code": "print_int(read_int() + 1)", "input": "41\n"})
+        assert result["stdout"] == "42\n"
+        assert result["exit_code"] == 0
+        assert "compile_seconds" in result["timing"]
+
+    @unittest.skipIf(shutil.which('as') is None, "requires GNU as and ld")
+    def test_same_as_native(self) -> None:
+        for source_code, stdin in PROGRAMS:
+            native = run_executable(call_compiler(source_code, 'test'), stdin)
+            assert self.run_program(source_code, stdin) == (native.stdout, native.exit_code), source_code
+
+
+if __name__ == '__main__':
+    unittest.main()